@@ -0,0 +1,138 @@
+import threading as th
+import time
+
+import global_variables as gv
+import metrics
+
+INTERNAL = "internal"
+FORWARDED = "forwarded"
+CLIENT = "client"
+
+# requests that only servers send
+INTERNAL_REQUESTS = {
+    "serve_update_cache",
+    "serve_lww_update",
+    "serve_decide_transaction",
+    "serve_transaction_decision",
+    "serve_ping",
+    "serve_grant_lease",
+    "serve_replica_lagging",
+    "serve_export_range",
+    "serve_import_range",
+    "serve_import_status",
+    "serve_update_routing",
+    "serve_shm_connect",
+}
+
+# requests that free resources other requests wait for, whoever sends them
+RELEASE_REQUESTS = {
+    "disconnect",
+    "serve_release_lock",
+    "serve_release_locks",
+    "serve_renew_lease",
+}
+
+
+def lane(message: dict, from_server: bool) -> str:
+    """
+    from_server: the message comes from the host of a server. Clients can set
+    "internal" in their messages, it only counts for the messages of servers.
+
+    Return:
+    - INTERNAL for the protocol traffic between servers and the requests that
+    free resources, FORWARDED for the requests of clients that another server
+    passed on (messages sent by Server._get_from_remote carry "internal"),
+    CLIENT otherwise
+    """
+    if message["type"] in RELEASE_REQUESTS:
+        return INTERNAL
+    if from_server and message["type"] in INTERNAL_REQUESTS:
+        return INTERNAL
+    if from_server and message.get("internal", False):
+        return FORWARDED
+    return CLIENT
+
+
+class AdmissionControl:
+    """
+    Description: admission control of the requests of a server, in three lanes.
+
+    Internal requests are always admitted, so that update chains and lock
+    releases keep flowing whatever the client load is. Client requests and
+    the client requests forwarded by other servers have a lane each, so that
+    a hot owner sheds the requests forwarded to it too, while the clients of
+    one server cannot starve the forwarded requests of the others. At most
+    `workers` requests of a lane are served at a time; the next ones wait in a
+    queue of at most queue_limit requests for up to queue_timeout seconds.
+    Requests beyond the queue, or that waited too long, are shed: the server
+    answers OVERLOADED at once, with a hint of when to retry.
+    """
+
+    def __init__(
+        self,
+        workers: int,
+        queue_limit: int,
+        queue_timeout: float,
+        retry_after: float,
+    ):
+        self.slots = {
+            CLIENT: th.BoundedSemaphore(workers),
+            FORWARDED: th.BoundedSemaphore(workers),
+        }
+        self.queue_limit = queue_limit
+        self.queue_timeout = queue_timeout
+        self.retry_after = retry_after
+        self.queued = {CLIENT: 0, FORWARDED: 0}
+        self.lock = th.Lock()
+
+    def admit(self, request_lane: str) -> bool:
+        """
+        Description: wait for a slot for a request, see release
+
+        Return:
+        - False if the request is shed
+        """
+        if request_lane == INTERNAL:
+            return True
+        slots = self.slots[request_lane]
+        if slots.acquire(blocking=False):
+            return True
+
+        with self.lock:
+            if self.queued[request_lane] >= self.queue_limit:
+                metrics.registry.increment(
+                    "admission_shed_total", reason="queue_full", lane=request_lane
+                )
+                return False
+            self.queued[request_lane] += 1
+        start_time = time.perf_counter()
+        try:
+            admitted = slots.acquire(timeout=self.queue_timeout)
+        finally:
+            with self.lock:
+                self.queued[request_lane] -= 1
+        metrics.registry.observe(
+            "admission_wait_seconds", time.perf_counter() - start_time, lane=request_lane
+        )
+        if not admitted:
+            metrics.registry.increment(
+                "admission_shed_total", reason="queue_timeout", lane=request_lane
+            )
+        return admitted
+
+    def release(self, request_lane: str):
+        if request_lane != INTERNAL:
+            self.slots[request_lane].release()
+
+    def overloaded(self, request_lane: str) -> dict:
+        """
+        Return:
+        - the response to a shed request, retry_after grows with the queue of its lane
+        """
+        with self.lock:
+            load = self.queued[request_lane] / max(self.queue_limit, 1)
+        return {
+            "status": gv.OVERLOADED,
+            "message": "server overloaded, retry later",
+            "retry_after": self.retry_after * (1 + load),
+        }
@@ -1,4 +1,5 @@
 import threading as th
+import time
 
 import memory_primitives as mp
 
@@ -12,6 +13,14 @@ class Cache:
         self.key_map = {i: None for i in range(cache_size)}
         self.cache = {i: None for i in range(cache_size)}
         self.locks = {i: th.Lock() for i in range(cache_size)}
+        # number of updates an entry received since it was last read locally,
+        # used by the competitive update policy to expire idle copies
+        self.update_counts = {i: 0 for i in range(cache_size)}
+        # entries filled by a prefetch (see fill) that were not read yet
+        self.prefetched = {i: False for i in range(cache_size)}
+        # time.monotonic() of the last write of an entry by its owner, used to expire
+        # the copies of eventually consistent addresses (see expired)
+        self.refreshed = {i: 0.0 for i in range(cache_size)}
 
     def read_no_sync(self, memory_address: int) -> None | mp.MemoryItem:
         """
@@ -47,9 +56,13 @@ class Cache:
                 self.cache[key].data = data
                 self.cache[key].status = status
                 self.cache[key].wtag = wtag
+                self.refreshed[key] = time.monotonic()
                 return self.cache[key]
             else:
                 self.key_map[key] = memory_address
+                self.update_counts[key] = 0
+                self.prefetched[key] = False
+                self.refreshed[key] = time.monotonic()
                 self.cache[key] = mp.MemoryItem(
                     data=data,
                     status=status,
@@ -57,6 +70,112 @@ class Cache:
                 )
                 return self.cache[key]
         
+    def fill(
+        self,
+        memory_address: int,
+        data,
+        status: str,
+        wtag: int,
+    ) -> bool:
+        """
+        Description: Add a prefetched item with synchronization, unless the item is cached
+        already: a cached copy receives the updates of the owner, it is at least as recent.
+        A prefetch only takes an empty entry or one with a prefetched item that was not
+        read, the copies that are read stay cached (see fillable).
+
+        Return:
+        - True if the item was added
+        """
+        with self.get_lock(memory_address):
+            if not self.fillable(memory_address):
+                return False
+            key = memory_address % self.cache_size
+            self.key_map[key] = memory_address
+            self.update_counts[key] = 0
+            self.prefetched[key] = True
+            self.refreshed[key] = time.monotonic()
+            self.cache[key] = mp.MemoryItem(
+                data=data,
+                status=status,
+                wtag=wtag,
+            )
+            return True
+
+    def fillable(self, memory_address: int) -> bool:
+        """
+        Description: Check without synchronization whether a prefetch of the memory
+        address may be added (see fill).
+        """
+        key = memory_address % self.cache_size
+        if self.key_map[key] == memory_address:
+            return False
+        return self.key_map[key] is None or self.prefetched[key]
+
+    def take_prefetched(self, memory_address: int) -> bool:
+        """
+        Description: Mark a prefetched item as read with synchronization.
+
+        Return:
+        - True if the item was prefetched and not read before
+        """
+        with self.get_lock(memory_address):
+            key = memory_address % self.cache_size
+            if self.key_map[key] != memory_address or not self.prefetched[key]:
+                return False
+            self.prefetched[key] = False
+            return True
+
+    def read_item(self, memory_address: int) -> None | tuple[dict, bytes]:
+        """
+        Description: Read the fields of an item and their encoding (see MemoryItem.encoded_json)
+        with synchronization, so that its data and wtag are those of the same write.
+        """
+        with self.get_lock(memory_address):
+            item = self.read_no_sync(memory_address)
+            return None if item is None else item.encoded_json()
+
+    def merge(self, memory_address: int, data, wtag: int) -> None | bool:
+        """
+        Description: Apply a write of an eventually consistent item with synchronization,
+        the last writer wins (see memory_primitives.lww_order).
+
+        Return:
+        - True if the write replaced the cached value, None if the item is not cached
+        """
+        with self.get_lock(memory_address):
+            key = memory_address % self.cache_size
+            if self.key_map[key] != memory_address:
+                return None
+            if not self.cache[key].loses_to(data, wtag):
+                return False
+            self.cache[key].data = data
+            self.cache[key].wtag = wtag
+            return True
+
+    def refresh(self, memory_address: int) -> None:
+        """
+        Description: Record with synchronization that the owner still sends the writes
+        of a cached item.
+        """
+        with self.get_lock(memory_address):
+            key = memory_address % self.cache_size
+            if self.key_map[key] == memory_address:
+                self.refreshed[key] = time.monotonic()
+
+    def expired(self, memory_address: int, max_age: float) -> bool:
+        """
+        Description: Check with synchronization whether a cached item was not refreshed
+        by its owner (see write, fill and refresh) for more than max_age seconds.
+        A max_age of 0 never expires the item.
+        """
+        if max_age <= 0:
+            return False
+        with self.get_lock(memory_address):
+            key = memory_address % self.cache_size
+            if self.key_map[key] != memory_address:
+                return False
+            return time.monotonic() - self.refreshed[key] > max_age
+
     def remove(self, memory_address: int) -> None:
         """
         Description: Remove an item from the cache with synchronization.
@@ -66,7 +185,32 @@ class Cache:
             if self.key_map[key] == memory_address:
                 self.key_map[key] = None
                 self.cache[key] = None
-        
+                self.update_counts[key] = 0
+                self.prefetched[key] = False
+
+    def record_read(self, memory_address: int) -> None:
+        """
+        Description: Reset the update counter of an item after a local read.
+        """
+        with self.get_lock(memory_address):
+            key = memory_address % self.cache_size
+            if self.key_map[key] == memory_address:
+                self.update_counts[key] = 0
+
+    def record_update(self, memory_address: int) -> int:
+        """
+        Description: Count an update received for an item since its last local read.
+
+        Return:
+        - the number of updates since the last local read, 0 if the item is not cached
+        """
+        with self.get_lock(memory_address):
+            key = memory_address % self.cache_size
+            if self.key_map[key] != memory_address:
+                return 0
+            self.update_counts[key] += 1
+            return self.update_counts[key]
+
     def get_lock(self, memory_address: int) -> th.Lock:
         """
         Description: Get the lock for a given memory address.
@@ -12,14 +12,20 @@ def main():
         type=int,
         help="The index of the server in the list of servers, if this option is missing connect to a random server",
     )
+    parser.add_argument(
+        "-routing",
+        action="store_true",
+        help="Send each request directly to the server that owns the memory address",
+    )
     args = parser.parse_args()
+    client_class = client_logic.RoutingClient if args.routing else client_logic.Client
 
     server_index = args.server
 
     server_address = (
         random.choice(gv.SERVERS) if server_index is None else gv.SERVERS[args.server]
     )
-    client = client_logic.Client(server_address)
+    client = client_class(server_address)
     try:
         client.connect()
     except Exception:
@@ -33,7 +39,12 @@ def main():
 read <address>\n\
 write <address> <data>\n\
 lock <address>\n\
+trylock <address>\n\
+renew <address> <lease tag>\n\
 unlock <address> <lease tag>\n\
+lockmany <address> <address> ...\n\
+unlockmany <address>:<lease tag> <address>:<lease tag> ...\n\
+snapshot <path>\n\
 dumpcache | disconnect): "
             ).strip()
             if not user_input:
@@ -61,12 +72,39 @@ dumpcache | disconnect): "
                 result = client.acquire_lock(mem_address)
                 print(f"Lock {mem_address}: {result}")
 
+            elif command == "trylock" and len(user_input) == 2:
+                mem_address = int(user_input[1])
+                result = client.try_lock(mem_address)
+                print(f"Try lock {mem_address}: {result}")
+
+            elif command == "renew" and len(user_input) == 3:
+                mem_address = int(user_input[1])
+                lease_tag = int(user_input[2])
+                result = client.renew_lease(mem_address, lease_tag)
+                print(f"Renew {mem_address}: {result}")
+
             elif command == "unlock" and len(user_input) == 3:
                 mem_address = int(user_input[1])
                 lease_tag = int(user_input[2])
                 result = client.release_lock(mem_address, lease_tag)
                 print(f"Unlock {mem_address}: {result}")
 
+            elif command == "lockmany" and len(user_input) >= 2:
+                mem_addresses = [int(a) for a in " ".join(user_input[1:]).split()]
+                result = client.acquire_locks(mem_addresses)
+                print(f"Lock {mem_addresses}: {result}")
+
+            elif command == "unlockmany" and len(user_input) >= 2:
+                pairs = [p.split(":") for p in " ".join(user_input[1:]).split()]
+                mem_addresses = [int(a) for a, _ in pairs]
+                lease_tags = [int(t) for _, t in pairs]
+                result = client.release_locks(mem_addresses, lease_tags)
+                print(f"Unlock {mem_addresses}: {result}")
+
+            elif command == "snapshot" and len(user_input) == 2:
+                result = client.snapshot(user_input[1])
+                print(f"Snapshot: {result}")
+
             elif command == "dumpcache":
                 result = client.dump_cache()
                 print(f"Dump cache: {result}")
@@ -93,7 +131,7 @@ dumpcache | disconnect): "
             reconnected = -1
             for index, server in enumerate(gv.SERVERS):
                 try:
-                    client = client_logic.Client(server)
+                    client = client_class(server)
                     client.connect()
                     reconnected = index
                     break
@@ -1,8 +1,11 @@
 import random
 import socket
+import time
 
 import comm_utils as cu
 import global_variables as gv
+import near_cache as nc
+import routing_table as rt
 
 
 class Client:
@@ -36,8 +39,7 @@ class Client:
         """
         Write data to memory address
         """
-        cu.send_msg(
-            self.s,
+        return self._request(
             {
                 "type": "serve_write",
                 "args": [
@@ -48,16 +50,14 @@ class Client:
                     True,
                 ],
             },
+            mem_address,
         )
-        data = cu.rec_msg(self.s)
-        return data
 
     def read(self, mem_address):
         """
         read data from memory address
         """
-        cu.send_msg(
-            self.s,
+        return self._request(
             {
                 "type": "serve_read",
                 "args": [
@@ -67,27 +67,66 @@ class Client:
                     True,
                 ],
             },
+            mem_address,
         )
-        data = cu.rec_msg(self.s)
-        return data
 
-    def acquire_lock(self, mem_address):
+    def read_snapshot(self, mem_addresses, timestamp=None):
+        """
+        read several memory addresses as they were at the same time, without locks
+
+        timestamp: time of the snapshot, None for now. The response carries it,
+        pass it again to read more addresses from the same snapshot.
+        items[i] has the data and the wtag of mem_addresses[i]
+        """
+        return self._request(
+            {
+                "type": "serve_read_snapshot",
+                "args": [
+                    list(mem_addresses),
+                    timestamp,
+                    True,
+                ],
+            }
+        )
+
+    def acquire_lock(self, mem_address, wait_timeout=None, lease_timeout=gv.LEASE_TIMEOUT):
         """
         Acquire lock for item at memory address
+
+        wait_timeout: seconds to wait for the lock, None waits as long as needed.
+        If the lock is not acquired in time the response has ret_val False
+        lease_timeout: seconds after which the server releases the lock, see renew_lease
+        """
+        args = [mem_address, lease_timeout, True]
+        if wait_timeout is not None:
+            args.append(wait_timeout)
+        return self._request({"type": "serve_acquire_lock", "args": args}, mem_address)
+
+    def try_lock(self, mem_address, lease_timeout=gv.LEASE_TIMEOUT):
         """
-        cu.send_msg(
-            self.s,
+        Acquire lock for item at memory address only if it is free (ret_val False otherwise)
+        """
+        return self.acquire_lock(mem_address, 0, lease_timeout)
+
+    def renew_lease(self, mem_address, ltag, lease_timeout=gv.LEASE_TIMEOUT):
+        """
+        Extend the lease of a lock we hold to lease_timeout seconds from now
+        (ret_val False if the lock was already released)
+
+        ltag: lease tag when the lock was acquired
+        """
+        return self._request(
             {
-                "type": "serve_acquire_lock",
+                "type": "serve_renew_lease",
                 "args": [
                     mem_address,
-                    gv.LEASE_TIMEOUT,
+                    ltag,
+                    lease_timeout,
                     True,
                 ],
             },
+            mem_address,
         )
-        data = cu.rec_msg(self.s)
-        return data
     
     def release_lock(self, mem_address, ltag):
         """
@@ -95,8 +134,7 @@ class Client:
 
         ltag: lease tag when the lock was acquired
         """
-        cu.send_msg(
-            self.s,
+        return self._request(
             {
                 "type": "serve_release_lock",
                 "args": [
@@ -104,15 +142,304 @@ class Client:
                     ltag,
                     True,
                 ],
+            },
+            mem_address,
+        )
+
+    def acquire_locks(self, mem_addresses, wait_timeout=None, lease_timeout=gv.LEASE_TIMEOUT):
+        """
+        Acquire the locks of several memory addresses, all of them or none
+
+        The server acquires them in ascending address order, so clients that lock
+        overlapping addresses this way never deadlock. The response lists the
+        addresses in that order with their ltags and wtags (ret_val False and
+        no locks held if they were not acquired in wait_timeout seconds)
+        """
+        args = [list(mem_addresses), lease_timeout, True]
+        if wait_timeout is not None:
+            args.append(wait_timeout)
+        return self._request({"type": "serve_acquire_locks", "args": args})
+
+    def release_locks(self, mem_addresses, ltags):
+        """
+        Release the locks of several memory addresses
+
+        ltags: lease tags of the addresses when the locks were acquired
+        """
+        return self._request(
+            {
+                "type": "serve_release_locks",
+                "args": [
+                    list(mem_addresses),
+                    list(ltags),
+                    True,
+                ],
             }
         )
-        data = cu.rec_msg(self.s)
-        return data
+
+    def transaction(self):
+        """
+        Start an optimistic transaction over several memory addresses, see Transaction
+        """
+        return Transaction(self)
 
     def dump_cache(self):
         """
         Dump the cache of the server
         """
-        cu.send_msg(self.s, {"type": "serve_dump_cache"})
+        return self._request({"type": "serve_dump_cache"})
+
+    def metrics(self):
+        """
+        Latency histograms and counters of the server
+        """
+        return self._request({"type": "serve_metrics"})
+
+    def snapshot(self, snapshot_path):
+        """
+        Ask the server to write a snapshot of its memory to a file on its machine
+        """
+        return self._request({"type": "serve_snapshot", "args": [snapshot_path]})
+
+    def _request(self, message: dict, mem_address=None):
+        """
+        Send a request to the server and wait for its response.
+        An overloaded server answers OVERLOADED with a retry_after hint, the
+        request is retried up to OVERLOAD_RETRIES times with exponential backoff
+
+        mem_address: the memory address the request refers to, if any
+        """
+        attempt = 0
+        while True:
+            data = self._send_request(message, mem_address)
+            if data["status"] != gv.OVERLOADED or attempt >= gv.OVERLOAD_RETRIES:
+                return data
+            # the jitter keeps shed clients from coming back all at once
+            time.sleep(data["retry_after"] * 2**attempt * random.uniform(0.5, 1.5))
+            attempt += 1
+
+    def _send_request(self, message: dict, mem_address=None):
+        cu.send_msg(self.s, message)
+        return cu.rec_msg(self.s)
+
+
+class Transaction:
+    """
+    Description: optimistic transaction of a client over several memory addresses.
+    Reads go to the servers and record the wtag of each address, writes are kept
+    by the transaction until commit, which applies all of them only if none of
+    the addresses read was written meanwhile. No lock is held while the
+    transaction runs, so it costs no lock round-trips; a transaction that
+    conflicts with another one is aborted and may be run again.
+    """
+    def __init__(self, client: Client):
+        self.client = client
+        self.reads = {}  # memory address -> wtag of the value read
+        self.writes = {}  # memory address -> data written
+
+    def read(self, mem_address):
+        """
+        read data from memory address, the data written by the transaction if any
+        """
+        if mem_address in self.writes:
+            return {
+                "status": gv.SUCCESS,
+                "message": "read successful",
+                "data": self.writes[mem_address],
+            }
+        data = self.client.read(mem_address)
+        if data["status"] == gv.SUCCESS:
+            # the first read counts, a later one with another wtag fails the commit anyway
+            self.reads.setdefault(mem_address, data["wtag"])
+        return data
+
+    def write(self, mem_address, data):
+        """
+        Write data to memory address when the transaction commits
+        """
+        self.writes[mem_address] = data
+        return {"status": gv.SUCCESS, "message": "write buffered"}
+
+    def commit(self):
+        """
+        Apply the writes of the transaction if the addresses it read did not change.
+        ret_val is False if the transaction was aborted, conflicts lists the addresses
+        """
+        if not self.reads and not self.writes:
+            return {"status": gv.SUCCESS, "message": "transaction committed", "ret_val": True}
+        data = self.client._request(
+            {
+                "type": "serve_commit_transaction",
+                "args": [
+                    [[address, wtag] for address, wtag in self.reads.items()],
+                    [[address, value] for address, value in self.writes.items()],
+                    True,
+                ],
+            }
+        )
+        self.abort()
+        return data
+
+    def abort(self):
+        """
+        Drop the reads and writes of the transaction, which can then be run again
+        """
+        self.reads = {}
+        self.writes = {}
+
+
+class RoutingClient(Client):
+    """
+    Description: routing-aware client. It knows which server owns each memory
+    address, keeps one connection per server and sends every request directly
+    to the owner, so requests for remote addresses skip the forwarding hop.
+
+    The server we connect to first is the "home" server. The routing table is
+    fetched from it, requests without a memory address are sent to it and, if
+    prefer_local_reads is set, reads are sent to it as well so that they are
+    served from its cache. Otherwise reads are spread between the owner and
+    the replicas of the address.
+    """
+    def __init__(
+        self,
+        server_address=random.choice(gv.SERVERS),
+        prefer_local_reads=False,
+    ):
+        super().__init__(server_address)
+        self.prefer_local_reads = prefer_local_reads
+        self.routing_table = None
+        self.sockets = {}
+
+    def connect(self):
+        super().connect()
+        self.sockets[self.server_address] = self.s
+        self.refresh_routing_table()
+
+    def disconnect(self):
+        for server_address, s in list(self.sockets.items()):
+            if server_address == self.server_address:
+                continue
+            try:
+                cu.send_msg(s, {"type": "disconnect"})
+                cu.rec_msg(s)
+            except Exception:
+                pass
+            finally:
+                s.close()
+        self.sockets = {}
+        return super().disconnect()
+
+    def refresh_routing_table(self):
+        """
+        Fetch the routing table from the home server
+        """
+        cu.send_msg(self.s, {"type": "serve_routing_table"})
         data = cu.rec_msg(self.s)
-        return data
\ No newline at end of file
+        self.routing_table = rt.RoutingTable.from_json(data["routing_table"])
+
+    def _send_request(self, message: dict, mem_address=None):
+        if mem_address is None or (
+            self.prefer_local_reads and message["type"] == "serve_read"
+        ):
+            return super()._send_request(message)
+
+        # a server which is not the owner answers with WRONG_OWNER and its
+        # routing table instead of forwarding the request; we retry once with it
+        message = {**message, "direct": True}
+        data = None
+        for _ in range(2):
+            owner = self.routing_table.get_address(mem_address)
+            if owner is not None and message["type"] == "serve_read":
+                owner = random.choice(
+                    [owner, *self.routing_table.get_replicas(mem_address)]
+                )
+            if owner is None:
+                # let the home server answer with the appropriate error
+                return super()._send_request(message)
+
+            s = self._get_socket(owner)
+            try:
+                cu.send_msg(s, message)
+                data = cu.rec_msg(s)
+            except Exception:
+                self.sockets.pop(owner, None)
+                s.close()
+                raise
+
+            if data["status"] != gv.WRONG_OWNER:
+                return data
+            self.routing_table = rt.RoutingTable.from_json(data["routing_table"])
+        return data
+
+    def _get_socket(self, server_address):
+        """
+        Return the connection to a server, connecting to it if needed
+        """
+        if server_address not in self.sockets:
+            s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            s.settimeout(3 * gv.CONNECTION_TIMEOUT)
+            s.connect(server_address)
+            self.sockets[server_address] = s
+        return self.sockets[server_address]
+
+
+class NearCacheClient(RoutingClient):
+    """
+    Description: routing-aware client with a client side cache.
+    Reads register the client as a copy holder with the owner of the address,
+    the owner then pushes every write of the address to the client's near cache,
+    so repeated reads are served without a network round-trip.
+    """
+    def __init__(
+        self,
+        server_address=random.choice(gv.SERVERS),
+    ):
+        super().__init__(server_address)
+        self.near_cache = None
+
+    def connect(self):
+        super().connect()
+        # the servers reach the near cache through the interface we use to reach them
+        self.near_cache = nc.NearCache(self.s.getsockname()[0])
+
+    def disconnect(self):
+        try:
+            ip, port = self.near_cache.listener_address
+            for mem_address in self.near_cache.addresses():
+                self._request(
+                    {
+                        "type": "serve_drop_copy",
+                        "args": [ip, port, mem_address, True],
+                    },
+                    mem_address,
+                )
+        finally:
+            self.near_cache.close()
+        return super().disconnect()
+
+    def read(self, mem_address):
+        """
+        read data from memory address, from the near cache if possible
+        """
+        item = self.near_cache.read(mem_address)
+        if item is not None:
+            return {"status": gv.SUCCESS, "message": "read successful", **item}
+
+        # cascade=False: the owner registers our near cache as a copy holder
+        ip, port = self.near_cache.listener_address
+        data = self._request(
+            {
+                "type": "serve_read",
+                "args": [
+                    ip,
+                    port,
+                    mem_address,
+                    False,
+                ],
+            },
+            mem_address,
+        )
+        if data["status"] == gv.SUCCESS:
+            self.near_cache.write(mem_address, data["data"], data["istatus"], data["wtag"])
+        return data
@@ -2,21 +2,21 @@ import json
 import socket
 
 import global_variables as gv
+import metrics
+import time_utils as tu
+import tracing
 
 HEADER_LENGTH = gv.HEADER_LENGTH
 FORMAT = gv.FORMAT
 
-def rec_msg(client_socket: socket.socket):
+def rec_raw(client_socket: socket.socket) -> bytes:
     """
-    Description: This function receives a message from a client socket.
-    The message type is json and the message is received in two parts:
-    1. The length of the message
-    2. The message itself
-    json is turned into a dictionary and returned.
+    Description: This function receives a message from a client socket without
+    decoding it, see rec_msg.
     """
     len_msg = b""
     while True:
-        msg_part = client_socket.recv(HEADER_LENGTH)
+        msg_part = client_socket.recv(HEADER_LENGTH - len(len_msg))
         if not msg_part:
             break
         len_msg += msg_part
@@ -27,17 +27,90 @@ def rec_msg(client_socket: socket.socket):
 
     msg = b""
     while True:
-        msg_part = client_socket.recv(msg_len)
+        msg_part = client_socket.recv(msg_len - len(msg))
         if not msg_part:
             break
         msg += msg_part
         if len(msg) == msg_len:
             break
-    
-    msg = msg.decode(FORMAT)
-    msg = json.loads(msg)
+
+    metrics.registry.increment("received_bytes_total", HEADER_LENGTH + len(msg))
     return msg
 
+def send_raw(client_socket: socket.socket, msg: bytes):
+    """
+    Description: This function sends a message that is already encoded, see send_msg.
+    """
+    send_msg = f"{len(msg):<{HEADER_LENGTH}}".encode(FORMAT) + msg
+    client_socket.sendall(send_msg)
+    metrics.registry.increment("sent_bytes_total", len(send_msg))
+
+class PreEncoded(dict):
+    """
+    Description: message of which some fields are encoded already (see encode_fields),
+    e.g. the fields of a memory item that is read many times, so that they are not
+    encoded again for every message. It is used as a regular dictionary, encode_msg
+    only encodes the other fields.
+    """
+
+    def __init__(self, msg: dict, encoded_keys, encoded: bytes):
+        super().__init__(msg)
+        self.encoded_keys = encoded_keys
+        self.encoded = encoded
+
+
+def encode_fields(fields: dict) -> bytes:
+    """
+    Description: This function encodes the fields of a message, to be sent in a PreEncoded message
+    """
+    return json.dumps(fields)[1:-1].encode(FORMAT)
+
+def encode_msg(msg) -> bytes:
+    """
+    Description: This function encodes a message as json. Messages carry the
+    hybrid logical clock of the sender (see time_utils), requests also carry
+    the trace context of the sender.
+    """
+    if isinstance(msg, dict):
+        pre_encoded = msg if isinstance(msg, PreEncoded) else None
+        msg = {**msg, "clock": tu.get_time()}
+        context = tracing.current()
+        if context is not None and "type" in msg:
+            msg["trace"] = context
+        if pre_encoded is not None and pre_encoded.encoded:
+            fields = {
+                key: value
+                for key, value in msg.items()
+                if key not in pre_encoded.encoded_keys
+            }
+            # fields has at least the clock
+            return b"{" + pre_encoded.encoded + b", " + json.dumps(fields).encode(FORMAT)[1:]
+    return json.dumps(msg).encode(FORMAT)
+
+def decode_msg(msg: bytes):
+    """
+    Description: This function decodes a message encoded with encode_msg and
+    merges the clock of the sender into ours. Only the clocks of servers are
+    merged: responses, and the requests that servers send to each other (with
+    "internal"), not the requests of outside clients.
+    """
+    msg = json.loads(msg.decode(FORMAT))
+    if isinstance(msg, dict) and "clock" in msg:
+        clock = msg.pop("clock")
+        if "type" not in msg or msg.get("internal", False):
+            tu.clock.update(clock)
+    return msg
+
+def rec_msg(client_socket: socket.socket):
+    """
+    Description: This function receives a message from a client socket.
+    The message type is json and the message is received in two parts:
+    1. The length of the message
+    2. The message itself
+    json is turned into a dictionary and returned.
+    """
+    return decode_msg(rec_raw(client_socket))
+
 def send_msg(client_socket: socket.socket, msg):
     """
     Description: This function sends a message to a client socket.
@@ -46,8 +119,6 @@ def send_msg(client_socket: socket.socket, msg):
     2. The message itself
     """
     try:
-        msg = json.dumps(msg).encode(FORMAT)
-        send_msg = f"{len(msg):<{HEADER_LENGTH}}".encode(FORMAT) + msg
-        client_socket.sendall(send_msg)
+        send_raw(client_socket, encode_msg(msg))
     except Exception as e:
         print(f"[ERROR] sending message: {e}")
\ No newline at end of file
@@ -0,0 +1,172 @@
+import itertools
+import socket
+import threading as th
+
+import comm_utils as cu
+import global_variables as gv
+
+CONNECTION_TIMEOUT = gv.CONNECTION_TIMEOUT
+
+
+class Deferred:
+    """
+    Description: response of a request that is not known yet, e.g. of a lock
+    acquisition waiting in the queue of the lock. The server sends it on the
+    connection of the request once it is resolved (see Server.handle_client),
+    so the request does not keep a thread waiting.
+    """
+
+    def __init__(self):
+        self.lock = th.Lock()
+        self.resolved = th.Event()
+        self.value = None
+        self.callbacks = []
+
+    def resolve(self, value):
+        """
+        Description: set the response, a Deferred resolves this one when it is resolved itself
+        """
+        if isinstance(value, Deferred):
+            value.then(self.resolve)
+            return
+        with self.lock:
+            if self.resolved.is_set():
+                return  # e.g. a request that failed twice
+            self.value = value
+            self.resolved.set()
+            callbacks, self.callbacks = self.callbacks, []
+        for callback in callbacks:
+            callback(value)
+
+    def then(self, callback):
+        """
+        Description: call callback(response) once the response is known (at once if it is)
+        """
+        with self.lock:
+            if not self.resolved.is_set():
+                self.callbacks.append(callback)
+                return
+        callback(self.value)
+
+    def wait(self, timeout: None | float = None):
+        """
+        Return:
+        - the response, blocking the calling thread until it is known (None on timeout)
+        """
+        self.resolved.wait(timeout)
+        return self.value
+
+    def settled(self):
+        """
+        Return:
+        - the response if it is known, the Deferred itself otherwise
+        """
+        return self.value if self.resolved.is_set() else self
+
+
+def when(response: dict | Deferred, callback):
+    """
+    Description: call callback(response) once a response that may be deferred is known
+    """
+    if isinstance(response, Deferred):
+        response.then(callback)
+    else:
+        callback(response)
+
+
+def gather(responses: list[dict | Deferred]) -> Deferred:
+    """
+    Return:
+    - a Deferred resolved with the list of the responses once all of them are known
+    """
+    gathered = Deferred()
+    values = [None] * len(responses)
+    remaining = [len(responses)]
+    lock = th.Lock()
+
+    def collect(index, value):
+        values[index] = value
+        with lock:
+            remaining[0] -= 1
+            done = remaining[0] == 0
+        if done:
+            gathered.resolve(values)
+
+    for index, response in enumerate(responses):
+        when(response, lambda value, index=index: collect(index, value))
+    if not responses:
+        gathered.resolve(values)
+    return gathered
+
+
+class MultiplexedConnection:
+    """
+    Description: connection to another server that carries many requests at once.
+    Each request has an "id" that the server copies to its response, so responses
+    can arrive in any order (deferred responses are sent when they are resolved,
+    other requests are served meanwhile). A reader thread resolves the Deferred
+    of each request when its response arrives.
+
+    Requests that wait for a long time on the other server (e.g. for a lock)
+    go through it, so that they keep neither a thread nor a socket each.
+    """
+
+    def __init__(self, server_address: tuple[str, int]):
+        self.server_address = server_address
+        self.socket = None
+        self.pending = {}  # request id -> Deferred
+        self.ids = itertools.count()
+        self.lock = th.Lock()
+
+    def request(self, message: dict) -> Deferred:
+        deferred = Deferred()
+        try:
+            with self.lock:
+                if self.socket is None:
+                    self.socket = socket.create_connection(
+                        self.server_address, CONNECTION_TIMEOUT
+                    )
+                    self.socket.settimeout(None)  # responses may take long
+                    th.Thread(
+                        target=self._read_responses, args=(self.socket,), daemon=True
+                    ).start()
+                request_id = next(self.ids)
+                self.pending[request_id] = deferred
+                cu.send_raw(self.socket, cu.encode_msg({**message, "id": request_id}))
+        except Exception as e:
+            self._fail(self.socket, e)
+            deferred.resolve(self._error(e))
+        return deferred
+
+    def _read_responses(self, server_socket: socket.socket):
+        try:
+            while True:
+                response = cu.rec_msg(server_socket)
+                with self.lock:
+                    deferred = self.pending.pop(response.pop("id", None), None)
+                if deferred is not None:
+                    deferred.resolve(response)
+        except Exception as e:
+            self._fail(server_socket, e)
+
+    def _fail(self, server_socket: None | socket.socket, error: Exception):
+        """
+        Description: the connection is broken, its pending requests fail
+        """
+        with self.lock:
+            if server_socket is None or server_socket is not self.socket:
+                return
+            self.socket = None
+            pending, self.pending = self.pending, {}
+        try:
+            server_socket.close()
+        except Exception:
+            pass
+        for deferred in pending.values():
+            deferred.resolve(self._error(error))
+
+    def _error(self, error: Exception) -> dict:
+        return {
+            "status": gv.ERROR,
+            "message": f"Failed to connect to the host with error: {error}",
+        }
@@ -0,0 +1,499 @@
+import bisect
+import os
+import socket
+import threading as th
+
+import comm_utils as cu
+import deferred as dfr
+import global_variables as gv
+import logger as lg
+import snapshot as sn
+
+CONNECTION_TIMEOUT = gv.CONNECTION_TIMEOUT
+
+# requests without a memory address that every worker answers for its own part
+# of the memory range, the front-end merges the answers
+MERGED_REQUESTS = {
+    "serve_dump_cache",
+    "serve_load_stats",
+    "serve_metrics",
+    "serve_snapshot",
+}
+
+# requests with the memory addresses of several workers, the front-end splits them
+# between the workers that own the addresses and merges the answers (see _split)
+SPLIT_REQUESTS = {
+    "serve_prepare_transaction",
+    "serve_decide_transaction",
+    "serve_read_many",
+    "serve_migrate_range",
+    "serve_import_range",
+    "serve_import_status",
+    "serve_update_routing",
+}
+
+
+class FrontEnd:
+    """
+    Description: public face of a server that runs as several worker processes.
+
+    The memory range of the server is split between workers, each one is a
+    regular Server with its own memory manager and cache that owns a part of the
+    range (and knows its sibling workers as the owners of the other parts).
+    The front-end listens on the address of the server and passes every request
+    to the worker that owns its memory address; it only decodes requests, the
+    responses of the workers are passed back as they are. Requests without a
+    memory address go to the first worker, or to all of them (MERGED_REQUESTS).
+    Requests with several memory addresses are split between the workers that
+    own them (SPLIT_REQUESTS).
+
+    Workers register themselves as copy holders with their own address, so the
+    update chain reaches them directly, as do routing-aware clients, which get
+    the routing table of a worker.
+    """
+
+    def __init__(
+        self,
+        server_address: tuple[str, int],
+        worker_addresses: list[tuple[str, int]],
+        worker_ranges: list[tuple[int, int]],
+        address_argument: dict[str, int],
+    ):
+        """
+        address_argument: position of the memory address in the arguments of each request type
+        """
+        self.server_address = server_address
+        self.worker_addresses = worker_addresses
+        self.worker_starts = [worker_range[0] for worker_range in worker_ranges]
+        self.worker_end = worker_ranges[-1][1]
+        self.address_argument = {**address_argument, "serve_update_cache": 1}
+        # requests with an id (see deferred.MultiplexedConnection) may wait on the
+        # workers, they are passed on through multiplexed connections
+        self.worker_connections = [
+            dfr.MultiplexedConnection(worker_address)
+            for worker_address in worker_addresses
+        ]
+        self.log = lg.Logger(server=server_address)
+
+    def start(self):
+        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as server_socket:
+            server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            server_socket.bind(self.server_address)
+            server_socket.listen()
+
+            self.log.info("LISTENING", workers=len(self.worker_addresses))
+
+            while True:
+                client_socket, client_address = server_socket.accept()
+                th.Thread(
+                    target=self.handle_client, args=(client_socket, client_address)
+                ).start()
+
+    def _get_worker(self, message: dict) -> int:
+        """
+        Return:
+        - the index of the worker that serves the message
+        """
+        position = self.address_argument.get(message["type"], None)
+        if position is None:
+            return 0
+        return self._get_address_worker(message["args"][position])
+
+    def _get_address_worker(self, memory_address: int) -> int:
+        """
+        Return:
+        - the index of the worker that owns the memory address
+        """
+        if memory_address < self.worker_starts[0] or memory_address >= self.worker_end:
+            return 0  # owned by another server, any worker forwards it
+        return bisect.bisect_right(self.worker_starts, memory_address) - 1
+
+    def handle_client(
+        self, client_socket: socket.socket, client_address: tuple[str, int]
+    ):
+        self.log.info("NEW_CONNECTION", category="request", client=client_address)
+        worker_sockets = {}  # connections to the workers, opened on first use
+        send_lock = th.Lock()  # responses to requests with an id are sent by other threads
+        try:
+            while True:
+                request = cu.rec_raw(client_socket)
+                message = cu.decode_msg(request)
+
+                if message["type"] == "disconnect":
+                    cu.send_msg(
+                        client_socket, {"status": gv.SUCCESS, "message": "disconnected"}
+                    )
+                    break
+                if message["type"] == "serve_shm_connect":
+                    # a shared-memory channel would reach one worker, the requests of
+                    # other servers go through the front-end over TCP instead
+                    self._send(
+                        client_socket,
+                        send_lock,
+                        {"status": gv.ERROR, "message": "shared memory is not served by the front-end"},
+                    )
+                    continue
+                if message["type"] in MERGED_REQUESTS:
+                    with send_lock:
+                        cu.send_msg(
+                            client_socket, self._merge(worker_sockets, message)
+                        )
+                    continue
+
+                if message["type"] in SPLIT_REQUESTS:
+                    request_id = message.pop("id", None)
+                    response = self._split(message)
+                    if request_id is None:
+                        self._send(client_socket, send_lock, response.wait())
+                    else:
+                        response.then(
+                            lambda response, request_id=request_id: self._send(
+                                client_socket, send_lock, {**response, "id": request_id}
+                            )
+                        )
+                    continue
+
+                worker = self._get_worker(message)
+                if "id" in message:
+                    request_id = message.pop("id")
+                    self.worker_connections[worker].request(message).then(
+                        lambda response, request_id=request_id: self._send(
+                            client_socket, send_lock, {**response, "id": request_id}
+                        )
+                    )
+                    continue
+
+                try:
+                    worker_socket = self._get_worker_socket(worker_sockets, worker)
+                    cu.send_raw(worker_socket, request)
+                    response = cu.rec_raw(worker_socket)
+                except Exception as e:
+                    worker_sockets.pop(worker, None)
+                    self.log.error("WORKER_ERROR", worker=worker, error=e)
+                    self._send(
+                        client_socket,
+                        send_lock,
+                        {
+                            "status": gv.ERROR,
+                            "message": f"Failed to reach worker {worker} with error: {e}",
+                        },
+                    )
+                    continue
+                with send_lock:
+                    cu.send_raw(client_socket, response)
+        except Exception as e:
+            self.log.warning("ERROR_RECEIVING", client=client_address, error=e)
+        finally:
+            for worker_socket in worker_sockets.values():
+                try:
+                    cu.send_msg(worker_socket, {"type": "disconnect"})
+                    cu.rec_msg(worker_socket)
+                    worker_socket.close()
+                except Exception:
+                    pass
+            client_socket.close()
+            self.log.info("DISCONNECTED", category="request", client=client_address)
+
+    def _send(self, client_socket: socket.socket, send_lock: th.Lock, response: dict):
+        with send_lock:
+            cu.send_msg(client_socket, response)
+
+    def _get_worker_socket(self, worker_sockets: dict, worker: int) -> socket.socket:
+        if worker not in worker_sockets:
+            worker_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            worker_socket.settimeout(3 * CONNECTION_TIMEOUT)
+            worker_socket.connect(self.worker_addresses[worker])
+            worker_sockets[worker] = worker_socket
+        return worker_sockets[worker]
+
+    def _merge(self, worker_sockets: dict, message: dict) -> dict:
+        """
+        Description: send a request to every worker and merge their responses
+        """
+        snapshot_path = None
+        if message["type"] == "serve_snapshot":
+            if gv.SNAPSHOT_DIR is None:
+                return {"status": gv.ERROR, "message": "snapshots are disabled, SNAPSHOT_DIR is not set"}
+            try:
+                snapshot_path = sn.snapshot_file(gv.SNAPSHOT_DIR, message["args"][0])
+            except ValueError as e:
+                return {"status": gv.ERROR, "message": str(e)}
+
+        responses = []
+        for worker in range(len(self.worker_addresses)):
+            worker_message = message
+            if snapshot_path is not None:
+                # relative to the snapshot directory, as the path of the request
+                worker_message = {**message, "args": [f"{message['args'][0]}.worker{worker}"]}
+            try:
+                worker_socket = self._get_worker_socket(worker_sockets, worker)
+                cu.send_msg(worker_socket, worker_message)
+                response = cu.rec_msg(worker_socket)
+            except Exception as e:
+                worker_sockets.pop(worker, None)
+                response = {
+                    "status": gv.ERROR,
+                    "message": f"Failed to reach worker {worker} with error: {e}",
+                }
+            if response["status"] != gv.SUCCESS:
+                return response
+            responses.append(response)
+
+        merged = {"status": gv.SUCCESS, "message": responses[0]["message"]}
+        if message["type"] == "serve_dump_cache":
+            merged["cache"] = [item for response in responses for item in response["cache"]]
+        elif message["type"] == "serve_load_stats":
+            merged["loads"] = sorted(
+                bucket for response in responses for bucket in response["loads"]
+            )
+        elif message["type"] == "serve_metrics":
+            merged["metrics"] = {
+                kind: [
+                    {**metric, "labels": {**metric["labels"], "worker": worker}}
+                    for worker, response in enumerate(responses)
+                    for metric in response["metrics"][kind]
+                ]
+                for kind in ("histograms", "counters")
+            }
+        elif message["type"] == "serve_snapshot":
+            # the workers' snapshots are concatenated into one snapshot file
+            with open(snapshot_path, "wb") as f:
+                f.write(sn.MAGIC)
+                for worker in range(len(self.worker_addresses)):
+                    worker_path = f"{snapshot_path}.worker{worker}"
+                    with open(worker_path, "rb") as worker_file:
+                        f.write(worker_file.read()[len(sn.MAGIC) :])
+                    os.remove(worker_path)
+            merged["count"] = sum(response["count"] for response in responses)
+            merged["message"] = (
+                f"snapshot of {merged['count']} items written to {message['args'][0]}"
+            )
+        return merged
+
+    def _split(self, message: dict) -> dfr.Deferred:
+        """
+        Description: pass a request with several memory addresses to the workers
+        that own them, each one gets the part of the request with its addresses
+
+        Return:
+        - a Deferred resolved with the merged response of the workers
+        """
+        args = message["args"]
+        if message["type"] == "serve_decide_transaction":
+            # the front-end does not know which workers prepared the transaction,
+            # the others answer that it is not prepared
+            return _merge_with(
+                [
+                    connection.request(message)
+                    for connection in self.worker_connections
+                ],
+                _merge_decisions,
+            )
+        if message["type"] == "serve_update_routing":
+            return _merge_with(
+                [
+                    connection.request(message)
+                    for connection in self.worker_connections
+                ],
+                _merge_responses,
+            )
+        if message["type"] == "serve_read_many":
+            parts = {0: []} if not args[2] else {}  # worker -> memory addresses
+            for memory_address in args[2]:
+                parts.setdefault(self._get_address_worker(memory_address), []).append(
+                    memory_address
+                )
+            return _merge_with(
+                [
+                    self.worker_connections[worker].request(
+                        {**message, "args": [args[0], args[1], part, args[3]]}
+                    )
+                    for worker, part in parts.items()
+                ],
+                _merge_reads,
+            )
+        if message["type"] == "serve_migrate_range":
+            return _merge_with(
+                [
+                    self.worker_connections[worker].request(
+                        {**message, "args": [start, end, *args[2:]]}
+                    )
+                    for worker, start, end in self._split_range(args[0], args[1])
+                ],
+                _merge_responses,
+            )
+        if message["type"] == "serve_import_range":
+            # the addresses are imported by the worker that the front-end passes their requests to
+            return _merge_with(
+                [
+                    self.worker_connections[worker].request(
+                        {
+                            **message,
+                            "args": [
+                                start,
+                                end,
+                                [item for item in args[2] if start <= item[0] < end],
+                                args[3],
+                            ],
+                        }
+                    )
+                    for worker, start, end in self._split_range(args[0], args[1])
+                ],
+                _merge_responses,
+            )
+        if message["type"] == "serve_import_status":
+            return _merge_with(
+                [
+                    self.worker_connections[worker].request(
+                        {**message, "args": [args[0], start, end]}
+                    )
+                    for worker, start, end in self._split_range(args[1], args[2])
+                ],
+                _merge_import_status,
+            )
+
+        transaction_id, reads, writes, apply_now, coordinator = args
+        parts = {}  # worker -> [reads, writes] of its addresses
+        for position, items in ((0, reads), (1, writes)):
+            for item in items:
+                worker = self._get_address_worker(item[0])
+                parts.setdefault(worker, [[], []])[position].append(item)
+        if len(parts) <= 1:
+            return self.worker_connections[next(iter(parts), 0)].request(message)
+
+        def decide(votes: list[dict]) -> dict | dfr.Deferred:
+            vote = _merge_votes(votes)
+            if not apply_now:
+                return vote
+            # the transaction has no other owner, the front-end decides it for its workers
+            commit = vote["status"] == gv.SUCCESS and vote["ret_val"]
+            decision = {
+                "type": "serve_decide_transaction",
+                "args": [transaction_id, commit, vote.get("prepare_time")],
+            }
+            return _merge_with(
+                [self.worker_connections[worker].request(decision) for worker in parts],
+                lambda decisions: (
+                    {**_merge_decisions(decisions), "conflicts": []} if commit else vote
+                ),
+            )
+
+        # a transaction of several workers is prepared on each of them first, even
+        # if it has no other owner
+        return _merge_with(
+            [
+                self.worker_connections[worker].request(
+                    {
+                        **message,
+                        "args": [transaction_id, part_reads, part_writes, False, coordinator],
+                    }
+                )
+                for worker, (part_reads, part_writes) in parts.items()
+            ],
+            decide,
+        )
+
+    def _split_range(self, start: int, end: int) -> list[tuple[int, int, int]]:
+        """
+        Return:
+        - the parts [part start, part end) of the memory range [start, end) with the
+        worker that owns each one, as (worker, part start, part end). The addresses
+        outside of the memory range of the server go to the first worker.
+        """
+        if start >= end:
+            return [(self._get_address_worker(start), start, end)]
+        bounds = self.worker_starts + [self.worker_end]
+        cuts = sorted({start, end} | {bound for bound in bounds if start < bound < end})
+        return [
+            (self._get_address_worker(part_start), part_start, part_end)
+            for part_start, part_end in zip(cuts, cuts[1:])
+        ]
+
+
+def _merge_with(responses: list[dict | dfr.Deferred], merge) -> dfr.Deferred:
+    """
+    Return:
+    - a Deferred resolved with merge(responses) once all the responses are known
+    """
+    merged = dfr.Deferred()
+    dfr.gather(responses).then(lambda values: merged.resolve(merge(values)))
+    return merged
+
+
+def _merge_votes(votes: list[dict]) -> dict:
+    """
+    Description: merge the answers of the workers to serve_prepare_transaction
+    """
+    for vote in votes:
+        if vote["status"] != gv.SUCCESS:
+            return vote
+    if not all(vote["ret_val"] for vote in votes):
+        return {
+            "status": gv.SUCCESS,
+            "message": "transaction conflicts",
+            "ret_val": False,
+            "conflicts": sorted(address for vote in votes for address in vote["conflicts"]),
+        }
+    return {
+        "status": gv.SUCCESS,
+        "message": "transaction prepared",
+        "ret_val": True,
+        "conflicts": [],
+        "prepare_time": max(vote["prepare_time"] for vote in votes),
+    }
+
+
+def _merge_decisions(decisions: list[dict]) -> dict:
+    """
+    Description: merge the answers of the workers to serve_decide_transaction
+    """
+    for decision in decisions:
+        if decision["status"] != gv.SUCCESS:
+            return decision
+    for decision in decisions:
+        if decision["ret_val"]:
+            return decision
+    return decisions[0]
+
+
+def _merge_responses(responses: list[dict]) -> dict:
+    """
+    Description: merge the answers of the workers to the parts of a request, the
+    first failure or the last answer
+    """
+    for response in responses:
+        if response["status"] != gv.SUCCESS:
+            return response
+    return responses[-1]
+
+
+def _merge_reads(responses: list[dict]) -> dict:
+    """
+    Description: merge the answers of the workers to serve_read_many
+    """
+    for response in responses:
+        if response["status"] != gv.SUCCESS:
+            return response
+    return {
+        **responses[0],
+        "items": [item for response in responses for item in response["items"]],
+    }
+
+
+def _merge_import_status(responses: list[dict]) -> dict:
+    """
+    Description: merge the answers of the workers to serve_import_status. If some
+    workers imported their part and others did not, neither the source nor the
+    server can own the whole memory range: the source is told that the answer is
+    not known, it keeps the locks and asks again.
+    """
+    for response in responses:
+        if response["status"] != gv.SUCCESS:
+            return response
+    imported = {response["ret_val"] for response in responses}
+    if len(imported) > 1:
+        return {
+            "status": gv.ERROR,
+            "message": "range partially imported by the workers",
+        }
+    return responses[0]
@@ -10,14 +10,53 @@ load_dotenv()
 HEADER_LENGTH = int(os.getenv("HEADER_LENGTH"))                                     # 64
 FORMAT = os.getenv("FORMAT")                                                        # 'utf-8'               
 CONNECTION_TIMEOUT = int(os.getenv("CONNECTION_TIMEOUT"))                           # 5
-LEASE_TIMEOUT = int(os.getenv("LEASE_TIMEOUT"))                                     # 5    
+LEASE_TIMEOUT = float(os.getenv("LEASE_TIMEOUT"))                                   # 5, seconds (fractions allowed, e.g. 0.3)
 SERVERS = [tuple(server.split(":")) for server in os.getenv("SERVERS").split(",")]
 SERVERS = [(server[0], int(server[1])) for server in SERVERS] 
 MEMORY_SIZE = int(os.getenv("MEMORY_SIZE"))                                         # 300
+SERVER_MEMORY_SIZES = os.getenv("SERVER_MEMORY_SIZES")                              # '100,150,50', equal split if missing
+SERVER_MEMORY_SIZES = None if not SERVER_MEMORY_SIZES else [int(size) for size in SERVER_MEMORY_SIZES.split(",")]
+EVENTUAL_RANGES = os.getenv("EVENTUAL_RANGES")                                      # '0-50,200-220', eventually consistent memory ranges, none if missing
+EVENTUAL_RANGES = [] if not EVENTUAL_RANGES else [tuple(int(bound) for bound in memory_range.split("-")) for memory_range in EVENTUAL_RANGES.split(",")]
 CACHE_SIZE = int(os.getenv("CACHE_SIZE"))                                           # 100
+COPY_EXPIRY_UPDATES = int(os.getenv("COPY_EXPIRY_UPDATES", 4))                      # 4, 0 disables copy expiry
+PREFETCH_DEPTH = int(os.getenv("PREFETCH_DEPTH", 4))                                # 4, addresses prefetched ahead of a sequential or stride scan, 0 disables prefetching
+PREFETCH_MIN_ACCURACY = float(os.getenv("PREFETCH_MIN_ACCURACY", 0.5))              # 0.5
+NEAR_CACHE_TTL = float(os.getenv("NEAR_CACHE_TTL", 5))                              # 5
+REPLICA_COUNT = int(os.getenv("REPLICA_COUNT", 0))                                  # 0
+REPLICA_HEARTBEAT = float(os.getenv("REPLICA_HEARTBEAT", 1))                        # 1
+REPLICA_FAILURES = int(os.getenv("REPLICA_FAILURES", 3))                            # 3
+PERSISTENT_STORE_DIR = os.getenv("PERSISTENT_STORE_DIR")                            # './store', memory is not persisted if missing
+WAL_DIR = os.getenv("WAL_DIR")                                                      # './wal', writes are not logged if missing
+WAL_MAX_DELAY = float(os.getenv("WAL_MAX_DELAY", 0.002))                            # 0.002 seconds
+WAL_CHECKPOINT_SIZE = int(os.getenv("WAL_CHECKPOINT_SIZE", 16777216))               # 16 MiB
+SNAPSHOT_DIR = os.getenv("SNAPSHOT_DIR")                                            # './snapshots', serve_snapshot is refused if missing
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")                                          # 'INFO', one of DEBUG, INFO, WARNING, ERROR
+LOG_FORMAT = os.getenv("LOG_FORMAT", "kv")                                          # 'kv' (key=value) or 'json'
+LOG_FILE = os.getenv("LOG_FILE")                                                    # './server.log', stdout if missing
+LOG_SAMPLING = os.getenv("LOG_SAMPLING")                                            # 'request=0.01,update=0.1', nothing sampled if missing
+METRICS_DIR = os.getenv("METRICS_DIR")                                              # './metrics', no Prometheus file if missing
+METRICS_INTERVAL = float(os.getenv("METRICS_INTERVAL", 10))                         # 10 seconds
+TRACE_DIR = os.getenv("TRACE_DIR")                                                  # './traces', nothing traced if missing
+TRACE_SAMPLING = float(os.getenv("TRACE_SAMPLING", 1))                              # 1, fraction of the traces recorded
+WORKER_PORT_OFFSET = int(os.getenv("WORKER_PORT_OFFSET", 1000))                     # 1000
+SHM_RING_SIZE = int(os.getenv("SHM_RING_SIZE", 262144))                             # 256 KiB, 0 disables the shared-memory transport
+ADMISSION_WORKERS = int(os.getenv("ADMISSION_WORKERS", 64))                         # 64, client requests served at a time, 0 disables admission control
+ADMISSION_QUEUE_LIMIT = int(os.getenv("ADMISSION_QUEUE_LIMIT", 256))                # 256
+ADMISSION_QUEUE_TIMEOUT = float(os.getenv("ADMISSION_QUEUE_TIMEOUT", 1))            # 1 second
+OVERLOAD_RETRY_AFTER = float(os.getenv("OVERLOAD_RETRY_AFTER", 0.05))               # 0.05 seconds
+OVERLOAD_RETRIES = int(os.getenv("OVERLOAD_RETRIES", 3))                            # 3
+TRANSACTION_TIMEOUT = float(os.getenv("TRANSACTION_TIMEOUT", 5))                    # 5 seconds, prepared transactions not decided by then are aborted
+MVCC_VERSIONS = int(os.getenv("MVCC_VERSIONS", 0))                                  # 0, versions kept per address for snapshot reads, 0 disables them
+MVCC_RETENTION = float(os.getenv("MVCC_RETENTION", 60))                             # 60 seconds
+EVENTUAL_RETRY_INTERVAL = float(os.getenv("EVENTUAL_RETRY_INTERVAL", 1))            # 1 second
+EVENTUAL_COPY_TTL = float(os.getenv("EVENTUAL_COPY_TTL", 5))                        # 5 seconds, a cached copy of an eventually consistent address not updated by its owner for longer is read again, 0 disables it
+CLOCK_MAX_OFFSET = float(os.getenv("CLOCK_MAX_OFFSET", 1))                          # 1 second, clocks received further ahead of the local time are ignored
 SUCCESS = int(os.getenv("SUCCESS"))                                                 # 0      
 ERROR = int(os.getenv("ERROR"))                                                     # 1
 INVALID_ADDRESS = int(os.getenv("INVALID_ADDRESS"))                                 # 2
 INVALID_OPERATION = int(os.getenv("INVALID_OPERATION"))                             # 3
+WRONG_OWNER = int(os.getenv("WRONG_OWNER", 4))                                      # 4
+OVERLOADED = int(os.getenv("OVERLOADED", 5))                                        # 5
 JAVA_JAR_FILE = os.getenv("JAVA_JAR_FILE")                                          # '../java_code/edcs/out/artifacts/server_app_jar/server-app.jar'
 CLIENT_API = os.getenv("CLIENT_API")                                                # 'http://
\ No newline at end of file
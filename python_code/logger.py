@@ -0,0 +1,163 @@
+import atexit
+import datetime as dt
+import json
+import queue
+import random
+import sys
+import threading as th
+import time
+
+import global_variables as gv
+
+LEVELS = {"DEBUG": 10, "INFO": 20, "WARNING": 30, "ERROR": 40}
+
+
+class AsyncWriter:
+    """
+    Description: writes lines to a stream from a background thread.
+
+    Producers only put items on a SimpleQueue (no lock on the Python side), the
+    writer thread drains the queue in batches, formats the items and writes the
+    batch at once. The formatting and the I/O are therefore not paid by the
+    producers.
+    """
+
+    def __init__(self, stream, format_item=str, batch_size: int = 1024):
+        self.stream = stream
+        self.format_item = format_item
+        self.batch_size = batch_size
+        self.queue = queue.SimpleQueue()
+        self.lock = th.Lock()  # the writer thread and flush() share the stream
+
+        th.Thread(target=self._drain, daemon=True).start()
+        atexit.register(self.flush)
+
+    def write(self, item):
+        self.queue.put(item)
+
+    def flush(self):
+        """
+        Description: write everything that is queued, from the calling thread
+        """
+        with self.lock:
+            items = self._take(None)
+            while items:
+                self._write_batch(items)
+                items = self._take(None)
+
+    def _take(self, first) -> list:
+        items = [] if first is None else [first]
+        try:
+            while len(items) < self.batch_size:
+                items.append(self.queue.get_nowait())
+        except queue.Empty:
+            pass
+        return items
+
+    def _write_batch(self, items: list):
+        if not items:
+            return
+        self.stream.write("".join(self.format_item(item) + "\n" for item in items))
+        self.stream.flush()
+
+    def _drain(self):
+        while True:
+            first = self.queue.get()
+            with self.lock:
+                try:
+                    self._write_batch(self._take(first))
+                except Exception:
+                    # a failing log line must never stop the writer
+                    pass
+
+
+def _format_value(value) -> str:
+    if isinstance(value, (tuple, list)) and len(value) == 2 and isinstance(value[1], int):
+        return f"{value[0]}:{value[1]}"  # network address
+    value = str(value)
+    return json.dumps(value) if " " in value or value == "" else value
+
+
+def format_record(record: tuple) -> str:
+    """
+    Description: turn a log record into a key=value or a JSON line (LOG_FORMAT)
+    """
+    timestamp, level, event, fields = record
+    timestamp = dt.datetime.fromtimestamp(timestamp, dt.UTC).isoformat(
+        timespec="microseconds"
+    )
+    if gv.LOG_FORMAT == "json":
+        return json.dumps(
+            {"ts": timestamp, "level": level, "event": event, **fields}, default=str
+        )
+    return " ".join(
+        [f"ts={timestamp}", f"level={level}", f"event={event}"]
+        + [f"{key}={_format_value(value)}" for key, value in fields.items()]
+    )
+
+
+def _parse_sampling(sampling: None | str) -> dict[str, float]:
+    if not sampling:
+        return {}
+    rates = {}
+    for entry in sampling.split(","):
+        category, rate = entry.split("=")
+        rates[category.strip()] = float(rate)
+    return rates
+
+
+_writer = None
+_writer_lock = th.Lock()
+
+
+def get_writer() -> AsyncWriter:
+    """
+    Description: the writer shared by all the loggers of the process
+    """
+    global _writer
+    with _writer_lock:
+        if _writer is None:
+            stream = sys.stdout if gv.LOG_FILE is None else open(gv.LOG_FILE, "a")
+            _writer = AsyncWriter(stream, format_record)
+        return _writer
+
+
+class Logger:
+    """
+    Description: leveled, structured logger.
+
+    A log call only checks the level and the sampling rate of its category and
+    queues a record, the line is formatted and written by the AsyncWriter.
+    Every record carries the fields given to the constructor (e.g. the server).
+
+    Categories group high-volume events (e.g. "request" for every request and
+    response) so that they can be sampled with LOG_SAMPLING, e.g. "request=0.01".
+    Events without a category are never sampled.
+    """
+
+    def __init__(self, **fields):
+        self.fields = fields
+        self.level = LEVELS[gv.LOG_LEVEL.upper()]
+        self.sampling = _parse_sampling(gv.LOG_SAMPLING)
+        self.writer = get_writer()
+
+    def log(self, level: str, event: str, category: None | str = None, **fields):
+        if LEVELS[level] < self.level:
+            return
+        if category is not None:
+            rate = self.sampling.get(category, 1.0)
+            if rate < 1.0 and random.random() >= rate:
+                return
+        self.writer.write((time.time(), level, event, {**self.fields, **fields}))
+
+    def debug(self, event: str, category: None | str = None, **fields):
+        self.log("DEBUG", event, category, **fields)
+
+    def info(self, event: str, category: None | str = None, **fields):
+        self.log("INFO", event, category, **fields)
+
+    def warning(self, event: str, category: None | str = None, **fields):
+        self.log("WARNING", event, category, **fields)
+
+    def error(self, event: str, category: None | str = None, **fields):
+        self.log("ERROR", event, category, **fields)
@@ -1,4 +1,14 @@
+import deferred as dfr
+import logger as lg
+import metrics
+import tracing
 import memory_primitives as mp
+import persistent_store as ps
+import scheduler as sc
+import snapshot as sn
+import wal as wl
+import time_utils as tu
+import itertools
 import sched
 import time
 import threading as th
@@ -7,60 +17,417 @@ class MemoryManager:
     def __init__(
         self,
         memory_range : tuple[int, int],
+        store : None | ps.PersistentStore = None,
+        wal : None | wl.WriteAheadLog = None,
+        snapshot_path : None | str = None,
+        max_versions : int = 0,
+        version_retention : float = 60,
+        held_ranges : None | list[tuple[int, int]] = None,
     ):
+        """
+        held_ranges: memory ranges held before a restart, when memory ranges moved
+        from or to other servers (see import_items), the memory_range if None
+        """
         self.memory_range = memory_range
+        self.log = lg.Logger()
+
+        # with a persistent store the memory items live in a memory-mapped file
+        # and are only turned into Python objects when they are accessed
+        if store is not None:
+            self.memory = ps.StoredItems(store)
+        else:
+            start_time = tu.get_time()
+            self.memory = {
+                i: mp.MemoryItem(
+                    data=None,
+                    status="E",
+                    wtag=start_time,
+                )
+                for i in range(self.memory_range[0], self.memory_range[1])
+            }
+        if held_ranges is not None:
+            self._hold_ranges(held_ranges)
+
+        # the state of an address is only created once it is used, so that the
+        # startup does not depend on the size of the memory range
+        self.locks : dict[int, mp.LockItem] = {}  # see get_lock_item
+        self.locks_lock = th.Lock()
+        # addresses without copy holders are not in it
+        self.copy_holders : dict[int, list[tuple[str, int]]] = {}
+
+        # number of lock acquisitions per address, i.e. the load of the address,
+        # used to decide which memory ranges should move to other servers
+        self.access_counts : dict[int, int] = {}
+
+        # a running snapshot visits the addresses one by one while writes go on. Before
+        # an address that was not visited yet is modified, its state is preserved so
+        # that the snapshot sees the memory as it was when it started (copy-on-write)
+        self.snapshot_lock = th.Lock()
+        self.snapshot_pending = None  # addresses not visited yet, None if no snapshot is running
+        self.snapshot_preimages = {}  # address -> state before the first modification
+        self.snapshot_running = th.Lock()
+
+        # recent versions of the written addresses, for reads as of a timestamp
+        # (see read_version). Each address has a tuple of (version time, wtag, data),
+        # oldest first, that writers replace as a whole, so readers take no lock
+        self.max_versions = max_versions
+        self.version_retention = int(version_retention * 1e9)  # nanoseconds
+        self.versions : dict[int, tuple] = {}
+        # addresses with writes whose version time is not known yet (prepared
+        # transactions, see prepare_versions) -> (time before theirs, Deferred resolved once known)
+        self.pending_versions : dict[int, tuple[int, dfr.Deferred]] = {}
+
+        wtags = {} if snapshot_path is None else self.restore(snapshot_path)
+
+        # writes are logged before they are applied, so that they survive a crash
+        self.wal = wal
+        if self.wal is not None:
+            self._recover(wtags, restored=snapshot_path is not None)
 
-        self.memory = {
-            i: mp.MemoryItem(
-                data=None,
-                status="E",
+    def _hold_ranges(self, held_ranges: list[tuple[int, int]]):
+        """
+        Description: hold the given memory ranges instead of the memory range. The
+        items of addresses from other servers start empty, their values are in the
+        write-ahead log (see import_items).
+        """
+        held = [(start, end) for start, end in sorted(held_ranges) if start < end]
+        position = self.memory_range[0]
+        for start, end in held + [(self.memory_range[1], self.memory_range[1])]:
+            for address in range(position, min(start, self.memory_range[1])):
+                self.memory.pop(address, None)
+            position = max(position, end)
+            # the addresses of the memory range are held already
+            outside = (
+                range(start, min(end, self.memory_range[0])),
+                range(max(start, self.memory_range[1]), end),
             )
-            for i in range(self.memory_range[0], self.memory_range[1])
-        }
+            for address in itertools.chain(*outside):
+                # older than any logged write of the address
+                self.memory[address] = mp.MemoryItem(data=None, status="E", wtag=0)
 
-        self.locks = {
-            i: mp.LockItem() for i in range(self.memory_range[0], self.memory_range[1])
-        }
+    def _recover(self, wtags: dict[int, int], restored: bool):
+        """
+        Description: apply the writes found in the write-ahead log and start logging.
+        A record is only applied if it is newer than what we hold, the items of a
+        persistent store (or a restored snapshot) may already contain the latest writes.
+        Records are ordered as merge_write orders the writes (last-writer-wins), so
+        that the records of writes that lost a merge lose again.
+        The memory is only checkpointed if it differs from the last checkpoint, i.e.
+        a logged write was applied or a snapshot was restored.
+        """
+        replayed = False  # a logged write was applied, the checkpoint is out of date
+        for address, wtag, data, logged in self.wal.records():
+            if address not in self.memory:
+                continue
+            if address not in wtags:
+                stored = isinstance(self.memory, ps.StoredItems)
+                wtags[address] = self.memory[address].wtag if stored else -1
+            if wtag < wtags[address]:
+                continue
+            item = self.memory[address]
+            # the data is only compared when the wtags are the same
+            if wtag == wtags[address] and not item.loses_to(data, wtag):
+                continue
+            wtags[address] = wtag
+            item.write(data, wtag)
+            replayed = replayed or logged
 
-        self.copy_holders : dict[int, list[tuple[str, int]]] = {
-            i: [] for i in range(self.memory_range[0], self.memory_range[1])
-        }
+        if isinstance(self.memory, ps.StoredItems):
+            # the log starts empty, the writes of the store that it held must be on disk
+            self.memory.store.flush()
+        self.wal.start(
+            lambda: [
+                (address, self.memory[address].wtag, self.memory[address].data)
+                for address in list(self.memory.keys())
+            ],
+            # the items restored from a snapshot are not in the checkpoint either
+            checkpoint=replayed or restored,
+        )
 
     def read_memory(self, address: int) -> None | mp.MemoryItem:
         if address not in self.memory:
             return None
         return self.memory[address]
     
-    def write_memory(self, address: int, data) -> None | mp.MemoryItem:
+    def read_item(self, address: int) -> None | tuple[dict, bytes]:
+        """
+        Description: read an address without taking its lock, for eventually
+        consistent addresses (see merge_write). The data and wtag are those of
+        the same write.
+
+        Return:
+        - the fields of the item and their encoding, see MemoryItem.encoded_json
+        """
         if address not in self.memory:
             return None
-        self.memory[address].data = data
-        self.memory[address].wtag += 1
-        return self.memory[address]
-    
-    def acquire_lock(self, address: int, lease_seconds=None) -> tuple[bool, int, int]:
+        with self.snapshot_lock:
+            return self.memory[address].encoded_json()
+
+    def write_memory(
+        self, address: int, data, version_time: None | int = None
+    ) -> None | mp.MemoryItem:
+        """
+        version_time: time of the version of the write, now if None (see prepare_versions)
+        """
+        items = self.write_many([(address, data)], version_time)
+        return None if items is None else items[0]
+
+    def write_many(
+        self, writes: list, version_time: None | int = None
+    ) -> None | list[mp.MemoryItem]:
+        """
+        Description: apply several writes together, e.g. the writes of a transaction.
+        They are logged as one record before any of them is applied, so that a crash
+        keeps either all of them or none. Raises OSError if the log cannot be
+        written, no write is applied then.
+
+        writes: list of [address, data]
+        version_time: time of the version of the writes, now if None (see prepare_versions)
+
+        Return:
+        - the written items, None if an address is not held (nothing is written then)
+        """
+        if any(address not in self.memory for address, _ in writes):
+            return None
+        items = [self.memory[address] for address, _ in writes]
+        # the wtag is a timestamp of the hybrid logical clock, newer than the
+        # previous one even if it was set by another server or before a restart
+        wtags = [tu.get_time(item.wtag) for item in items]
+        if self.wal is not None:
+            generation = self.wal.log_many(
+                [(address, wtag, data) for (address, data), wtag in zip(writes, wtags)]
+            )
+        try:
+            with self.snapshot_lock:
+                for (address, data), item, wtag in zip(writes, items, wtags):
+                    self._preserve(address)
+                    if self.max_versions > 0 and address not in self.versions:
+                        # the value before the first write is the one of all older snapshots
+                        self.versions[address] = ((0, item.wtag, item.data),)
+                    item.write(data, wtag)
+                    if self.max_versions > 0:
+                        self._add_version(address, item.wtag, data, version_time)
+        finally:
+            # a checkpoint waits for the logged writes to be applied
+            if self.wal is not None:
+                self.wal.applied(generation)
+        return items
+
+    def merge_write(self, address: int, data, wtag: int) -> bool:
+        """
+        Description: apply a write of an eventually consistent address, stamped
+        with wtag by the server that accepted it. Writes are applied without
+        the lock of the address and in any order, the last writer wins (see
+        memory_primitives.lww_order), so all the copies end with the same value.
+
+        Return:
+        - True if the write replaced the value of the address
+        """
+        if address not in self.memory:
+            return False
+        item = self.memory[address]
+        if not item.loses_to(data, wtag):
+            return False
+        # the log is not written under the snapshot lock, a write that loses to one
+        # merged meanwhile stays in it and loses again when the log is replayed (see _recover)
+        if self.wal is not None:
+            generation = self.wal.log(address, wtag, data)
+        try:
+            with self.snapshot_lock:
+                if not item.loses_to(data, wtag):
+                    return False  # a newer write was merged meanwhile
+                self._preserve(address)
+                if self.max_versions > 0 and address not in self.versions:
+                    self.versions[address] = ((0, item.wtag, item.data),)
+                item.write(data, wtag)
+                if self.max_versions > 0:
+                    self._add_version(address, wtag, data)
+        finally:
+            if self.wal is not None:
+                self.wal.applied(generation)
+        return True
+
+    def _add_version(
+        self, address: int, wtag: int, data, version_time: None | int = None
+    ) -> None:
+        """
+        Description: add the version of a write, the snapshot lock must be held so
+        that a version is visible as soon as its time is (see version_time).
+        Versions are garbage collected when there are more than max_versions, or
+        when the next version is older than version_retention: they would only
+        serve snapshots older than that.
+        """
+        now = tu.get_time()
+        versions = self.versions.get(address, ())
+        if version_time is None:
+            version_time = now
+        if versions:
+            # versions of an address keep growing, even if another server set the time
+            version_time = max(version_time, versions[-1][0] + 1)
+        versions = versions[max(0, len(versions) - self.max_versions + 1) :]
+        horizon = now - self.version_retention
+        start = 0
+        while start < len(versions) - 1 and versions[start + 1][0] <= horizon:
+            start += 1
+        self.versions[address] = versions[start:] + ((version_time, wtag, data),)
+
+    def prepare_versions(self, addresses) -> int:
+        """
+        Description: announce writes to addresses whose version time is decided
+        later, e.g. by the two-phase commit of a transaction that writes several
+        servers, so that all the writes have the same version time. The locks of
+        the addresses must be held. Reads as of a time after the returned one
+        must wait until finish_versions is called, see pending_version.
+
+        Return:
+        - the time that the version time of the writes must not be older than
+        """
+        with self.snapshot_lock:
+            prepare_time = tu.get_time()
+            if self.max_versions > 0:
+                pending = (prepare_time, dfr.Deferred())
+                for address in addresses:
+                    self.pending_versions[address] = pending
+        return prepare_time
+
+    def finish_versions(self, addresses) -> None:
+        """
+        Description: the announced writes are done (or will not happen), see prepare_versions
+        """
+        for address in addresses:
+            pending = self.pending_versions.pop(address, None)
+            if pending is not None:
+                pending[1].resolve(None)
+
+    def pending_version(self, address: int, timestamp: int) -> None | dfr.Deferred:
+        """
+        Return:
+        - a Deferred resolved once the value of the address as of timestamp is
+        known, if a prepared write may still add a version before timestamp
+        (see prepare_versions), None if read_version can be called
+        """
+        pending = self.pending_versions.get(address, None)
+        if pending is not None and pending[0] <= timestamp:
+            return pending[1]
+        return None
+
+    def version_time(self, timestamp: int = 0) -> int:
+        """
+        Description: the clock is moved past timestamp, so that later writes get
+        newer versions
+
+        Return:
+        - a time (not older than timestamp) such that the versions of all the
+        writes up to it are visible, reads as of this time or an older one always
+        return the same value
+        """
+        with self.snapshot_lock:
+            tu.clock.update(timestamp)
+            return tu.get_time()
+
+    def read_version(self, address: int, timestamp: int) -> None | tuple:
+        """
+        Description: read the value of an address as of a time, without taking
+        a lock, see version_time and pending_version. Addresses that were not
+        written since the memory manager started (or took them over) have no
+        versions, their value holds for any time.
+
+        Return:
+        - (data, wtag), None if the versions of that time were garbage collected
+        """
+        if address not in self.memory:
+            return None
+        versions = self.versions.get(address, ())
+        if not versions:
+            item = self.memory[address]
+            data, wtag = item.data, item.wtag
+            # a write adds the versions before it changes the item
+            versions = self.versions.get(address, ())
+            if not versions:
+                return data, wtag
+        for version_time, wtag, data in reversed(versions):
+            if version_time <= timestamp:
+                return data, wtag
+        return None
+
+    def acquire_lock(
+        self, address: int, lease_seconds=None, timeout=None
+    ) -> tuple[bool, int, int]:
         """
+        timeout: seconds to wait for the lock, None waits as long as needed, 0 only tries
+
         Return:
         - ret_val: True if the lock is acquired, False otherwise
         - ltag: the lock tag
         - wtag: the write tag
         """
-        if address not in self.locks:
+        lock_item = self.get_lock_item(address)
+        if lock_item is None:
+            return False, -1, -1
+        with metrics.Timer("lock_wait_seconds"), tracing.span("lock_wait", address=address):
+            ret_val, ltag = lock_item.acquire_lock(timeout, lease_seconds)
+        return self._lock_granted(lock_item, address, ret_val, ltag, lease_seconds)
+
+    def acquire_lock_deferred(
+        self, address: int, callback, lease_seconds=None, timeout=None
+    ) -> None | tuple[bool, int, int]:
+        """
+        Description: acquire the lock of an address without blocking the calling
+        thread. If the lock is held, the request is queued and callback(ret_val,
+        ltag, wtag) is called once the lock is handed over to it, or with ret_val
+        False once timeout seconds passed.
+
+        Return:
+        - (ret_val, ltag, wtag) as acquire_lock if the request did not wait, None if it is queued
+        """
+        lock_item = self.get_lock_item(address)
+        if lock_item is None:
             return False, -1, -1
-        ret_val, ltag = self.locks[address].acquire_lock()
+        start_time = time.perf_counter()
+
+        def granted(ret_val, ltag):
+            metrics.registry.observe("lock_wait_seconds", time.perf_counter() - start_time)
+            callback(*self._lock_granted(lock_item, address, ret_val, ltag, lease_seconds))
+
+        waiter = mp.LockWaiter(granted, lease_seconds)
+        ltag = lock_item.enqueue(waiter)
+        if ltag is not None:
+            return self._lock_granted(lock_item, address, True, ltag, lease_seconds)
+        if timeout is not None:
+            sc.scheduler.call_later(timeout, self._end_wait, lock_item, waiter)
+        return None
+
+    def _end_wait(self, lock_item: mp.LockItem, waiter: mp.LockWaiter):
+        if lock_item.cancel(waiter):
+            waiter.callback(False, -1)
+
+    def _lock_granted(
+        self, lock_item: mp.LockItem, address: int, ret_val: bool, ltag: int, lease_seconds
+    ) -> tuple[bool, int, int]:
+        if not ret_val:
+            return False, -1, -1
+
+        if self.locks.get(address, None) is not lock_item:
+            # the address was moved to another server while we were waiting
+            # for its lock (see remove_items), the lock item is not used anymore
+            lock_item.release_lock(ltag)
+            return False, -1, -1
+        self.access_counts[address] = self.access_counts.get(address, 0) + 1
 
         # the lease seconds applies if the lock is acquired by a remote client
         # this client could potentially fail and keep the lock forever, thus
-        # we release the lock after the lease_seconds
-        if ret_val and lease_seconds is not None:
-            # ensure thread safety
+        # we release the lock after the lease_seconds, unless the lease is renewed
+        # (see renew_lease), in which case the timer is started again
+        if lease_seconds is not None:
             def timer_callback(_ltag, _address):
-                val, _ = self.locks[_address].release_lock(_ltag)
+                val, remaining = lock_item.expire_lease(_ltag)
                 if val:
-                    print(f"[LOCK TIMER] lock released for address {_address}")
-            th.Timer(lease_seconds, timer_callback, args=(ltag, address)).start()
+                    self.log.info("LOCK_TIMER", address=_address)
+                elif remaining > 0:
+                    sc.scheduler.call_later(remaining, timer_callback, _ltag, _address)
+            sc.scheduler.call_later(lease_seconds, timer_callback, ltag, address)
 
-        return ret_val, ltag, self.memory[address].wtag
+        return True, ltag, self.memory[address].wtag
     
     def release_lock(self, address: int, lease_ltag) -> tuple[bool, int, int]:
         """
@@ -69,34 +436,66 @@ class MemoryManager:
         - ltag: the lock tag
         - wtag: the write tag
         """
-        if address not in self.locks:
-            return False, -1, -1
+        lock_item = self.locks.get(address, None)
+        if lock_item is None or address not in self.memory:
+            return False, -1, -1  # never locked, or moved to another server
         wtag = self.memory[address].wtag
-        ret_val, ltag = self.locks[address].release_lock(lease_ltag)
+        ret_val, ltag = lock_item.release_lock(lease_ltag)
         return ret_val, ltag, wtag
     
+    def renew_lease(self, address: int, lease_ltag, lease_seconds) -> bool:
+        """
+        Return:
+        - True if lease_ltag still holds the lock and its lease was extended
+        """
+        lock_item = self.locks.get(address, None)
+        if lock_item is None:
+            return False
+        return lock_item.renew_lease(lease_ltag, lease_seconds)
+
+    def get_lock_item(self, address: int) -> None | mp.LockItem:
+        """
+        Description: the lock of an address, created on its first use
+
+        Return:
+        - None if the address is not held
+        """
+        lock_item = self.locks.get(address, None)
+        if lock_item is not None:
+            return lock_item
+        # checked under the lock, so that remove_items never leaves a lock behind
+        with self.locks_lock:
+            if address not in self.memory:
+                return None
+            return self.locks.setdefault(address, mp.LockItem())
+
     def set_status(self, address: int, status: str) -> bool:
         if address not in self.memory:
             return False
-        self.memory[address].status = status
+        with self.snapshot_lock:
+            self._preserve(address)
+            self.memory[address].status = status
         return True
 
     def get_copy_holders(self, address: int) -> list[tuple[str, int]]:
-        if address not in self.copy_holders:
-            return []
-        return self.copy_holders[address].copy()
+        return list(self.copy_holders.get(address, ()))
     
     def add_copy_holder(self, address: int, holder: tuple[str, int]) -> bool:
         """
         Return:
         - True: if the holder is in the copy_holders list
         """
-        if address not in self.copy_holders:
+        if address not in self.memory:
             return False
-        if holder in self.copy_holders[address]:
+        if holder in self.copy_holders.get(address, ()):
             return True
-        self.copy_holders[address].append(holder)
-        self.memory[address].status = "S"
+        with self.snapshot_lock:
+            copy_holders = self.copy_holders.setdefault(address, [])
+            if holder in copy_holders:
+                return True  # added meanwhile
+            self._preserve(address)
+            copy_holders.append(holder)
+            self.memory[address].status = "S"
         return True
     
     def remove_copy_holder(self, address: int, holder: tuple[str, int]) -> bool:
@@ -104,12 +503,195 @@ class MemoryManager:
         Return:
         - True: if the holder is not in the copy_holders list
         """
-        if address not in self.copy_holders:
+        if address not in self.memory:
             return False
-        if holder not in self.copy_holders[address]:
+        if holder not in self.copy_holders.get(address, ()):
             return True
-        self.copy_holders[address].remove(holder)
-        if len(self.copy_holders[address]) == 0:
-            self.memory[address].status = "E"
+        with self.snapshot_lock:
+            copy_holders = self.copy_holders.get(address, [])
+            if holder not in copy_holders:
+                return True  # removed meanwhile
+            self._preserve(address)
+            copy_holders.remove(holder)
+            if len(copy_holders) == 0:
+                del self.copy_holders[address]
+                self.memory[address].status = "E"
         return True
-    
\ No newline at end of file
+
+    def owned_ranges(self) -> list[tuple[int, int]]:
+        """
+        Return:
+        - the contiguous memory ranges held by the memory manager
+        """
+        ranges = []
+        for address in sorted(self.memory.keys()):
+            if ranges and ranges[-1][1] == address:
+                ranges[-1][1] = address + 1
+            else:
+                ranges.append([address, address + 1])
+        return [(start, end) for start, end in ranges]
+
+    def export_items(self, addresses) -> list[list]:
+        """
+        Description: Export the state of memory addresses so that another memory
+        manager can take them over. The locks of the addresses should be held.
+
+        Return:
+        - a list of [address, data, status, wtag, ltag, copy_holders]
+        """
+        return [
+            [
+                address,
+                self.memory[address].data,
+                self.memory[address].status,
+                self.memory[address].wtag,
+                self.get_lock_item(address).ltag,
+                self.get_copy_holders(address),
+            ]
+            for address in addresses
+        ]
+
+    def import_items(self, items: list[list]) -> None:
+        """
+        Description: Take over memory addresses exported by another memory manager.
+        The items are logged before they are applied, the owner of the memory
+        ranges must be saved too (see WriteAheadLog.save_routing) for them to be
+        held again after a restart.
+        Raises OSError if the log cannot be written, no item is imported then.
+        """
+        if self.wal is not None:
+            generation = self.wal.log_many([(item[0], item[3], item[1]) for item in items])
+        try:
+            self._import_items(items)
+        finally:
+            if self.wal is not None:
+                self.wal.applied(generation)
+
+    def _import_items(self, items: list[list]) -> None:
+        for address, data, status, wtag, ltag, copy_holders in items:
+            lock_item = mp.LockItem()
+            # lock tags must keep growing, so that old leases stay invalid
+            lock_item.ltag = max(lock_item.ltag, ltag + 1)
+            self.memory[address] = mp.MemoryItem(
+                data=data,
+                status=status,
+                wtag=wtag,
+            )
+            with self.locks_lock:
+                self.locks[address] = lock_item
+            if copy_holders:
+                self.copy_holders[address] = [
+                    (holder[0], holder[1]) for holder in copy_holders
+                ]
+            self.access_counts.pop(address, None)
+            if self.max_versions > 0:
+                # older snapshots of the address are on the previous owner
+                with self.snapshot_lock:
+                    self.versions.pop(address, None)
+                    self._add_version(address, wtag, data)
+
+    def remove_items(self, addresses) -> None:
+        """
+        Description: Stop holding memory addresses. Requests waiting for the lock of
+        a removed address fail to acquire it once the lock is released.
+        """
+        for address in addresses:
+            with self.snapshot_lock:
+                self._preserve(address)
+            self.memory.pop(address, None)
+            self.copy_holders.pop(address, None)
+            self.access_counts.pop(address, None)
+            with self.locks_lock:
+                self.locks.pop(address, None)
+            self.versions.pop(address, None)
+
+    def get_load(self, bucket_size: int, reset: bool = False) -> list[list[int]]:
+        """
+        Description: Load of the held memory addresses, aggregated in buckets of
+        bucket_size addresses (aligned to multiples of bucket_size)
+
+        Return:
+        - a list of [start, end, access count]
+        """
+        buckets = {}
+        counts = self.access_counts
+        if reset:
+            self.access_counts = {}
+        for address, count in list(counts.items()):
+            start = address - address % bucket_size
+            buckets[start] = buckets.get(start, 0) + count
+        # a bucket spans the held addresses of its range, buckets without accesses
+        # are left out (they have no load to move)
+        bounds = {}
+        for start, end in self.owned_ranges():
+            for bucket_start in range(start - start % bucket_size, end, bucket_size):
+                if bucket_start in buckets:
+                    low, high = bounds.get(bucket_start, (end, start))
+                    bounds[bucket_start] = (
+                        min(low, max(start, bucket_start)),
+                        max(high, min(end, bucket_start + bucket_size)),
+                    )
+        return [
+            [*bounds[bucket_start], buckets[bucket_start]]
+            for bucket_start in sorted(bounds)
+        ]
+
+    def _item_state(self, address: int) -> tuple:
+        item = self.memory[address]
+        return address, item.wtag, item.status, item.data, self.get_copy_holders(address)
+
+    def _preserve(self, address: int) -> None:
+        """
+        Description: keep the state of an address for the running snapshot, if the
+        snapshot did not visit it yet. The snapshot lock must be held.
+        """
+        if (
+            self.snapshot_pending is not None
+            and address in self.snapshot_pending
+            and address not in self.snapshot_preimages
+        ):
+            self.snapshot_preimages[address] = self._item_state(address)
+
+    def snapshot_items(self):
+        """
+        Description: consistent view of the held memory addresses at the time the
+        snapshot starts. Writes are not blocked while the snapshot is read, they
+        preserve the states the snapshot has not visited yet (see _preserve).
+        One snapshot runs at a time.
+
+        Return:
+        - generator of (address, wtag, status, data, copy holders)
+        """
+        with self.snapshot_running:
+            with self.snapshot_lock:
+                addresses = sorted(self.memory.keys())
+                self.snapshot_pending = set(addresses)
+            try:
+                for address in addresses:
+                    with self.snapshot_lock:
+                        state = self.snapshot_preimages.pop(address, None)
+                        if state is None:
+                            state = self._item_state(address)
+                        self.snapshot_pending.discard(address)
+                    yield state
+            finally:
+                with self.snapshot_lock:
+                    self.snapshot_pending = None
+                    self.snapshot_preimages.clear()
+
+    def restore(self, snapshot_path: str) -> dict[int, int]:
+        """
+        Description: load the values and write tags of a snapshot file in one pass.
+        Addresses we do not hold are skipped. Copy holders are not restored: their
+        cached copies are not guaranteed to match the snapshot, they read again.
+
+        Return:
+        - restored address -> wtag
+        """
+        wtags = {}
+        for address, wtag, _, data, _ in sn.read_snapshot(snapshot_path):
+            if address not in self.memory:
+                continue
+            self.memory[address].write(data, wtag)
+            wtags[address] = wtag
+        return wtags
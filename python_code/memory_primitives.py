@@ -1,18 +1,24 @@
+import collections
 import threading as th
+import time
 
+import comm_utils
 import time_utils
 
 
 class MemoryItem:
+    # (fields, encoded fields) of the last encoded_json(), see there
+    encoded = None
+
     def __init__(
         self,
         data,
         status,  # 'E': exclusive, 'S': shared
-        wtag=time_utils.get_time(),  # last write tag
+        wtag=None,  # last write tag, now if None
     ):
         self.data = data
         self.status = status
-        self.wtag = wtag
+        self.wtag = time_utils.get_time() if wtag is None else wtag
 
     def __str__(self) -> str:
         return f"{self.data}, {self.status}"
@@ -28,31 +34,165 @@ class MemoryItem:
             "wtag": self.wtag,
         }
 
+    def encoded_json(self) -> tuple[dict, bytes]:
+        """
+        Description: json() and its encoding (see comm_utils.PreEncoded). They are
+        kept until the item changes, its wtag, status or data, so that an item that
+        is read many times is encoded once per write.
+        """
+        encoded = self.encoded
+        if (
+            encoded is not None
+            and encoded[0]["wtag"] == self.wtag
+            and encoded[0]["istatus"] == self.status
+            and encoded[0]["data"] is self.data
+        ):
+            return encoded
+        fields = self.json()
+        encoded = (fields, comm_utils.encode_fields(fields))
+        # only keep an encoding of one write, not of a write made while we encoded
+        if (
+            fields["wtag"] == self.wtag
+            and fields["istatus"] == self.status
+            and fields["data"] is self.data
+        ):
+            self.encoded = encoded
+        return encoded
+
+    def write(self, data, wtag: int):
+        """
+        Description: set the data and the wtag of a write
+        """
+        self.data = data
+        self.wtag = wtag
+
+    def loses_to(self, data, wtag) -> bool:
+        """
+        Return:
+        - True if the write of data with the given wtag replaces the item under
+        the last-writer-wins rule (see lww_order)
+        """
+        return lww_order(data, wtag) > lww_order(self.data, self.wtag)
+
+
+def lww_order(data, wtag) -> tuple:
+    """
+    Description: order of the writes of eventually consistent addresses, the
+    write with the largest wtag wins. Concurrent writes of different servers can
+    have the same wtag, the tie is broken by the data, so that every server
+    keeps the same value whatever order it receives the writes in.
+    """
+    return wtag, repr(data)
+
+
+class LockWaiter:
+    """
+    Description: request waiting for the lock of an item, see LockItem.enqueue
+    """
+
+    def __init__(self, callback, lease_seconds: None | float = None):
+        self.callback = callback  # callback(success, ltag), when the lock is granted or the wait ends
+        self.lease_seconds = lease_seconds
+
 
 class LockItem:
     def __init__(self):
         self.lock = th.Lock() # lock for the item
         self.condition = th.Condition() # condition + lock that protect the (item) lock
         self.ltag = time_utils.get_time()  # last lock tag
+        self.lease_deadline = None  # time.monotonic() at which the lease of the holder expires
+        # requests waiting for the lock, in arrival order. A released lock is handed
+        # over to the first waiter, so waiting takes no thread (see enqueue)
+        self.waiters = collections.deque()
+
+    def enqueue(self, waiter: LockWaiter) -> None | int:
+        """
+        Description: This function acquires the lock for the item if it is free,
+        otherwise the waiter is queued and its callback is called (from the thread
+        that releases the lock) once the lock is handed over to it.
 
-    def acquire_lock(self) -> tuple[bool, int]:
+        return: the ltag if the lock was free, None if the waiter is queued
         """
-        Description: This function acquires the lock for the item.
+        with self.condition:
+            if self.waiters or not self.lock.acquire(blocking=False):
+                self.waiters.append(waiter)
+                return None
+            return self._grant(waiter.lease_seconds)
+
+    def cancel(self, waiter: LockWaiter) -> bool:
+        """
+        Description: This function stops the wait of a queued waiter.
+
+        return: False if the lock was already handed over to the waiter
+        """
+        with self.condition:
+            try:
+                self.waiters.remove(waiter)
+                return True
+            except ValueError:
+                return False
+
+    def acquire_lock(
+        self, timeout: None | float = None, lease_seconds: None | float = None
+    ) -> tuple[bool, int]:
+        """
+        Description: This function acquires the lock for the item, waiting in
+        line with the queued waiters.
+
+        timeout: seconds to wait for the lock, None waits as long as needed, 0 only tries
+        lease_seconds: duration of the lease of the lock, see expire_lease
 
         return: (bool, int) -> (success, ltag)
         """
-        ret_val, ltag = False, -1
-        # we want to acquire the lock and increment the ltag atomically
-        # thus we use a condition variable to wait until the lock is acquired
-        # and then increment the ltag
         with self.condition:
-            while self.lock.acquire(blocking=False) is False:
-                self.condition.wait()
-            ret_val = True
-            self.ltag += 1
-            ltag = self.ltag
+            if not self.waiters and self.lock.acquire(blocking=False):
+                return True, self._grant(lease_seconds)
 
-        return ret_val, ltag
+        granted = th.Event()
+        result = [False, -1]
+
+        def callback(ret_val, ltag):
+            result[:] = [ret_val, ltag]
+            granted.set()
+
+        waiter = LockWaiter(callback, lease_seconds)
+        ltag = self.enqueue(waiter)
+        if ltag is not None:
+            return True, ltag
+        if not granted.wait(timeout) and self.cancel(waiter):
+            return False, -1
+        granted.wait()  # the lock was handed over while we stopped waiting
+        return result[0], result[1]
+
+    def renew_lease(self, lease_ltag, lease_seconds: float) -> bool:
+        """
+        Description: This function extends the lease of the holder of the lock
+        to lease_seconds from now.
+
+        return: False if lease_ltag does not hold the lock (anymore)
+        """
+        with self.condition:
+            if self.ltag != lease_ltag or not self.lock.locked():
+                return False
+            self.lease_deadline = time.monotonic() + lease_seconds
+            return True
+
+    def expire_lease(self, lease_ltag) -> tuple[bool, float]:
+        """
+        Description: This function releases the lock if the lease of lease_ltag is over.
+
+        return: (bool, float) -> (released, seconds left on a renewed lease, 0 otherwise)
+        """
+        with self.condition:
+            if self.ltag != lease_ltag or not self.lock.locked():
+                return False, 0  # already released
+            if self.lease_deadline is not None:
+                remaining = self.lease_deadline - time.monotonic()
+                if remaining > 0:
+                    return False, remaining
+            ret_val, _, handed_over = self._release(lease_ltag)
+        self._notify(handed_over)
+        return ret_val, 0
 
     def release_lock(self, lease_ltag) -> tuple[bool, int]:
         """
@@ -60,23 +200,44 @@ class LockItem:
 
         return: (bool, int) -> (success, ltag)
         """
-        ret_val, ltag = False, -1
-        # again we want to release the lock and update the ltag atomically
-        # thus we use acquire the condition variable's lock before releasing the item's lock
         with self.condition:
-            ltag = self.ltag
-            # we only release the lock if the lease_ltag is the same as the current ltag
-            # this is to prevent a client from releasing the lock if it has been acquired by another client
-            # senario where this happens is: client1 acquires the lock, client1 loses connection, the timer
-            # expires and releases the lock, client2 acquires the lock, client1 reconnects and releases the lock
+            ret_val, ltag, handed_over = self._release(lease_ltag)
+        self._notify(handed_over)
+        return ret_val, ltag
+
+    def _grant(self, lease_seconds: None | float) -> int:
+        # the lock is held, the ltag of the new holder is the next one
+        self.ltag = time_utils.get_time(self.ltag)
+        self.lease_deadline = (
+            None if lease_seconds is None else time.monotonic() + lease_seconds
+        )
+        return self.ltag
+
+    def _release(self, lease_ltag) -> tuple[bool, int, None | tuple[LockWaiter, int]]:
+        # we want to release the lock and update the ltag atomically,
+        # the condition variable's lock is held by the caller
+        ret_val, ltag, handed_over = False, self.ltag, None
+        # we only release the lock if the lease_ltag is the same as the current ltag
+        # this is to prevent a client from releasing the lock if it has been acquired by another client
+        # senario where this happens is: client1 acquires the lock, client1 loses connection, the timer
+        # expires and releases the lock, client2 acquires the lock, client1 reconnects and releases the lock
 
-            # This senario cannot happen because the new ltag will be different than the one client1 has.
-            if self.ltag == lease_ltag:
-                self.ltag += 1
+        # This senario cannot happen because the new ltag will be different than the one client1 has.
+        if self.ltag == lease_ltag:
+            self.ltag = time_utils.get_time(self.ltag)
 
-                ret_val = True
-                ltag = self.ltag
+            ret_val = True
+            ltag = self.ltag
+            if self.waiters:
+                # the lock stays held and goes to the first waiter
+                waiter = self.waiters.popleft()
+                handed_over = (waiter, self._grant(waiter.lease_seconds))
+            else:
                 self.lock.release()
-                self.condition.notify_all()
+        return ret_val, ltag, handed_over
 
-        return ret_val, ltag
+    def _notify(self, handed_over: None | tuple[LockWaiter, int]):
+        # called without holding the condition, the callback may take other locks
+        if handed_over is not None:
+            waiter, ltag = handed_over
+            waiter.callback(True, ltag)
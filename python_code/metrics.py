@@ -0,0 +1,194 @@
+import os
+import threading as th
+import time
+
+# histogram buckets are log-linear (HDR style): values below 2 ** SUB_BUCKET_BITS get
+# a bucket each, above that every power of two is split in 2 ** (SUB_BUCKET_BITS - 1)
+# buckets, so a recorded value is off by at most 1 / 2 ** (SUB_BUCKET_BITS - 1) (12.5%)
+SUB_BUCKET_BITS = 4
+SUB_BUCKETS = 1 << (SUB_BUCKET_BITS - 1)
+QUANTILES = (0.5, 0.9, 0.99, 0.999)
+
+
+def bucket_index(value: int) -> int:
+    if value < 2 * SUB_BUCKETS:
+        return max(value, 0)
+    shift = value.bit_length() - SUB_BUCKET_BITS
+    return shift * SUB_BUCKETS + (value >> shift)
+
+
+def bucket_value(index: int) -> int:
+    """
+    Return:
+    - the highest value that falls in the bucket
+    """
+    if index < 2 * SUB_BUCKETS:
+        return index
+    shift = index // SUB_BUCKETS - 1
+    mantissa = index % SUB_BUCKETS + SUB_BUCKETS
+    return ((mantissa + 1) << shift) - 1
+
+
+class Histogram:
+    """
+    Description: latency histogram in microseconds with log-linear buckets.
+    Recording a value is a bucket index computation and a counter increment.
+    """
+
+    def __init__(self):
+        self.counts = {}
+        self.count = 0
+        self.sum = 0.0  # seconds
+        self.max = 0
+        self.lock = th.Lock()
+
+    def record(self, seconds: float):
+        microseconds = int(seconds * 1_000_000)
+        index = bucket_index(microseconds)
+        with self.lock:
+            self.counts[index] = self.counts.get(index, 0) + 1
+            self.count += 1
+            self.sum += seconds
+            self.max = max(self.max, microseconds)
+
+    def quantile(self, q: float) -> float:
+        """
+        Return:
+        - the value (in seconds) below which a fraction q of the recorded values are
+        """
+        with self.lock:
+            counts = sorted(self.counts.items())
+            count = self.count
+        if count == 0:
+            return 0.0
+        rank = q * count
+        seen = 0
+        for index, bucket_count in counts:
+            seen += bucket_count
+            if seen >= rank:
+                return min(bucket_value(index), self.max) / 1_000_000
+        return self.max / 1_000_000
+
+
+class Metrics:
+    """
+    Description: registry of the latency histograms and counters of a process.
+    Every metric is identified by its name and its labels, e.g.
+    ("request_latency_seconds", (("op", "serve_read"), ("served", "local"))).
+    """
+
+    def __init__(self):
+        self.histograms = {}
+        self.counters = {}
+        self.lock = th.Lock()
+
+    def observe(self, name: str, seconds: float, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        histogram = self.histograms.get(key, None)
+        if histogram is None:
+            with self.lock:
+                histogram = self.histograms.setdefault(key, Histogram())
+        histogram.record(seconds)
+
+    def increment(self, name: str, amount: int = 1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + amount
+
+    def json(self) -> dict:
+        """
+        Description: the metrics as a dictionary, to be sent over the network
+        """
+        with self.lock:
+            histograms = list(self.histograms.items())
+            counters = list(self.counters.items())
+        return {
+            "histograms": [
+                {
+                    "name": name,
+                    "labels": dict(labels),
+                    "count": histogram.count,
+                    "sum": histogram.sum,
+                    "max": histogram.max / 1_000_000,
+                    "quantiles": {str(q): histogram.quantile(q) for q in QUANTILES},
+                }
+                for (name, labels), histogram in sorted(histograms)
+            ],
+            "counters": [
+                {"name": name, "labels": dict(labels), "value": value}
+                for (name, labels), value in sorted(counters)
+            ],
+        }
+
+    def prometheus(self, prefix: str = "edcs_", **extra_labels) -> str:
+        """
+        Description: the metrics in the Prometheus text format. Histograms are
+        exported as summaries (quantiles, sum and count).
+        """
+        def format_labels(labels: dict) -> str:
+            labels = {**extra_labels, **labels}
+            if not labels:
+                return ""
+            return "{" + ",".join(f'{key}="{value}"' for key, value in labels.items()) + "}"
+
+        content = self.json()
+        lines = []
+        typed = set()
+        for histogram in content["histograms"]:
+            name = prefix + histogram["name"]
+            if name not in typed:
+                lines.append(f"# TYPE {name} summary")
+                typed.add(name)
+            for q, value in histogram["quantiles"].items():
+                labels = format_labels({**histogram["labels"], "quantile": q})
+                lines.append(f"{name}{labels} {value}")
+            labels = format_labels(histogram["labels"])
+            lines.append(f"{name}_sum{labels} {histogram['sum']}")
+            lines.append(f"{name}_count{labels} {histogram['count']}")
+        for counter in content["counters"]:
+            name = prefix + counter["name"]
+            if name not in typed:
+                lines.append(f"# TYPE {name} counter")
+                typed.add(name)
+            lines.append(f"{name}{format_labels(counter['labels'])} {counter['value']}")
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus_file(self, path: str, interval: float, **extra_labels):
+        """
+        Description: rewrite a Prometheus text file every interval seconds
+        (e.g. for the node exporter textfile collector), in a daemon thread
+        """
+        def export():
+            while True:
+                time.sleep(interval)
+                temporary_path = path + ".tmp"
+                with open(temporary_path, "w") as f:
+                    f.write(self.prometheus(**extra_labels))
+                os.replace(temporary_path, path)
+
+        th.Thread(target=export, daemon=True).start()
+
+
+# metrics of this process, shared by the modules that record them
+registry = Metrics()
+
+
+class Timer:
+    """
+    Description: context manager recording the time spent in its block
+
+    with Timer("lock_wait_seconds", op="serve_read"):
+        ...
+    """
+
+    def __init__(self, name: str, **labels):
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        registry.observe(self.name, time.perf_counter() - self.start, **self.labels)
+        return False
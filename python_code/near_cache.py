@@ -0,0 +1,208 @@
+import socket
+import threading as th
+import time
+
+import comm_utils as cu
+import global_variables as gv
+
+CONNECTION_TIMEOUT = gv.CONNECTION_TIMEOUT
+COPY_EXPIRY_UPDATES = gv.COPY_EXPIRY_UPDATES
+NEAR_CACHE_TTL = gv.NEAR_CACHE_TTL
+
+
+class NearCache:
+    """
+    Description: client side cache of memory items.
+
+    The client registers itself as a copy holder with the owner of every address
+    it caches, using the address of a small listener as copy holder address. The
+    owner then pushes updates to the listener through the usual update chain
+    (serve_update_cache), exactly as it does for the caches of other servers, so
+    cached reads can be served in-process.
+
+    Entries are also refreshed from the owner after NEAR_CACHE_TTL seconds. This
+    bounds staleness when the owner stops sending us updates without us knowing,
+    e.g. when an earlier copy holder in the update chain failed.
+
+    Writes of eventually consistent addresses are pushed in batches instead
+    (serve_lww_update), see Server._send_eventual_updates.
+    """
+
+    def __init__(self, listener_ip: str):
+        # address -> [data, istatus, wtag, expiration time, updates since last read]
+        self.items = {}
+        self.lock = th.Lock()
+
+        self.listener_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.listener_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.listener_socket.bind((listener_ip, 0))
+        self.listener_socket.listen()
+        self.listener_address = self.listener_socket.getsockname()
+        self.running = True
+
+        th.Thread(target=self._accept_updates, daemon=True).start()
+
+    def read(self, memory_address: int) -> None | dict:
+        """
+        Description: Read an item, None if it is not cached or it has expired
+        """
+        with self.lock:
+            item = self.items.get(memory_address, None)
+            if item is None or item[3] < time.monotonic():
+                return None
+            item[4] = 0
+            return {"data": item[0], "istatus": item[1], "wtag": item[2]}
+
+    def write(self, memory_address: int, data, istatus: str, wtag: int):
+        """
+        Description: Store an item unless we already hold a newer version of it.
+        A pushed update may overtake the response of the read that registered us.
+        """
+        with self.lock:
+            item = self.items.get(memory_address, None)
+            if item is not None and item[2] > wtag:
+                return
+            expiration = time.monotonic() + NEAR_CACHE_TTL
+            update_count = 0 if item is None else item[4]
+            self.items[memory_address] = [data, istatus, wtag, expiration, update_count]
+
+    def addresses(self) -> list[int]:
+        with self.lock:
+            return list(self.items.keys())
+
+    def close(self):
+        self.running = False
+        self.listener_socket.close()
+
+    def _accept_updates(self):
+        while self.running:
+            try:
+                server_socket, _ = self.listener_socket.accept()
+            except OSError:
+                break
+            th.Thread(
+                target=self._handle_server, args=(server_socket,), daemon=True
+            ).start()
+
+    def _handle_server(self, server_socket: socket.socket):
+        """
+        Description: serve the update chain messages sent by the servers
+        """
+        try:
+            while True:
+                message = cu.rec_msg(server_socket)
+                if message["type"] == "disconnect":
+                    cu.send_msg(
+                        server_socket, {"status": gv.SUCCESS, "message": "disconnected"}
+                    )
+                    break
+                elif message["type"] == "serve_update_cache":
+                    cu.send_msg(server_socket, self._update(*message["args"]))
+                elif message["type"] == "serve_lww_update":
+                    cu.send_msg(server_socket, self._merge(*message["args"]))
+                else:
+                    cu.send_msg(
+                        server_socket,
+                        {
+                            "status": gv.INVALID_OPERATION,
+                            "message": "invalid message type",
+                        },
+                    )
+        except Exception:
+            pass
+        finally:
+            server_socket.close()
+
+    def _update(
+        self,
+        address_chain: list[tuple[str, int]],
+        memory_address: int,
+        data,
+        status: str,
+        wtag: int,
+    ):
+        """
+        Description: same behaviour as Server.serve_update_cache: update the local
+        copy, pass the update to the next copy holder of the chain and tell the owner
+        if the copy was dropped because it is not read anymore.
+        """
+        self.write(memory_address, data, status, wtag)
+
+        dropped = False
+        with self.lock:
+            item = self.items.get(memory_address, None)
+            if item is not None:
+                item[4] += 1
+                if COPY_EXPIRY_UPDATES > 0 and item[4] >= COPY_EXPIRY_UPDATES:
+                    del self.items[memory_address]
+                    dropped = True
+
+        response = {"status": gv.SUCCESS, "message": "cache updated"}
+        if len(address_chain) > 0:
+            next_address = (address_chain[0][0], address_chain[0][1])
+            response = self._update_next_copy(
+                address_chain[1:], next_address, memory_address, data, status, wtag
+            )
+
+        if dropped:
+            response.setdefault("dropped_holders", []).append(self.listener_address)
+        return response
+
+    def _merge(self, sender_ip: str, sender_port: int, updates: list[list]):
+        """
+        Description: same behaviour as Server.serve_lww_update for a copy holder: merge
+        the writes of eventually consistent addresses and report back the addresses that
+        are not cached anymore.
+        """
+        dropped = []
+        for memory_address, data, wtag in updates:
+            with self.lock:
+                item = self.items.get(memory_address, None)
+                if item is not None:
+                    item[4] += 1
+                    if COPY_EXPIRY_UPDATES > 0 and item[4] >= COPY_EXPIRY_UPDATES:
+                        del self.items[memory_address]
+                        item = None
+            if item is None:
+                dropped.append(memory_address)
+            else:
+                self.write(memory_address, data, item[1], wtag)
+        return {"status": gv.SUCCESS, "message": "updates merged", "dropped": dropped}
+
+    def _update_next_copy(
+        self,
+        address_chain: list[tuple[str, int]],
+        next_address: tuple[str, int],
+        memory_address: int,
+        data,
+        status: str,
+        wtag: int,
+    ):
+        next_socket = None
+        try:
+            next_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            next_socket.settimeout(CONNECTION_TIMEOUT)
+            next_socket.connect(next_address)
+            cu.send_msg(
+                next_socket,
+                {
+                    "type": "serve_update_cache",
+                    "args": [address_chain, memory_address, data, status, wtag],
+                },
+            )
+            response = cu.rec_msg(next_socket)
+            cu.send_msg(next_socket, {"type": "disconnect"})
+            cu.rec_msg(next_socket)
+        except Exception as e:
+            response = {
+                "status": gv.ERROR,
+                "message": f"Failed to connect to the host with error: {e}",
+            }
+        finally:
+            if next_socket is not None:
+                next_socket.close()
+
+        # same convention as the servers, the first failing copy holder is reported
+        if response["status"] != gv.SUCCESS and "server_address" not in response:
+            response["server_address"] = next_address
+        return response
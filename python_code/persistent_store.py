@@ -0,0 +1,266 @@
+import json
+import mmap
+import os
+import struct
+import threading as th
+
+import memory_primitives as mp
+import time_utils
+
+# file layout:
+# - header: magic, first address, last address + 1, bytes used in the value heap
+# - one fixed-size slot per address: value offset, value length, wtag, status
+# - value heap: json encoded values, appended on every write
+HEADER = struct.Struct("<8sqqQ")
+SLOT = struct.Struct("<QIqc")
+MAGIC = b"EDCSMEM1"
+MINIMUM_HEAP_SIZE = 1 << 16
+
+
+class PersistentStore:
+    """
+    Description: memory-mapped file holding the memory items of a memory range.
+
+    Every address has a fixed-size slot, so reading or writing the wtag or status of
+    an address is a single struct access on the mapped file. Values are appended to
+    a heap at the end of the file and the slot points at the latest one. A restarting
+    server maps the file and serves requests immediately: values are only decoded
+    when they are read.
+
+    The heap only grows while the server runs, it is compacted when the file is
+    opened if most of it is garbage.
+    """
+
+    def __init__(self, path: str, memory_range: tuple[int, int]):
+        self.path = path
+        self.memory_range = memory_range
+        self.slot_count = memory_range[1] - memory_range[0]
+        self.heap_start = HEADER.size + self.slot_count * SLOT.size
+        # the mapping is replaced when the file grows, so every access holds the lock
+        self.lock = th.Lock()
+
+        if not os.path.exists(path):
+            self._create()
+        self.file = open(path, "r+b")
+        self.map = mmap.mmap(self.file.fileno(), 0)
+
+        magic, start, end, self.heap_used = HEADER.unpack_from(self.map, 0)
+        if magic != MAGIC or (start, end) != tuple(memory_range):
+            raise ValueError(
+                f"{path} does not hold the memory range {tuple(memory_range)}"
+            )
+
+        # copy holders are not persisted, so no address is shared after a restart
+        for address in range(*memory_range):
+            self.map[self._slot_offset(address) + SLOT.size - 1] = ord("E")
+
+        if self.heap_used > MINIMUM_HEAP_SIZE and self.heap_used > 2 * self._live_bytes():
+            self._compact()
+
+    def holds(self, address: int) -> bool:
+        return self.memory_range[0] <= address < self.memory_range[1]
+
+    def read_slot(self, address: int) -> tuple[int, int, int, str]:
+        """
+        Return:
+        - (value offset, value length, wtag, status) of the address
+        """
+        with self.lock:
+            offset, length, wtag, status = SLOT.unpack_from(
+                self.map, self._slot_offset(address)
+            )
+        return offset, length, wtag, status.decode()
+
+    def read_data(self, offset: int, length: int):
+        if length == 0:
+            return None
+        with self.lock:
+            value = self.map[offset : offset + length]
+        return json.loads(value)
+
+    def write_data(self, address: int, data, wtag: None | int = None) -> int:
+        """
+        Description: append a value to the heap and point the slot of the address at
+        it. The slot is written at once, with the wtag of the value if given, so that
+        a crash cannot leave a new value with an old wtag.
+
+        Return:
+        - the offset of the value
+        """
+        value = json.dumps(data).encode()
+        with self.lock:
+            offset = self.heap_start + self.heap_used
+            if offset + len(value) > len(self.map):
+                self._grow(offset + len(value))
+            self.map[offset : offset + len(value)] = value
+            self.heap_used += len(value)
+            HEADER.pack_into(
+                self.map, 0, MAGIC, self.memory_range[0], self.memory_range[1], self.heap_used
+            )
+            slot_offset = self._slot_offset(address)
+            _, _, slot_wtag, status = SLOT.unpack_from(self.map, slot_offset)
+            if wtag is None:
+                wtag = slot_wtag
+            SLOT.pack_into(self.map, slot_offset, offset, len(value), wtag, status)
+        return offset
+
+    def write_wtag(self, address: int, wtag: int):
+        with self.lock:
+            struct.pack_into("<q", self.map, self._slot_offset(address) + 12, wtag)
+
+    def write_status(self, address: int, status: str):
+        with self.lock:
+            self.map[self._slot_offset(address) + SLOT.size - 1] = ord(status)
+
+    def flush(self):
+        with self.lock:
+            self.map.flush()
+
+    def close(self):
+        with self.lock:
+            self.map.flush()
+            self.map.close()
+            self.file.close()
+
+    def _slot_offset(self, address: int) -> int:
+        return HEADER.size + (address - self.memory_range[0]) * SLOT.size
+
+    def _create(self):
+        wtag = time_utils.get_time()
+        with open(self.path, "wb") as f:
+            f.write(HEADER.pack(MAGIC, self.memory_range[0], self.memory_range[1], 0))
+            f.write(SLOT.pack(0, 0, wtag, b"E") * self.slot_count)
+            f.truncate(self.heap_start + MINIMUM_HEAP_SIZE)
+
+    def _grow(self, minimum_size: int):
+        """
+        Description: at least double the size of the file and map it again
+        """
+        size = max(2 * len(self.map), minimum_size)
+        self.map.flush()
+        self.map.close()
+        self.file.truncate(size)
+        self.map = mmap.mmap(self.file.fileno(), 0)
+
+    def _live_bytes(self) -> int:
+        return sum(
+            SLOT.unpack_from(self.map, self._slot_offset(address))[1]
+            for address in range(*self.memory_range)
+        )
+
+    def _compact(self):
+        """
+        Description: copy the latest value of every address to the start of the heap
+        """
+        values = []
+        for address in range(*self.memory_range):
+            offset, length, _, _ = SLOT.unpack_from(self.map, self._slot_offset(address))
+            values.append(bytes(self.map[offset : offset + length]))
+
+        self.heap_used = 0
+        for address, value in zip(range(*self.memory_range), values):
+            slot_offset = self._slot_offset(address)
+            _, length, wtag, status = SLOT.unpack_from(self.map, slot_offset)
+            offset = self.heap_start + self.heap_used if length > 0 else 0
+            self.map[offset : offset + length] = value
+            self.heap_used += length
+            SLOT.pack_into(self.map, slot_offset, offset, length, wtag, status)
+        HEADER.pack_into(
+            self.map, 0, MAGIC, self.memory_range[0], self.memory_range[1], self.heap_used
+        )
+        self.map.flush()
+
+
+class StoredMemoryItem(mp.MemoryItem):
+    """
+    Description: MemoryItem whose fields live in the slot of a PersistentStore.
+    The decoded value is kept until the slot points at another value.
+    """
+
+    def __init__(self, store: PersistentStore, address: int):
+        self.store = store
+        self.address = address
+        self._data_offset = None
+        self._data = None
+
+    @property
+    def data(self):
+        offset, length, _, _ = self.store.read_slot(self.address)
+        if offset != self._data_offset:
+            self._data = self.store.read_data(offset, length)
+            self._data_offset = offset
+        return self._data
+
+    @data.setter
+    def data(self, data):
+        self._data_offset = self.store.write_data(self.address, data)
+        self._data = data
+
+    def write(self, data, wtag: int):
+        self._data_offset = self.store.write_data(self.address, data, wtag)
+        self._data = data
+
+    @property
+    def wtag(self):
+        return self.store.read_slot(self.address)[2]
+
+    @wtag.setter
+    def wtag(self, wtag):
+        self.store.write_wtag(self.address, wtag)
+
+    @property
+    def status(self):
+        return self.store.read_slot(self.address)[3]
+
+    @status.setter
+    def status(self, status):
+        self.store.write_status(self.address, status)
+
+
+class StoredItems(dict):
+    """
+    Description: the memory dictionary of a MemoryManager backed by a PersistentStore.
+    The items of stored addresses are created on first access. Addresses outside of
+    the store (imported from other servers) are kept as plain MemoryItems.
+    """
+
+    def __init__(self, store: PersistentStore):
+        super().__init__()
+        self.store = store
+        self.removed = set()  # stored addresses that moved to other servers
+
+    def _stored(self, address) -> bool:
+        return self.store.holds(address) and address not in self.removed
+
+    def __missing__(self, address):
+        if not self._stored(address):
+            raise KeyError(address)
+        item = StoredMemoryItem(self.store, address)
+        self[address] = item
+        return item
+
+    def __contains__(self, address) -> bool:
+        return super().__contains__(address) or self._stored(address)
+
+    def get(self, address, default=None):
+        return self[address] if address in self else default
+
+    def keys(self):
+        return set(super().keys()) | {
+            address for address in range(*self.store.memory_range) if self._stored(address)
+        }
+
+    def pop(self, address, *default):
+        if self.store.holds(address):
+            self.removed.add(address)
+        return super().pop(address, *default)
+
+    def __setitem__(self, address, item):
+        # an address which comes back is stored again
+        if self.store.holds(address) and not isinstance(item, StoredMemoryItem):
+            self.removed.discard(address)
+            stored_item = StoredMemoryItem(self.store, address)
+            stored_item.write(item.data, item.wtag)
+            stored_item.status = item.status
+            item = stored_item
+        super().__setitem__(address, item)
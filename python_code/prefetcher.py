@@ -0,0 +1,118 @@
+import collections
+import threading as th
+
+# connections whose access pattern is tracked at a time, the least recent ones are forgotten
+MAX_STREAMS = 1024
+# prefetches after which the accuracy counts are halved, so that it follows the recent ones
+ACCURACY_WINDOW = 64
+# prefetches needed before the accuracy throttles the depth
+ACCURACY_SAMPLES = 16
+
+
+class Stream:
+    """
+    Description: access pattern of the misses of one client connection
+    """
+
+    def __init__(self):
+        self.last = None  # last address missed
+        self.stride = 0  # distance between the last two misses
+        self.confirmations = 0  # times the stride repeated
+        self.frontier = None  # furthest address prefetched for the stride
+
+
+class Prefetcher:
+    """
+    Description: prefetcher of the shared cache of a server (see cache.Cache.fill).
+
+    Every client connection is a stream of reads. When the misses of a stream
+    (reads of addresses that are not cached, or the first read of a prefetched
+    address) repeat the same stride twice, e.g. a sequential scan (stride 1),
+    the next `depth` addresses of the stride are fetched in the background with
+    fetch(addresses), which returns the number of addresses requested. The next
+    misses move the prefetch further once it is half consumed, so that the
+    addresses are requested in batches and never twice.
+
+    The prefetcher tracks its accuracy, the fraction of the prefetched addresses
+    that are read. Below min_accuracy it only prefetches one address ahead, until
+    the prefetches are read again.
+    """
+
+    def __init__(self, fetch, depth: int, min_accuracy: float):
+        self.fetch = fetch
+        self.depth = depth
+        self.min_accuracy = min_accuracy
+        self.streams = collections.OrderedDict()  # connection -> Stream
+        self.issued = 0  # prefetched addresses
+        self.used = 0  # prefetched addresses that were read
+        self.lock = th.Lock()
+
+    def record_miss(self, connection, address: int):
+        """
+        Description: a read of the connection missed the cache, or read a prefetched
+        address for the first time (see record_use)
+        """
+        if self.depth <= 0:
+            return
+        with self.lock:
+            stream = self.streams.pop(connection, None) or Stream()
+            self.streams[connection] = stream
+            if len(self.streams) > MAX_STREAMS:
+                self.streams.popitem(last=False)
+
+            if address == stream.last:
+                return  # the same read again, e.g. after a stale copy was removed
+            if stream.last is not None:
+                stride = address - stream.last
+                if stride == stream.stride:
+                    stream.confirmations += 1
+                else:
+                    stream.stride = stride
+                    stream.confirmations = 0
+                    stream.frontier = None
+            stream.last = address
+            if stream.confirmations < 1:
+                return
+
+            depth = self._throttled_depth()
+            if (
+                stream.frontier is not None
+                and (stream.frontier - address) // stream.stride > depth // 2
+            ):
+                return  # far enough ahead, the next addresses are fetched in one batch later
+            addresses = []
+            for step in range(1, depth + 1):
+                target = address + step * stream.stride
+                if stream.frontier is None or (target - stream.frontier) * stream.stride > 0:
+                    addresses.append(target)
+            if not addresses:
+                return
+            stream.frontier = addresses[-1]
+
+        issued = self.fetch(addresses)
+        with self.lock:
+            self.issued += issued
+            if self.issued >= ACCURACY_WINDOW:
+                self.issued //= 2
+                self.used //= 2
+
+    def record_use(self):
+        """
+        Description: a prefetched address was read
+        """
+        with self.lock:
+            self.used += 1
+
+    def accuracy(self) -> float:
+        with self.lock:
+            return self._accuracy()
+
+    def _accuracy(self) -> float:
+        if self.issued < ACCURACY_SAMPLES:
+            return 1.0
+        return min(self.used / self.issued, 1.0)
+
+    def _throttled_depth(self) -> int:
+        if self._accuracy() < self.min_accuracy:
+            return 1  # keep measuring the accuracy
+        return self.depth
@@ -0,0 +1,50 @@
+import threading as th
+
+import memory_primitives as mp
+
+
+class Propagator:
+    """
+    Description: sends the writes of eventually consistent addresses to other
+    servers from one background thread, so that the write requests do not wait
+    for them. The writes for a server that are not sent yet are coalesced: only
+    the last writer (see memory_primitives.lww_order) of an address is sent, and
+    all the addresses waiting for a server are sent in one batch.
+
+    send(server_address, updates) sends a batch of [address, data, wtag] and
+    deals with the failures itself, it runs in the propagator thread.
+    """
+
+    def __init__(self, send):
+        self.send = send
+        self.pending = {}  # server address -> {address: (data, wtag)}
+        self.condition = th.Condition()
+        self.thread = None
+
+    def push(self, server_address: tuple[str, int], address: int, data, wtag: int):
+        with self.condition:
+            if self.thread is None:
+                self.thread = th.Thread(target=self._run, daemon=True)
+                self.thread.start()
+            updates = self.pending.setdefault(server_address, {})
+            if address in updates and mp.lww_order(data, wtag) <= mp.lww_order(
+                *updates[address]
+            ):
+                return
+            updates[address] = (data, wtag)
+            self.condition.notify()
+
+    def _run(self):
+        while True:
+            with self.condition:
+                while not self.pending:
+                    self.condition.wait()
+                pending, self.pending = self.pending, {}
+            for server_address, updates in pending.items():
+                try:
+                    self.send(
+                        server_address,
+                        [[address, data, wtag] for address, (data, wtag) in updates.items()],
+                    )
+                except Exception:
+                    pass  # a failing server must not stop the others
@@ -0,0 +1,136 @@
+import argparse
+import socket
+
+import comm_utils as cu
+import global_variables as gv
+
+
+def _request(server_address: tuple[str, int], message: dict) -> dict:
+    """
+    Description: send a single request to a server and return its response
+    """
+    s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    s.settimeout(3 * gv.CONNECTION_TIMEOUT)
+    try:
+        s.connect(server_address)
+        cu.send_msg(s, message)
+        response = cu.rec_msg(s)
+        cu.send_msg(s, {"type": "disconnect"})
+        cu.rec_msg(s)
+        return response
+    finally:
+        s.close()
+
+
+def collect_loads(
+    server_addresses: list[tuple[str, int]], bucket_size: int, reset: bool = False
+) -> dict[int, list[list[int]]]:
+    """
+    Description: ask every server for the load of its memory addresses
+
+    Return:
+    - server index -> list of [start, end, access count]
+    """
+    loads = {}
+    for index, server_address in enumerate(server_addresses):
+        response = _request(
+            server_address,
+            {"type": "serve_load_stats", "args": [bucket_size, reset]},
+        )
+        if response["status"] != gv.SUCCESS:
+            raise RuntimeError(f"server {server_address} did not send its load: {response}")
+        loads[index] = response["loads"]
+    return loads
+
+
+def propose_moves(
+    loads: dict[int, list[list[int]]], max_moves: int
+) -> list[tuple[int, int, int, int]]:
+    """
+    Description: greedily propose memory range moves from the most loaded server to
+    the least loaded one. Moving a range with load l shrinks the load gap g between the
+    two servers to |g - 2l|, so each step picks the range that brings it closest to 0
+    and stops when no range makes the gap smaller.
+
+    Return:
+    - a list of (start, end, source server index, target server index)
+    """
+    loads = {index: [list(bucket) for bucket in buckets] for index, buckets in loads.items()}
+    totals = {index: sum(bucket[2] for bucket in buckets) for index, buckets in loads.items()}
+
+    moves = []
+    for _ in range(max_moves):
+        hot = max(totals, key=totals.get)
+        cold = min(totals, key=totals.get)
+        gap = totals[hot] - totals[cold]
+        candidates = [bucket for bucket in loads[hot] if 0 < bucket[2] < gap]
+        if not candidates:
+            break
+
+        bucket = min(candidates, key=lambda candidate: abs(gap - 2 * candidate[2]))
+        moves.append((bucket[0], bucket[1], hot, cold))
+        loads[hot].remove(bucket)
+        loads[cold].append(bucket)
+        totals[hot] -= bucket[2]
+        totals[cold] += bucket[2]
+    return moves
+
+
+def apply_moves(
+    server_addresses: list[tuple[str, int]], moves: list[tuple[int, int, int, int]]
+) -> list[dict]:
+    """
+    Description: ask the source server of every move to migrate the range to the target server
+    """
+    responses = []
+    for start, end, source, target in moves:
+        target_ip, target_port = server_addresses[target]
+        responses.append(
+            _request(
+                server_addresses[source],
+                {
+                    "type": "serve_migrate_range",
+                    "args": [start, end, target_ip, target_port],
+                },
+            )
+        )
+    return responses
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Propose (and apply) memory range moves that spread the load between servers"
+    )
+    parser.add_argument(
+        "-bucket", type=int, default=10, help="The number of addresses of a movable range"
+    )
+    parser.add_argument(
+        "-moves", type=int, default=1, help="The maximum number of moves to propose"
+    )
+    parser.add_argument(
+        "-apply", action="store_true", help="Migrate the proposed ranges"
+    )
+    parser.add_argument(
+        "-reset", action="store_true", help="Reset the load statistics of the servers"
+    )
+    args = parser.parse_args()
+
+    loads = collect_loads(gv.SERVERS, args.bucket, args.reset)
+    for index, buckets in loads.items():
+        print(f"Server {index} {gv.SERVERS[index]}: load {sum(bucket[2] for bucket in buckets)}")
+
+    moves = propose_moves(loads, args.moves)
+    if not moves:
+        print("The load is balanced, no moves proposed.")
+        return
+
+    for start, end, source, target in moves:
+        print(f"Move [{start}, {end}) from server {source} to server {target}")
+
+    if args.apply:
+        for move, response in zip(moves, apply_moves(gv.SERVERS, moves)):
+            print(f"Move {move}: {response['status']} {response['message']}")
+
+
+if __name__ == "__main__":
+    main()
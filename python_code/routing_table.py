@@ -0,0 +1,298 @@
+import bisect
+
+import global_variables as gv
+
+
+class RoutingTable:
+    """
+    Description: maps memory addresses to the servers that own them.
+    The table is a sorted list of disjoint memory segments [start, end), each one
+    owned by a server. An address is resolved with a binary search over the segment
+    starts, so the lookup costs O(log n) in the number of segments no matter how
+    many servers there are or how the ranges are sized.
+
+    The same table is used by the servers (to find the host of an address) and
+    by the clients (to find which addresses a server owns).
+
+    Every segment may also have replica servers, which keep a copy of the segment
+    that is updated synchronously by the owner and can serve reads.
+
+    Some memory ranges may be eventually consistent (see is_eventual), whatever
+    server owns them.
+
+    Tables are never modified in place: reassign() returns a new table with a
+    higher epoch, so threads that are resolving addresses never see a half
+    updated table.
+    """
+
+    def __init__(
+        self,
+        server_addresses: list[tuple[str, int]],
+        memory_ranges: list[tuple[int, int]],
+        epoch: int = 0,
+        replicas: None | list[list[int]] = None,
+        eventual_ranges: None | list[tuple[int, int]] = None,
+    ):
+        """
+        replicas: for every server, the indexes of the servers that replicate its memory range
+        eventual_ranges: the eventually consistent memory ranges [start, end)
+        """
+        if len(server_addresses) != len(memory_ranges):
+            raise ValueError("every server must have exactly one memory range")
+        if replicas is None:
+            replicas = [[] for _ in memory_ranges]
+
+        self.server_addresses = [(ip, int(port)) for ip, port in server_addresses]
+        self.epoch = epoch  # number of changes since the table was created
+
+        segments = sorted(
+            (memory_range[0], memory_range[1], index, tuple(replicas[index]))
+            for index, memory_range in enumerate(memory_ranges)
+            if memory_range[0] < memory_range[1]
+        )
+        for previous, current in zip(segments, segments[1:]):
+            if current[0] < previous[1]:
+                raise ValueError(
+                    f"memory ranges {previous[:2]} and {current[:2]} overlap"
+                )
+
+        # parallel lists, so that bisect works directly on the starts
+        self._starts = [segment[0] for segment in segments]
+        self._ends = [segment[1] for segment in segments]
+        self._owners = [segment[2] for segment in segments]
+        self._replicas = [segment[3] for segment in segments]
+
+        eventual_ranges = sorted(
+            (start, end) for start, end in eventual_ranges or [] if start < end
+        )
+        self._eventual_starts = [start for start, _ in eventual_ranges]
+        self._eventual_ends = [end for _, end in eventual_ranges]
+
+    def get_index(self, memory_address: int) -> int:
+        """
+        Return:
+        - the index of the server that owns the memory address, -1 if the address is out of range
+        """
+        position = bisect.bisect_right(self._starts, memory_address) - 1
+        if position < 0 or memory_address >= self._ends[position]:
+            return -1
+        return self._owners[position]
+
+    def get_address(self, memory_address: int) -> None | tuple[str, int]:
+        """
+        Return:
+        - the network address of the server that owns the memory address, None if the address is out of range
+        """
+        server_index = self.get_index(memory_address)
+        if server_index == -1:
+            return None
+        return self.server_addresses[server_index]
+
+    def is_eventual(self, memory_address: int) -> bool:
+        """
+        Return:
+        - True if the memory address is in an eventually consistent memory range.
+        Writes to these addresses are accepted by any server holding a copy and
+        propagated asynchronously, the last writer wins (see Server.serve_write)
+        """
+        position = bisect.bisect_right(self._eventual_starts, memory_address) - 1
+        return position >= 0 and memory_address < self._eventual_ends[position]
+
+    def get_replicas(self, memory_address: int) -> list[tuple[str, int]]:
+        """
+        Return:
+        - the network addresses of the servers that replicate the memory address
+        """
+        position = bisect.bisect_right(self._starts, memory_address) - 1
+        if position < 0 or memory_address >= self._ends[position]:
+            return []
+        return [self.server_addresses[index] for index in self._replicas[position]]
+
+    def get_replica_segments(self, server_index: int) -> list[tuple[int, int, int]]:
+        """
+        Return:
+        - the memory ranges replicated by the server with the given index, as (start, end, owner index)
+        """
+        return [
+            (start, end, owner)
+            for start, end, owner, replicas in zip(
+                self._starts, self._ends, self._owners, self._replicas
+            )
+            if server_index in replicas
+        ]
+
+    def get_ranges(self, server_index: int) -> list[tuple[int, int]]:
+        """
+        Return:
+        - the memory ranges owned by the server with the given index
+        """
+        return [
+            (start, end)
+            for start, end, owner in zip(self._starts, self._ends, self._owners)
+            if owner == server_index
+        ]
+
+    def reassign(self, start: int, end: int, server_index: int) -> "RoutingTable":
+        """
+        Description: give the memory addresses [start, end) to another server.
+        The replicas of the addresses do not change, except for the new owner which
+        stops being a replica.
+
+        Return:
+        - a new RoutingTable, this one is left untouched
+        """
+        segments = []
+        for segment_start, segment_end, owner, replicas in zip(
+            self._starts, self._ends, self._owners, self._replicas
+        ):
+            # keep the parts of the segment that are outside of [start, end)
+            if segment_start < start:
+                segments.append([segment_start, min(segment_end, start), owner, list(replicas)])
+            if segment_end > end:
+                segments.append([max(segment_start, end), segment_end, owner, list(replicas)])
+            inner_start, inner_end = max(segment_start, start), min(segment_end, end)
+            if inner_start < inner_end:
+                segments.append(
+                    [
+                        inner_start,
+                        inner_end,
+                        server_index,
+                        [replica for replica in replicas if replica != server_index],
+                    ]
+                )
+        segments.sort()
+
+        # merge neighbouring segments of the same server and replicas
+        merged = []
+        for segment in segments:
+            if (
+                merged
+                and merged[-1][1] == segment[0]
+                and merged[-1][2:] == segment[2:]
+            ):
+                merged[-1][1] = segment[1]
+            else:
+                merged.append(segment)
+
+        return RoutingTable.from_json(
+            {
+                "servers": self.server_addresses,
+                "segments": merged,
+                "epoch": self.epoch + 1,
+                "eventual": self._eventual_json(),
+            }
+        )
+
+    def json(self) -> dict:
+        """
+        Description: This function returns the RoutingTable object as a dictionary.
+        To be used when sending the object over the network.
+        """
+        return {
+            "servers": [list(address) for address in self.server_addresses],
+            "segments": [
+                [start, end, owner, list(replicas)]
+                for start, end, owner, replicas in zip(
+                    self._starts, self._ends, self._owners, self._replicas
+                )
+            ],
+            "epoch": self.epoch,
+            "eventual": self._eventual_json(),
+        }
+
+    def _eventual_json(self) -> list[list[int]]:
+        return [
+            [start, end] for start, end in zip(self._eventual_starts, self._eventual_ends)
+        ]
+
+    @classmethod
+    def from_json(cls, data: dict) -> "RoutingTable":
+        """
+        Description: Build a RoutingTable from the dictionary produced by json()
+        """
+        table = cls([], [], data.get("epoch", 0), eventual_ranges=data.get("eventual", []))
+        table.server_addresses = [(ip, int(port)) for ip, port in data["servers"]]
+        for segment in sorted(data["segments"]):
+            table._starts.append(segment[0])
+            table._ends.append(segment[1])
+            table._owners.append(segment[2])
+            table._replicas.append(tuple(segment[3]) if len(segment) > 3 else ())
+        return table
+
+    @classmethod
+    def from_config(cls) -> "RoutingTable":
+        """
+        Description: Build the RoutingTable described by the environment variables
+        """
+        return cls(
+            gv.SERVERS,
+            memory_ranges_from_sizes(server_memory_sizes()),
+            replicas=server_replicas(),
+            eventual_ranges=gv.EVENTUAL_RANGES,
+        )
+
+
+def server_memory_sizes() -> list[int]:
+    """
+    Description: the number of addresses each server owns.
+    SERVER_MEMORY_SIZES gives the sizes explicitly (weighted capacity), otherwise
+    MEMORY_SIZE is split equally between the servers.
+    """
+    server_count = len(gv.SERVERS)
+    if gv.SERVER_MEMORY_SIZES is None:
+        return [gv.MEMORY_SIZE // server_count] * server_count
+
+    if len(gv.SERVER_MEMORY_SIZES) != server_count:
+        raise ValueError("SERVER_MEMORY_SIZES must have one size per server")
+    if sum(gv.SERVER_MEMORY_SIZES) != gv.MEMORY_SIZE:
+        raise ValueError("SERVER_MEMORY_SIZES must add up to MEMORY_SIZE")
+    return gv.SERVER_MEMORY_SIZES
+
+
+def server_replicas() -> list[list[int]]:
+    """
+    Description: the replicas of every server. The memory range of a server is
+    replicated by the REPLICA_COUNT servers that follow it in the list of servers.
+    """
+    server_count = len(gv.SERVERS)
+    replica_count = min(gv.REPLICA_COUNT, server_count - 1)
+    return [
+        [(index + offset) % server_count for offset in range(1, replica_count + 1)]
+        for index in range(server_count)
+    ]
+
+
+def memory_ranges_from_sizes(sizes: list[int]) -> list[tuple[int, int]]:
+    """
+    Description: lay out contiguous memory ranges of the given sizes, starting at address 0
+    """
+    memory_ranges = []
+    start = 0
+    for size in sizes:
+        memory_ranges.append((start, start + size))
+        start += size
+    return memory_ranges
+
+
+def worker_layout(
+    server_address: tuple[str, int], memory_range: tuple[int, int], workers: int
+) -> tuple[list[tuple[str, int]], list[tuple[int, int]]]:
+    """
+    Description: the network addresses and memory ranges of the worker processes of
+    a server (see server.py -workers). The memory range of the server is split
+    equally between the workers, worker i listens on the port of the server plus
+    WORKER_PORT_OFFSET * (i + 1).
+    """
+    size = memory_range[1] - memory_range[0]
+    worker_addresses = [
+        (server_address[0], server_address[1] + gv.WORKER_PORT_OFFSET * (index + 1))
+        for index in range(workers)
+    ]
+    worker_ranges = [
+        (
+            memory_range[0] + size * index // workers,
+            memory_range[0] + size * (index + 1) // workers,
+        )
+        for index in range(workers)
+    ]
+    return worker_addresses, worker_ranges
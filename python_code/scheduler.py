@@ -0,0 +1,46 @@
+import heapq
+import itertools
+import threading as th
+import time
+
+
+class Scheduler:
+    """
+    Description: runs functions at given times from one background thread, instead
+    of one threading.Timer (i.e. one thread) per pending call. Used for lock
+    leases and lock wait deadlines, of which there can be many at once.
+
+    The functions run in the scheduler thread and must be short.
+    """
+
+    def __init__(self):
+        self.calls = []  # heap of (time.monotonic() deadline, sequence number, function, args)
+        self.sequence = itertools.count()
+        self.condition = th.Condition()
+        self.thread = None
+
+    def call_later(self, seconds: float, function, *args):
+        with self.condition:
+            if self.thread is None:
+                self.thread = th.Thread(target=self._run, daemon=True)
+                self.thread.start()
+            call = (time.monotonic() + seconds, next(self.sequence), function, args)
+            heapq.heappush(self.calls, call)
+            if self.calls[0] is call:
+                self.condition.notify()  # the thread sleeps until a later deadline
+
+    def _run(self):
+        while True:
+            with self.condition:
+                while not self.calls or self.calls[0][0] > time.monotonic():
+                    timeout = None if not self.calls else self.calls[0][0] - time.monotonic()
+                    self.condition.wait(timeout)
+                _, _, function, args = heapq.heappop(self.calls)
+            try:
+                function(*args)
+            except Exception:
+                pass  # a failing call must not stop the others
+
+
+# scheduler shared by the memory managers of the process
+scheduler = Scheduler()
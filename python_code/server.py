@@ -1,22 +1,62 @@
+import itertools
+import multiprocessing
+import os
+import signal
 import socket
 import threading as th
+import time
 
+import admission
 import global_variables as gv
 import memory_manager as mm
 import memory_primitives as mp
+import persistent_store as ps
+import prefetcher as pf
+import propagator as pg
+import wal as wl
 import cache
 import comm_utils as cu
+import deferred as dfr
+import front_end as fe
+import logger as lg
+import metrics
+import tracing
+import routing_table as rt
+import scheduler as sc
+import shm_transport as st
+import snapshot as sn
 import time_utils as tu
 
 CONNECTION_TIMEOUT = gv.CONNECTION_TIMEOUT
 LEASE_TIMEOUT = gv.LEASE_TIMEOUT
+TRANSACTION_TIMEOUT = gv.TRANSACTION_TIMEOUT
+# a prepared transaction asks its coordinator for the decision after this, longer than
+# the coordinator waits for the votes and the decisions (see serve_commit_transaction)
+PREPARED_TIMEOUT = 2 * TRANSACTION_TIMEOUT + 1
 CACHE_SIZE = gv.CACHE_SIZE
-
-
-# simple logging function which adds (or not) a timestamp at the
-# start of the message
-def log_msg(msg: str, datetime: bool = False):
-    print(f"{tu.get_datetime() if datetime else ''}{msg}")
+COPY_EXPIRY_UPDATES = gv.COPY_EXPIRY_UPDATES
+PREFETCH_DEPTH = gv.PREFETCH_DEPTH
+REPLICA_COUNT = gv.REPLICA_COUNT
+REPLICA_HEARTBEAT = gv.REPLICA_HEARTBEAT
+REPLICA_FAILURES = gv.REPLICA_FAILURES
+# seconds of the leases between the owner and the replicas of a memory range, see
+# _fenced and _read_replica
+REPLICA_LEASE = REPLICA_HEARTBEAT * REPLICA_FAILURES
+SHM_RING_SIZE = gv.SHM_RING_SIZE
+ADMISSION_WORKERS = gv.ADMISSION_WORKERS
+MVCC_VERSIONS = gv.MVCC_VERSIONS
+EVENTUAL_RETRY_INTERVAL = gv.EVENTUAL_RETRY_INTERVAL
+EVENTUAL_COPY_TTL = gv.EVENTUAL_COPY_TTL
+
+# position of the memory address in the arguments of the requests that refer to one
+ADDRESS_ARGUMENT = {
+    "serve_read": 2,
+    "serve_write": 2,
+    "serve_acquire_lock": 0,
+    "serve_release_lock": 0,
+    "serve_renew_lease": 0,
+    "serve_drop_copy": 2,
+}
 
 
 class Server:
@@ -26,14 +66,122 @@ class Server:
         memory_range: tuple[int, int],
         server_addresses: list[tuple[str, int]],
         memory_ranges: list[tuple[int, int]],
+        replicas: None | list[list[int]] = None,
+        store_path: None | str = None,
+        wal_path: None | str = None,
+        snapshot_path: None | str = None,
     ):
+        """
+        store_path: file of the persistent store of the memory range, memory is not persisted if None
+        wal_path: path prefix of the write-ahead log files, writes are not logged if None
+        snapshot_path: snapshot file (see serve_snapshot) to restore the memory range from
+        """
         self.server_address = server_address
         self.memory_range = memory_range
         self.server_addresses = server_addresses
         self.memory_ranges = memory_ranges
+        self.log = lg.Logger(server=server_address)
+        # request served by the current thread, and whether it was forwarded to another server
+        self.request_context = th.local()
+        self.routing_table = rt.RoutingTable(
+            server_addresses,
+            memory_ranges,
+            replicas=replicas,
+            eventual_ranges=gv.EVENTUAL_RANGES,
+        )
 
-        self.memory_manager = mm.MemoryManager(memory_range=self.memory_range)
+        store = None if store_path is None else ps.PersistentStore(store_path, memory_range)
+        wal = None if wal_path is None else wl.WriteAheadLog(wal_path)
+        # memory ranges may have moved from or to this server before a restart, the
+        # routing table saved with the log tells which ones we hold
+        held_ranges = None
+        saved_routing = None if wal is None else wal.load_routing()
+        if saved_routing is not None:
+            routing_table = rt.RoutingTable.from_json(saved_routing)
+            if routing_table.server_addresses == self.server_addresses:
+                self.routing_table = routing_table
+                held_ranges = routing_table.get_ranges(
+                    self.server_addresses.index(self.server_address)
+                )
+        self.memory_manager = mm.MemoryManager(
+            memory_range=self.memory_range,
+            store=store,
+            wal=wal,
+            snapshot_path=snapshot_path,
+            max_versions=MVCC_VERSIONS,
+            version_retention=gv.MVCC_RETENTION,
+            held_ranges=held_ranges,
+        )
         self.shared_memory = cache.Cache(cache_size=CACHE_SIZE)
+        # fills the shared cache ahead of the sequential and stride scans of clients
+        self.prefetcher = pf.Prefetcher(
+            self._prefetch, PREFETCH_DEPTH, gv.PREFETCH_MIN_ACCURACY
+        )
+        self.admission = None
+        # hosts of the servers, only their requests may be internal (see admission.lane)
+        self.server_hosts = {ip for ip, _ in server_addresses}
+        if ADMISSION_WORKERS > 0:
+            self.admission = admission.AdmissionControl(
+                ADMISSION_WORKERS,
+                gv.ADMISSION_QUEUE_LIMIT,
+                gv.ADMISSION_QUEUE_TIMEOUT,
+                gv.OVERLOAD_RETRY_AFTER,
+            )
+        # connections carrying the requests that wait on other servers, e.g. for locks
+        self.multiplexed_connections = {}
+        self.multiplexed_lock = th.Lock()
+        # transactions prepared by serve_prepare_transaction, waiting for the decision
+        self.prepared_transactions = {}  # transaction id -> (locks, writes)
+        # transactions coordinated by serve_commit_transaction, until all the owners know the decision
+        # transaction id -> [commit (None until decided), commit time, owners, Deferred decision]
+        self.transaction_decisions = {}
+        self.transactions_lock = th.Lock()
+        # the ids of the transactions coordinated before a restart have another prefix
+        self.transaction_prefix = f"{server_address[0]}:{server_address[1]}:{tu.get_time()}"
+        self.transaction_ids = itertools.count()
+        if wal is not None:
+            # commits that some owners may not know yet, see _decide_transaction
+            for transaction_id, (commit_time, owners) in wal.decisions.items():
+                decided = dfr.Deferred()
+                decided.resolve((True, commit_time))
+                self.transaction_decisions[transaction_id] = [
+                    True, commit_time, {(ip, port) for ip, port in owners}, decided
+                ]
+        # reads sent to the owners of memory addresses, shared by concurrent reads (see _read_remote)
+        self.remote_reads = {}  # memory address -> Deferred response
+        self.remote_reads_lock = th.Lock()
+        # writes of eventually consistent addresses, sent to other servers in the background
+        self.propagator = pg.Propagator(self._send_eventual_updates)
+        # requests to servers on the same host go through shared memory
+        self.shm_transport = None
+        if SHM_RING_SIZE > 0:
+            self.shm_transport = st.ShmTransport(SHM_RING_SIZE, self._connect_shm)
+
+        # copies of the memory ranges this server replicates. An address is only
+        # present once its value is known to be up-to-date
+        self.replica_manager = mm.MemoryManager(memory_range=(0, 0))
+        # replicas which missed an update and must copy our memory ranges again
+        self.lagging_replicas = set()
+        # leases on our replicated memory ranges: time.monotonic() when the lease
+        # granted by each replica was asked for (see _fenced and _renew_leases)
+        self.replica_leases = {}
+        # leases this server granted as a replica: time.monotonic() when the lease of
+        # each owner was granted, and the owners whose ranges it is taking over
+        self.granted_leases = {}
+        self.revoked_leases = set()
+        self.lease_lock = th.Lock()
+        # time.monotonic() when each owner last found our copy of its ranges in sync,
+        # and when it last told us that we missed an update (see _read_replica)
+        self.replica_reads = {}
+        self.lagging_since = {}
+
+        # only one memory range migrates out of the server at a time, and
+        # routing table updates are applied one at a time
+        self.migration_lock = th.Lock()
+        self.routing_lock = th.Lock()
+        # migrations into this server, imported (True) or refused because the source gave up (False)
+        self.imported_migrations = {}  # migration id -> bool
+        self.imports_lock = th.Lock()
 
     def start(self):
         """
@@ -43,12 +191,20 @@ class Server:
         Return:
         - None
         """
+        self._join_cluster()
+
         with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as server_socket:
             server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
             server_socket.bind(self.server_address)
             server_socket.listen()
 
-            log_msg(f"[LISTENING] Server is listening on {self.server_address}")
+            self.log.info("LISTENING")
+
+            if REPLICA_COUNT > 0:
+                th.Thread(target=self._watch_primaries, daemon=True).start()
+                th.Thread(target=self._renew_leases, daemon=True).start()
+            if self.transaction_decisions:
+                th.Thread(target=self._finish_transactions, daemon=True).start()
 
             while True:
                 # accept new connection
@@ -64,9 +220,7 @@ class Server:
                 # as an active thread. Sometimes, this result might still not be
                 # accurate because we might have lock-leasing threads that are still active
                 # but of course do not count as active connections.
-                log_msg(
-                    f"[ACTIVE CONNECTIONS] Active connections: {th.active_count() - 1}"
-                )
+                self.log.debug("ACTIVE_CONNECTIONS", connections=th.active_count() - 1)
 
     def handle_client(
         self, client_socket: socket.socket, client_address: tuple[str, int]
@@ -76,8 +230,9 @@ class Server:
         - Handle a client connection by receiving messages from the client
         and sending back the appropriate responses
         """
-        log_msg(f"[NEW CONNECTION] {client_address} connected.")
+        self.log.info("NEW_CONNECTION", category="request", client=client_address)
         connected = True
+        send_lock = th.Lock()  # deferred responses are sent by other threads
 
         # keep the connection open until the client sends a disconnect message
         # or communication errors occur
@@ -87,56 +242,226 @@ class Server:
             try:
                 message = cu.rec_msg(client_socket)
             except Exception as e:
-                log_msg(
-                    f"[ERROR RECEIVING] server {self.server_address}, client {client_address}: {e}"
-                )
+                self.log.warning("ERROR_RECEIVING", client=client_address, error=e)
                 break
 
             if not message:
                 continue
 
-            args = message.get("args", None)
-            if message["type"] == "disconnect":
-                connected = False
-                return_data = {"status": gv.SUCCESS, "message": "disconnected"}
-            elif message["type"] == "serve_read":
-                return_data = self.serve_read(client_address, *args)
-            elif message["type"] == "serve_write":
-                return_data = self.serve_write(client_address, *args)
-            elif message["type"] == "serve_acquire_lock":
-                return_data = self.serve_acquire_lock(client_address, *args)
-            elif message["type"] == "serve_release_lock":
-                return_data = self.serve_release_lock(client_address, *args)
-            elif message["type"] == "serve_update_cache":
-                return_data = self.serve_update_cache(client_address, *args)
-            elif message["type"] == "serve_dump_cache":
-                return_data = self.serve_dump_cache(client_address)
-            else:
-                return_data = {
-                    "status": gv.INVALID_OPERATION,
-                    "message": "invalid message type",
-                }
+            return_data = self._serve_message(client_address, message)
+            connected = message["type"] != "disconnect"
+            # requests with an id (see deferred.MultiplexedConnection) may be answered out of order
+            request_id = message.get("id", None)
 
-            try:
-                cu.send_msg(client_socket, return_data)
-            except Exception as e:
-                log_msg(
-                    f"[ERROR SENDING] server {self.server_address}, client {client_address}: {e}"
+            if isinstance(return_data, dfr.Deferred):
+                # the response is sent when it is known, we go on serving the connection
+                return_data.then(
+                    lambda response, request_id=request_id: self._send_response(
+                        client_socket, send_lock, client_address, response, request_id
+                    )
                 )
+                continue
+
+            if not self._send_response(
+                client_socket, send_lock, client_address, return_data, request_id
+            ):
                 break
 
-        log_msg(
-            f"[DISCONNECTED] server {self.server_address}, client {client_address}."
-        )
+        self.log.info("DISCONNECTED", category="request", client=client_address)
 
         try:
             # client_socket.shutdown(socket.SHUT_RDWR)
             client_socket.close()
         except Exception as e:
-            log_msg(
-                f"[ERROR CLOSING] server {self.server_address}, client {client_address}: {e}"
+            self.log.warning("ERROR_CLOSING", client=client_address, error=e)
+
+    def _send_response(
+        self,
+        client_socket: socket.socket,
+        send_lock: th.Lock,
+        client_address: tuple[str, int],
+        response: dict,
+        request_id: None | int,
+    ) -> bool:
+        if request_id is not None:
+            response = {**response, "id": request_id}
+        try:
+            with send_lock:
+                cu.send_msg(client_socket, response)
+            return True
+        except Exception as e:
+            self.log.warning("ERROR_SENDING", client=client_address, error=e)
+            return False
+
+    def handle_shm_client(
+        self, channel: st.Channel, client_address: tuple[str, int], pid: int
+    ):
+        """
+        Description:
+        - Handle a shared-memory channel opened by a server of the same host
+        (see serve_shm_connect), like handle_client handles a connection
+        """
+        self.log.info("NEW_SHM_CONNECTION", category="request", client=client_address)
+        try:
+            while True:
+                request = channel.receive(timeout=CONNECTION_TIMEOUT)
+                if request is None:
+                    os.kill(pid, 0)  # raises once the other server is gone
+                    continue
+                message = cu.decode_msg(request)
+                return_data = self._serve_message(client_address, message)
+                if isinstance(return_data, dfr.Deferred):
+                    return_data = return_data.wait()  # one request at a time on a channel
+                channel.send(cu.encode_msg(return_data))
+                if message["type"] == "disconnect":
+                    break
+        except Exception as e:
+            # EOFError when the other server closes the channel
+            self.log.debug("SHM_CHANNEL_CLOSED", client=client_address, error=e)
+        finally:
+            channel.close()
+        self.log.info("DISCONNECTED", category="request", client=client_address)
+
+    def _serve_message(
+        self, client_address: tuple[str, int], message: dict
+    ) -> dict | dfr.Deferred:
+        """
+        Description:
+        - Serve a message within its span and record its latency
+        - Client requests that are not admitted (see admission) are answered with OVERLOADED
+        """
+        # clients on the host of a server cannot be told apart from it
+        request_lane = admission.lane(message, client_address[0] in self.server_hosts)
+        if self.admission is not None and not self.admission.admit(request_lane):
+            self.log.warning(
+                "REQUEST_SHED", category="request", client=client_address, op=message["type"]
+            )
+            return self.admission.overloaded(request_lane)
+        try:
+            return self._serve_admitted(client_address, message)
+        finally:
+            if self.admission is not None:
+                self.admission.release(request_lane)
+
+    def _serve_admitted(
+        self, client_address: tuple[str, int], message: dict
+    ) -> dict | dfr.Deferred:
+        start_time = time.perf_counter()
+        self.request_context.op = message["type"]
+        self.request_context.forwarded = False
+        with tracing.span(
+            message["type"], message.get("trace", None), client=client_address
+        ) as request_span:
+            position = ADDRESS_ARGUMENT.get(message["type"], None)
+            if position is not None:
+                request_span.set(address=message["args"][position])
+            return_data = self._dispatch(client_address, message)
+            if isinstance(return_data, dfr.Deferred):
+                request_span.set(deferred=True)
+            else:
+                request_span.set(status=return_data.get("status", None))
+
+        served = "remote" if self.request_context.forwarded else "local"
+
+        def record_latency(_response=None):
+            metrics.registry.observe(
+                "request_latency_seconds",
+                time.perf_counter() - start_time,
+                op=message["type"],
+                served=served,
             )
 
+        if isinstance(return_data, dfr.Deferred):
+            return_data.then(record_latency)
+        else:
+            record_latency()
+        return return_data
+
+    def _dispatch(
+        self, client_address: tuple[str, int], message: dict
+    ) -> dict | dfr.Deferred:
+        """
+        Description:
+        - Serve a message received from a client and return the response,
+        or a Deferred response for requests that wait (lock acquisitions)
+        """
+        args = message.get("args", None)
+        if message.get("direct", False) and not self._owns_request(message):
+            # routing-aware clients send requests directly to the owner,
+            # tell them to refresh their routing table instead of forwarding
+            return {
+                "status": gv.WRONG_OWNER,
+                "message": "server is not the owner of the memory address",
+                "routing_table": self.routing_table.json(),
+            }
+        elif message["type"] == "disconnect":
+            return {"status": gv.SUCCESS, "message": "disconnected"}
+        elif message["type"] == "serve_read":
+            return self.serve_read(client_address, *args)
+        elif message["type"] == "serve_write":
+            return self.serve_write(client_address, *args)
+        elif message["type"] == "serve_read_many":
+            return self.serve_read_many(client_address, *args)
+        elif message["type"] == "serve_read_snapshot":
+            return self.serve_read_snapshot(client_address, *args)
+        elif message["type"] == "serve_acquire_lock":
+            return self.acquire_lock_deferred(client_address, *args)
+        elif message["type"] == "serve_release_lock":
+            return self.serve_release_lock(client_address, *args)
+        elif message["type"] == "serve_renew_lease":
+            return self.serve_renew_lease(client_address, *args)
+        elif message["type"] == "serve_acquire_locks":
+            return self.acquire_locks_deferred(client_address, *args)
+        elif message["type"] == "serve_release_locks":
+            return self.serve_release_locks(client_address, *args)
+        elif message["type"] == "serve_commit_transaction":
+            return self.serve_commit_transaction(client_address, *args)
+        elif message["type"] == "serve_prepare_transaction":
+            return self.serve_prepare_transaction(client_address, *args)
+        elif message["type"] == "serve_decide_transaction":
+            return self.serve_decide_transaction(client_address, *args)
+        elif message["type"] == "serve_transaction_decision":
+            return self.serve_transaction_decision(client_address, *args)
+        elif message["type"] == "serve_update_cache":
+            return self.serve_update_cache(client_address, *args)
+        elif message["type"] == "serve_lww_update":
+            return self.serve_lww_update(client_address, *args)
+        elif message["type"] == "serve_drop_copy":
+            return self.serve_drop_copy(client_address, *args)
+        elif message["type"] == "serve_dump_cache":
+            return self.serve_dump_cache(client_address)
+        elif message["type"] == "serve_routing_table":
+            return self.serve_routing_table(client_address)
+        elif message["type"] == "serve_migrate_range":
+            return self.serve_migrate_range(client_address, *args)
+        elif message["type"] == "serve_import_range":
+            return self.serve_import_range(client_address, *args)
+        elif message["type"] == "serve_import_status":
+            return self.serve_import_status(client_address, *args)
+        elif message["type"] == "serve_update_routing":
+            return self.serve_update_routing(client_address, *args)
+        elif message["type"] == "serve_load_stats":
+            return self.serve_load_stats(client_address, *args)
+        elif message["type"] == "serve_export_range":
+            return self.serve_export_range(client_address, *args)
+        elif message["type"] == "serve_ping":
+            return self.serve_ping(client_address, *args)
+        elif message["type"] == "serve_grant_lease":
+            return self.serve_grant_lease(client_address, *args)
+        elif message["type"] == "serve_replica_lagging":
+            return self.serve_replica_lagging(client_address, *args)
+        elif message["type"] == "serve_snapshot":
+            return self.serve_snapshot(client_address, *args)
+        elif message["type"] == "serve_metrics":
+            return self.serve_metrics(client_address)
+        elif message["type"] == "serve_shm_connect":
+            return self.serve_shm_connect(client_address, *args)
+        else:
+            return {
+                "status": gv.INVALID_OPERATION,
+                "message": "invalid message type",
+            }
+
     def serve_read(
         self,
         client_address: tuple[str, int],
@@ -164,15 +489,20 @@ class Server:
         cascade=True, address is local: outside client made a request to the server that owns the memory address
         cascade=True, address is not local: outside client made a request to a server that doesn't own the memory address
         cascade=False, address is local: inside client (another server) made a request to the server that owns the memory address
-        cascade=False, address is not local: this is the most interesting one and it should never happen. It occurs when a server
+        cascade=False, address is not local: this is the most interesting one. It occurs when a server
         wants to find a memory address that is not local to it. This server requests the address from the server that it thinks owns
-        the address, but that server doesn't have the memory address either. Our system is setup such that all servers should know
-        which server has what memory addresses, thus this should never happen.
+        the address, but that server doesn't have the memory address either. All servers know which server has what memory addresses,
+        but addresses can migrate between servers (see serve_migrate_range) and the routing table of the requesting server may be
+        outdated. The request is then passed on to the new owner, still with cascade=False, since each server that gave away
+        an address knows where it went.
         """
         # potentially new holder of the memory address
         copy_holder = (copy_holder_ip, copy_holder_port)
-        log_msg(
-            f"[READ REQUEST] server {self.server_address}, client {client_address}, address {memory_address}"
+        self.log.info(
+            "READ_REQUEST",
+            category="request",
+            client=client_address,
+            address=memory_address,
         )
         host_server = self._get_server_address(memory_address)
         if host_server is None:
@@ -181,6 +511,13 @@ class Server:
                 "message": "Memory address out of range",
             }
 
+        if self.routing_table.is_eventual(memory_address):
+            response = self._read_eventual(
+                client_address, copy_holder, memory_address, host_server, cascade
+            )
+            if response is not None:
+                return response
+
         if host_server == self.server_address:
             # if the memory address is in the server's memory range
             # read the data from the server's memory and send it back to the client
@@ -190,121 +527,454 @@ class Server:
             try:
                 ret_val, ltag, wtag = self.memory_manager.acquire_lock(memory_address)
                 if not ret_val:
+                    if self._get_server_address(memory_address) != self.server_address:
+                        # the address migrated while we were waiting for its lock
+                        return self.serve_read(
+                            client_address,
+                            copy_holder_ip,
+                            copy_holder_port,
+                            memory_address,
+                            cascade,
+                        )
                     return {"status": gv.ERROR, "message": "Failed to acquire lock"}
                 # cascade=False means this should be the server that owns the memory address
                 # and the copyholder address should be from another server and not an outside client
                 # thus, we add the copy holder to the memory address
                 if not cascade and copy_holder != self.server_address:
                     self.memory_manager.add_copy_holder(memory_address, copy_holder)
-                data = self.memory_manager.read_memory(memory_address)
+                data = self.memory_manager.read_memory(memory_address).encoded_json()
             finally:
                 self.memory_manager.release_lock(memory_address, ltag)
-            data = data.json()
-            response = {
-                "status": gv.SUCCESS,
-                "message": "read successful",
-                **data,
-                "ltag": ltag,
-            }
-            log_msg(
-                f"[READ RESPONSE] server {self.server_address}, client {client_address}, address {memory_address}"
+            response = self._read_response(data, ltag)
+            self.log.info(
+                "READ_RESPONSE",
+                category="request",
+                client=client_address,
+                address=memory_address,
             )
             return response
 
+        if cascade and self._is_replica(memory_address):
+            # replicas serve reads of outside clients directly, reads from other
+            # servers go to the owner, which registers them as copy holders
+            response = self._read_replica(client_address, memory_address)
+            if response is not None:
+                return response
+
+        if not cascade:  # the address migrated (see explanation above)
+            return self._get_from_remote(
+                client_address,
+                memory_address,
+                host_server,
+                "serve_read",
+                [copy_holder_ip, copy_holder_port, memory_address, False],
+                "READ",
+            )
+
         # if the memory address is in the server's shared cache
         # read the data from the shared cache and send it back to the client
         # we request a lock from the server that owns the memory address
         # we compare the wtags (last write tags) to make sure that the cached data is up-to-date
         mem_item = self.shared_memory.read(memory_address)
-        
+        self._record_access(client_address, memory_address, mem_item is None)
+
         if mem_item is not None:
-            ac_lock_val = self.serve_acquire_lock(
-                self.server_address, memory_address, lease_timeout, True
+            return self._read_cached(
+                client_address,
+                copy_holder_ip,
+                copy_holder_port,
+                memory_address,
+                cascade,
+                lease_timeout,
+                mem_item,
             )
-            if ac_lock_val["status"] != gv.SUCCESS:
-                self.shared_memory.remove(memory_address)
-                return ac_lock_val
-            
-            if ac_lock_val["wtag"] == mem_item.wtag:
-                return_value = mem_item.json()
-                rel_lock_val = self.serve_release_lock(
-                    self.server_address,
-                    memory_address,
-                    ac_lock_val["ltag"],
-                    True,
-                )
 
-                if rel_lock_val["status"] != gv.SUCCESS:
-                    self.shared_memory.remove(memory_address)
-                    return rel_lock_val
+        return self._read_remote(client_address, memory_address, host_server)
 
-                if rel_lock_val["wtag"] != mem_item.wtag:
-                    # stale data in cache, fetch from server
-                    self.shared_memory.remove(memory_address)
-                    return self.serve_read(
+    def _read_cached(
+        self,
+        client_address: tuple[str, int],
+        copy_holder_ip: str,
+        copy_holder_port: int,
+        memory_address: int,
+        cascade: bool,
+        lease_timeout: float,
+        mem_item: mp.MemoryItem,
+    ) -> dict | dfr.Deferred:
+        """
+        Description: read a memory address from the shared cache. The lock of the
+        address is acquired from its owner to compare the wtags (last write tags) and
+        make sure that the cached data is up-to-date, then released. Neither keeps a
+        thread waiting (see acquire_lock_deferred), the response is Deferred then.
+        A stale copy is removed from the cache and the address is read again.
+        """
+        response = dfr.Deferred()
+
+        def read_again():
+            # the read waits for the owner, not in the thread that received the lock
+            th.Thread(
+                target=lambda: response.resolve(
+                    self.serve_read(
                         client_address,
                         copy_holder_ip,
                         copy_holder_port,
                         memory_address,
                         cascade,
                     )
+                ),
+                daemon=True,
+            ).start()
 
-                log_msg(
-                    f"[READ RESPONSE] server {self.server_address}, client {client_address}, address {memory_address}"
-                )
-                return {
-                    "status": gv.SUCCESS,
-                    "message": "read successful",
-                    **return_value,
-                    "ltag": ac_lock_val["ltag"],
-                }
-            else:  # give up and then just communicate with the server
+        def released(rel_lock_val, return_value, ltag):
+            if rel_lock_val["status"] != gv.SUCCESS:
+                self.shared_memory.remove(memory_address)
+                response.resolve(rel_lock_val)
+            elif rel_lock_val["wtag"] != mem_item.wtag:
                 # stale data in cache, fetch from server
                 self.shared_memory.remove(memory_address)
+                read_again()
+            else:
+                # the copy is actively read, so it keeps receiving updates
+                self.shared_memory.record_read(memory_address)
+                self.log.info(
+                    "READ_RESPONSE",
+                    category="request",
+                    client=client_address,
+                    address=memory_address,
+                )
+                response.resolve(self._read_response(return_value, ltag))
 
-                rel_lock_val = self.serve_release_lock(
-                    self.server_address,
-                    memory_address,
-                    ac_lock_val["ltag"],
-                    True,
+        def stale_released(rel_lock_val):
+            if rel_lock_val["status"] != gv.SUCCESS:
+                response.resolve(rel_lock_val)
+            else:
+                read_again()
+
+        def acquired(ac_lock_val):
+            try:
+                if ac_lock_val["status"] != gv.SUCCESS:
+                    self.shared_memory.remove(memory_address)
+                    response.resolve(ac_lock_val)
+                elif ac_lock_val["wtag"] == mem_item.wtag:
+                    return_value = mem_item.encoded_json()
+                    dfr.when(
+                        self.release_lock_deferred(memory_address, ac_lock_val["ltag"]),
+                        lambda rel_lock_val: released(
+                            rel_lock_val, return_value, ac_lock_val["ltag"]
+                        ),
+                    )
+                else:  # give up and then just communicate with the server
+                    # stale data in cache, fetch from server
+                    self.shared_memory.remove(memory_address)
+                    dfr.when(
+                        self.release_lock_deferred(memory_address, ac_lock_val["ltag"]),
+                        stale_released,
+                    )
+            except Exception as e:
+                response.resolve(
+                    {"status": gv.ERROR, "message": f"Failed to read with error: {e}"}
                 )
 
-                if rel_lock_val["status"] != gv.SUCCESS:
-                    return rel_lock_val
+        dfr.when(
+            self.acquire_lock_deferred(
+                self.server_address, memory_address, lease_timeout, True
+            ),
+            acquired,
+        )
+        return response.settled()
 
-                return self.serve_read(
-                    client_address,
-                    copy_holder_ip,
-                    copy_holder_port,
+    def _read_remote(
+        self,
+        client_address: tuple[str, int],
+        memory_address: int,
+        host_server: tuple[str, int],
+    ) -> dict | dfr.Deferred:
+        """
+        Description: read a memory address from its owner, which registers this server
+        as a copy holder, and cache it. Concurrent reads of the same address share one
+        request to the owner (single flight): the first one sends it, the next ones
+        get its response once it arrives, without keeping a thread, so that the owner
+        does not receive a burst of identical reads when a hot address is missing from
+        the cache (e.g. after a restart, or after a stale copy was removed).
+        """
+        with self.remote_reads_lock:
+            remote_read = self.remote_reads.get(memory_address, None)
+            leader = remote_read is None
+            if leader:
+                remote_read = self.remote_reads[memory_address] = dfr.Deferred()
+
+        if not leader:
+            metrics.registry.increment("coalesced_reads_total")
+            response = dfr.Deferred()
+            remote_read.then(
+                lambda remote_return: response.resolve(
+                    self._coalesced_response(memory_address, remote_return)
+                )
+            )
+            return response.settled()
+
+        remote_return = {"status": gv.ERROR, "message": "Failed to read from the host"}
+        try:
+            ip, port = self.server_address
+            remote_return = self._get_from_remote(
+                client_address,
+                memory_address,
+                host_server,
+                "serve_read",
+                [ip, port, memory_address, False],
+                "READ",
+            )
+
+            # if requested from remote server, update shared cache
+            if remote_return["status"] == gv.SUCCESS:
+                self.shared_memory.write(
                     memory_address,
-                    cascade,
+                    remote_return["data"],
+                    remote_return["istatus"],
+                    remote_return["wtag"],
+                )
+        finally:
+            with self.remote_reads_lock:
+                self.remote_reads.pop(memory_address, None)
+            remote_read.resolve(remote_return)
+        return remote_return
+
+    def _coalesced_response(self, memory_address: int, remote_return: dict) -> dict:
+        """
+        Return:
+        - the response to a read that shared the request of another one (see
+        _read_remote). An update of the address may have reached the cache since
+        the owner answered, the newer cached copy is returned then
+        """
+        if remote_return["status"] != gv.SUCCESS:
+            return remote_return
+        cached = self.shared_memory.read_item(memory_address)
+        if cached is not None and cached[0]["wtag"] > remote_return["wtag"]:
+            return self._read_response(cached, remote_return["ltag"])
+        return remote_return
+
+    def serve_read_many(
+        self,
+        client_address: tuple[str, int],
+        copy_holder_ip: str,
+        copy_holder_port: int,
+        memory_addresses: list[int],
+        cascade: bool,
+    ):
+        """
+        Description:
+        - Read several memory addresses of this server at once, used to prefetch
+        them (see _prefetch). The copy holder is registered for each of them, as in
+        serve_read with cascade=False
+        - A prefetch never waits: the addresses that this server does not own, or
+        whose lock is held, are left out of the response
+        """
+        copy_holder = (copy_holder_ip, copy_holder_port)
+        self.log.info(
+            "READ_MANY_REQUEST",
+            category="request",
+            client=client_address,
+            addresses=len(memory_addresses),
+        )
+        items = []
+        for memory_address in memory_addresses:
+            if self._get_server_address(memory_address) != self.server_address:
+                continue
+            ret_val, ltag, _ = self.memory_manager.acquire_lock(memory_address, None, 0)
+            if not ret_val:
+                continue
+            try:
+                if not cascade and copy_holder != self.server_address:
+                    self.memory_manager.add_copy_holder(memory_address, copy_holder)
+                items.append(
+                    {
+                        "address": memory_address,
+                        **self.memory_manager.read_memory(memory_address).json(),
+                    }
                 )
+            finally:
+                self.memory_manager.release_lock(memory_address, ltag)
+        return {
+            "status": gv.SUCCESS,
+            "message": "read successful",
+            "items": items,
+        }
+
+    def _record_access(
+        self, client_address: tuple[str, int], memory_address: int, missed: bool
+    ):
+        """
+        Description: tell the prefetcher about a read of a client that missed the
+        cache or read a prefetched copy for the first time, the other hits do not
+        change the access pattern of the client
+        """
+        if not missed:
+            if not self.shared_memory.take_prefetched(memory_address):
+                return
+            metrics.registry.increment("prefetch_hits_total")
+            self.prefetcher.record_use()
+        self.prefetcher.record_miss(client_address, memory_address)
+
+    def _prefetch(self, memory_addresses: list[int]) -> int:
+        """
+        Description: read memory addresses into the cache in the background (see
+        prefetcher.Prefetcher), with one serve_read_many request per owner. The
+        addresses that this server owns, replicates, caches or is reading are left out,
+        as are those whose cache entry holds a copy that is read (see cache.Cache.fill).
+
+        Return:
+        - the number of addresses requested
+        """
+        owner_addresses = {}
+        for memory_address in memory_addresses:
+            host_server = self._get_server_address(memory_address)
+            if (
+                host_server is None
+                or host_server == self.server_address
+                or self._is_replica(memory_address)
+                or memory_address in self.remote_reads
+                or not self.shared_memory.fillable(memory_address)
+            ):
+                continue
+            owner_addresses.setdefault(host_server, []).append(memory_address)
+
+        ip, port = self.server_address
+        for host_server, addresses in owner_addresses.items():
+            self._get_from_remote_deferred(
+                host_server, "serve_read_many", [ip, port, addresses, False]
+            ).then(self._fill_prefetched)
+        prefetched = sum(len(addresses) for addresses in owner_addresses.values())
+        metrics.registry.increment("prefetched_addresses_total", prefetched)
+        return prefetched
+
+    def _fill_prefetched(self, response: dict):
+        if response["status"] != gv.SUCCESS:
+            return
+        for item in response["items"]:
+            self.shared_memory.fill(
+                item["address"], item["data"], item["istatus"], item["wtag"]
+            )
+
+    def serve_read_snapshot(
+        self,
+        client_address: tuple[str, int],
+        memory_addresses: list[int],
+        timestamp: None | int,
+        cascade: bool,
+    ) -> dict | dfr.Deferred:
+        """
+        Description:
+        - Read several memory addresses as they were at the same time, from
+        the versions the owners keep (see MVCC_VERSIONS). No lock is taken, so
+        these reads neither wait for writes nor make them wait
+        - timestamp: time of the snapshot (nanoseconds), None for now. The response
+        carries the timestamp, so that later reads can use the same snapshot
+        - The addresses of other servers are read with one request per owner, all
+        sent at once. An owner whose clock is behind the timestamp moves it past
+        the timestamp (see time_utils), and reads of addresses with a prepared
+        transaction wait for its decision (see serve_prepare_transaction), so
+        that the snapshot cannot change afterwards and has all or none of the
+        writes of a transaction. These waits keep no thread, the response is Deferred
 
-        if not cascade:  # this should never happen (see explanation above)
+        Return:
+        - items[i] has the data and the wtag of memory_addresses[i]. If an owner
+        garbage collected the versions of that time (see MVCC_RETENTION), the
+        status is ERROR
+        """
+        self.log.info(
+            "READ_SNAPSHOT_REQUEST",
+            category="request",
+            client=client_address,
+            addresses=memory_addresses,
+        )
+        if MVCC_VERSIONS <= 0:
             return {
-                "status": gv.ERROR,
-                "message": f"Read host address {host_server} is not the server address {self.server_address}",
+                "status": gv.INVALID_OPERATION,
+                "message": "snapshot reads are disabled (MVCC_VERSIONS)",
             }
+        if timestamp is None:
+            timestamp = self.memory_manager.version_time()
 
-        ip, port = self.server_address
-        remote_return = self._get_from_remote(
-            client_address,
-            memory_address,
-            host_server,
-            "serve_read",
-            [ip, port, memory_address, False],
-            "READ",
+        owners = {}  # server address -> indexes of its addresses
+        for index, memory_address in enumerate(memory_addresses):
+            host_server = self._get_server_address(memory_address)
+            if host_server is None:
+                return {
+                    "status": gv.INVALID_ADDRESS,
+                    "message": "Memory address out of range",
+                }
+            owners.setdefault(host_server, []).append(index)
+
+        responses = []  # (indexes, response of the owner)
+        for host_server, indexes in owners.items():
+            addresses = [memory_addresses[index] for index in indexes]
+            if host_server == self.server_address:
+                response = self._read_versions(addresses, timestamp)
+            else:
+                # with cascade=False the addresses migrated, see explanation in serve_read
+                response = self._get_from_remote_deferred(
+                    host_server, "serve_read_snapshot", [addresses, timestamp, False]
+                )
+            responses.append((indexes, response))
+
+        def merge(owner_responses):
+            items = [None] * len(memory_addresses)
+            for (indexes, _), response in zip(responses, owner_responses):
+                if response["status"] != gv.SUCCESS:
+                    return response
+                for index, item in zip(indexes, response["items"]):
+                    items[index] = item
+            self.log.info(
+                "READ_SNAPSHOT_RESPONSE",
+                category="request",
+                client=client_address,
+                addresses=memory_addresses,
+            )
+            return {
+                "status": gv.SUCCESS,
+                "message": "read successful",
+                "timestamp": timestamp,
+                "items": items,
+            }
+
+        result = dfr.Deferred()
+        dfr.gather([response for _, response in responses]).then(
+            lambda owner_responses: result.resolve(merge(owner_responses))
         )
+        return result.settled()
 
-        # if requested from remote server, update shared cache
-        if remote_return["status"] == gv.SUCCESS:
-            self.shared_memory.write(
-                memory_address,
-                remote_return["data"],
-                remote_return["istatus"],
-                remote_return["wtag"],
+    def _read_versions(self, addresses: list[int], timestamp: int) -> dict | dfr.Deferred:
+        """
+        Description: read addresses of this server as of timestamp, see serve_read_snapshot
+        """
+        # the clock does not merge timestamps further ahead (see time_utils)
+        if (timestamp - tu.get_physical_time()) / 1e9 > gv.CLOCK_MAX_OFFSET:
+            return {"status": gv.ERROR, "message": "snapshot timestamp is in the future"}
+        # writes after this one get versions newer than the snapshot
+        self.memory_manager.version_time(timestamp)
+
+        pending = [
+            self.memory_manager.pending_version(memory_address, timestamp)
+            for memory_address in addresses
+        ]
+        pending = [deferred for deferred in pending if deferred is not None]
+        if pending:
+            response = dfr.Deferred()
+            dfr.gather(pending).then(
+                lambda _: response.resolve(self._read_versions(addresses, timestamp))
             )
-        return remote_return
+            return response.settled()
+
+        items = []
+        for memory_address in addresses:
+            version = self.memory_manager.read_version(memory_address, timestamp)
+            if version is None:
+                return {
+                    "status": gv.ERROR,
+                    "message": f"snapshot too old for address {memory_address}",
+                }
+            items.append({"data": version[0], "wtag": version[1]})
+        return {"status": gv.SUCCESS, "message": "read successful", "items": items}
 
     def serve_write(
         self,
@@ -325,10 +995,16 @@ class Server:
 
         - If the memory address is not in the server's memory range, the server
         forwards the request to the appropriate server
+
+        - Writes to eventually consistent addresses are applied by any server holding
+        a copy, without taking the lock of the address (see _write_eventual)
         """
         copy_holder = (copy_holder_ip, copy_holder_port)
-        log_msg(
-            f"[WRITE REQUEST] server {self.server_address}, client {client_address}, address {memory_address}"
+        self.log.info(
+            "WRITE_REQUEST",
+            category="request",
+            client=client_address,
+            address=memory_address,
         )
         host_server = self._get_server_address(memory_address)
         if host_server is None:
@@ -337,11 +1013,30 @@ class Server:
                 "message": "Memory address out of range",
             }
 
+        if self.routing_table.is_eventual(memory_address):
+            response = self._write_eventual(
+                client_address, memory_address, data, host_server
+            )
+            if response is not None:
+                return response
+
         if host_server == self.server_address:
+            if self._fenced(memory_address):
+                return self._fenced_response(memory_address)
             ltag = -1
             try:
                 ret_val, ltag, wtag = self.memory_manager.acquire_lock(memory_address)
                 if not ret_val:
+                    if self._get_server_address(memory_address) != self.server_address:
+                        # the address migrated while we were waiting for its lock
+                        return self.serve_write(
+                            client_address,
+                            copy_holder_ip,
+                            copy_holder_port,
+                            memory_address,
+                            data,
+                            cascade,
+                        )
                     return {"status": gv.ERROR, "message": "Failed to acquire lock"}
                 # cascade=False means this should be the server that owns the memory address
                 # and the copyholder address should be from another server and not an outside client
@@ -349,29 +1044,34 @@ class Server:
                 if not cascade and copy_holder != self.server_address:
                     self.memory_manager.add_copy_holder(memory_address, copy_holder)
                 self.memory_manager.write_memory(memory_address, data)
-                # update shared copies in the system, if they exist!
-                if self.memory_manager.read_memory(memory_address).status == "S":
+                # update shared copies and replicas in the system, if they exist!
+                if (
+                    self.memory_manager.read_memory(memory_address).status == "S"
+                    or self._get_replicas(memory_address)
+                ):
                     self._update_shared_copies(client_address, memory_address)
+            except OSError as e:
+                # the write-ahead log failed, the write is not applied
+                self.log.error("WRITE_FAILED", address=memory_address, error=e)
+                return {"status": gv.ERROR, "message": f"write failed: {e}"}
             finally:
                 self.memory_manager.release_lock(memory_address, ltag)
             response = {
                 "status": gv.SUCCESS,
                 "message": "write successful",
             }
-            log_msg(
-                f"[WRITE RESPONSE] server {self.server_address}, client {client_address}, address {memory_address}"
+            self.log.info(
+                "WRITE_RESPONSE",
+                category="request",
+                client=client_address,
+                address=memory_address,
             )
             return response
 
-        if not cascade:  # this should never happen (see explanation above)
-            return {
-                "status": gv.ERROR,
-                "message": f"Write host address {host_server} is not the server address {self.server_address}",
-            }
-
         # if the memory address is not in the server's memory range
         # forward the request to the appropriate server
-        ip, port = self.server_address
+        # (with cascade=False the address migrated, see explanation in serve_read)
+        ip, port = self.server_address if cascade else copy_holder
         return self._get_from_remote(
             client_address,
             memory_address,
@@ -390,9 +1090,46 @@ class Server:
         memory_address: int,
         lease_timeout: float,
         cascade: bool,
+        wait_timeout: None | float = None,
     ):
-        log_msg(
-            f"[ACQUIRE LOCK REQUEST] server {self.server_address}, client {client_address}, memory address {memory_address}"
+        """
+        Description:
+        - Acquire the lock of a memory address for lease_timeout seconds
+        (see serve_renew_lease to extend the lease)
+        - wait_timeout: seconds to wait for the lock, None waits as long as needed
+        and 0 only tries. If the lock is not acquired in time, the response has
+        ret_val False, like the release of a lock that was already released
+        - The calling thread waits for the lock. Requests of clients wait without
+        a thread, see acquire_lock_deferred
+        """
+        response = self.acquire_lock_deferred(
+            client_address, memory_address, lease_timeout, cascade, wait_timeout
+        )
+        if isinstance(response, dfr.Deferred):
+            response = response.wait()
+        return response
+
+    def acquire_lock_deferred(
+        self,
+        client_address: tuple[str, int],
+        memory_address: int,
+        lease_timeout: float,
+        cascade: bool,
+        wait_timeout: None | float = None,
+    ) -> dict | dfr.Deferred:
+        """
+        Description:
+        - Same as serve_acquire_lock, but a request that has to wait for the lock
+        is queued on the lock and a Deferred response is returned, resolved once
+        the lock is handed over to the request or wait_timeout passes
+        - Requests for the addresses of other servers are forwarded through a
+        multiplexed connection, so the wait keeps no thread on either server
+        """
+        self.log.info(
+            "ACQUIRE_LOCK_REQUEST",
+            category="request",
+            client=client_address,
+            address=memory_address,
         )
         host_server = self._get_server_address(memory_address)
         if host_server is None:
@@ -402,66 +1139,110 @@ class Server:
             }
 
         if host_server == self.server_address:
-            try:
-                ret_val, ltag, wtag = self.memory_manager.acquire_lock(
-                    memory_address, lease_timeout
-                )
-
-                response = None
-                if ret_val:
-                    response = {
-                        "status": gv.SUCCESS,
-                        "message": "lock acquired",
-                        "ret_val": ret_val,
-                        "ltag": ltag,
-                        "wtag": wtag,
-                    }
-                else:
-                    response = {"status": gv.ERROR, "message": "lock not acquired"}
-                log_msg(
-                    f"[ACQUIRE LOCK RESPONSE] server {self.server_address}, client {client_address}, memory address {memory_address}"
-                )
-            except Exception as e:
-                response = {
-                    "status": gv.ERROR,
-                    "message": f"Failed to acquire lock with error: {e}",
-                }
-            finally:
-                return response
+            if self._fenced(memory_address):
+                return self._fenced_response(memory_address)
+            response = dfr.Deferred()
+
+            def granted(ret_val, ltag, wtag):
+                # called by the thread that released the lock, or when the wait ends
+                try:
+                    response.resolve(
+                        self._acquire_lock_response(
+                            client_address,
+                            memory_address,
+                            lease_timeout,
+                            cascade,
+                            wait_timeout,
+                            ret_val,
+                            ltag,
+                            wtag,
+                        )
+                    )
+                except Exception as e:
+                    response.resolve(
+                        {
+                            "status": gv.ERROR,
+                            "message": f"Failed to acquire lock with error: {e}",
+                        }
+                    )
 
-        if not cascade:
-            return {
-                "status": gv.ERROR,
-                "message": f"Lock host address {host_server} is not the server address {self.server_address}",
-            }
+            result = self.memory_manager.acquire_lock_deferred(
+                memory_address, granted, lease_timeout, wait_timeout
+            )
+            if result is not None:
+                granted(*result)
+            return response.settled()
 
-        return self._get_from_remote(
-            client_address,
-            memory_address,
+        # with cascade=False the address migrated, see explanation in serve_read
+        return self._get_from_remote_deferred(
             host_server,
             "serve_acquire_lock",
-            [memory_address, lease_timeout, False],
-            "ACQUIRE LOCK",
+            [memory_address, lease_timeout, False, wait_timeout],
         )
 
-    def serve_release_lock(
+    def _acquire_lock_response(
         self,
         client_address: tuple[str, int],
         memory_address: int,
-        ltag: int,
+        lease_timeout: float,
         cascade: bool,
-    ):
-        log_msg(
-            f"[RELEASE LOCK REQUEST] server {self.server_address}, client {client_address}, address {memory_address}"
-        )
-        host_server = self._get_server_address(memory_address)
-        if host_server is None:
-            return {
-                "status": gv.INVALID_ADDRESS,
-                "message": "Memory address out of range",
-            }
-
-        if host_server == self.server_address:
+        wait_timeout: None | float,
+        ret_val: bool,
+        ltag: int,
+        wtag: int,
+    ) -> dict | dfr.Deferred:
+        if not ret_val and self._get_server_address(memory_address) != self.server_address:
+            # the address migrated while we were waiting for its lock
+            return self.acquire_lock_deferred(
+                client_address, memory_address, lease_timeout, cascade, wait_timeout
+            )
+        elif ret_val:
+            response = {
+                "status": gv.SUCCESS,
+                "message": "lock acquired",
+                "ret_val": ret_val,
+                "ltag": ltag,
+                "wtag": wtag,
+            }
+        elif wait_timeout is not None:
+            response = {
+                "status": gv.SUCCESS,
+                "message": "lock is held by another client",
+                "ret_val": False,
+                "ltag": -1,
+                "wtag": -1,
+            }
+        else:
+            response = {"status": gv.ERROR, "message": "lock not acquired"}
+        self.log.info(
+            "ACQUIRE_LOCK_RESPONSE",
+            category="request",
+            client=client_address,
+            address=memory_address,
+        )
+        return response
+
+    def serve_release_lock(
+        self,
+        client_address: tuple[str, int],
+        memory_address: int,
+        ltag: int,
+        cascade: bool,
+    ):
+        self.log.info(
+            "RELEASE_LOCK_REQUEST",
+            category="request",
+            client=client_address,
+            address=memory_address,
+        )
+        host_server = self._get_server_address(memory_address)
+        if host_server is None:
+            return {
+                "status": gv.INVALID_ADDRESS,
+                "message": "Memory address out of range",
+            }
+
+        if host_server == self.server_address:
             ret_val, ltag, wtag = self.memory_manager.release_lock(memory_address, ltag)
             response = None
             if ret_val:
@@ -480,17 +1261,15 @@ class Server:
                     "ltag": ltag,
                     "wtag": wtag,
                 }
-            log_msg(
-                f"[RELEASE LOCK RESPONSE] server {self.server_address}, client {client_address}, address {memory_address}"
+            self.log.info(
+                "RELEASE_LOCK_RESPONSE",
+                category="request",
+                client=client_address,
+                address=memory_address,
             )
             return response
 
-        if not cascade:
-            return {
-                "status": gv.ERROR,
-                "message": f"Lock host address {host_server} is not the server address {self.server_address}",
-            }
-
+        # with cascade=False the address migrated, see explanation in serve_read
         return self._get_from_remote(
             client_address,
             memory_address,
@@ -500,130 +1279,2031 @@ class Server:
             "RELEASE LOCK",
         )
 
-    def serve_update_cache(
+    def release_lock_deferred(
+        self, memory_address: int, ltag: int
+    ) -> dict | dfr.Deferred:
+        """
+        Description: release a lock acquired with acquire_lock_deferred for this server.
+        The lock of an address of another server is released through the multiplexed
+        connection, so the calling thread (e.g. the one that received the lock) does
+        not wait for the response.
+        """
+        host_server = self._get_server_address(memory_address)
+        if host_server is None or host_server == self.server_address:
+            return self.serve_release_lock(self.server_address, memory_address, ltag, True)
+        return self._get_from_remote_deferred(
+            host_server,
+            "serve_release_lock",
+            [memory_address, ltag, False],
+        )
+
+    def serve_renew_lease(
+        self,
+        client_address: tuple[str, int],
+        memory_address: int,
+        ltag: int,
+        lease_timeout: float,
+        cascade: bool,
+    ):
+        """
+        Description:
+        - Extend the lease of a lock to lease_timeout seconds from now, if ltag
+        (returned by serve_acquire_lock) still holds the lock. Holders renew short
+        leases while they work, so that the lock of a failed client is released soon.
+        """
+        self.log.info(
+            "RENEW_LEASE_REQUEST",
+            category="request",
+            client=client_address,
+            address=memory_address,
+        )
+        host_server = self._get_server_address(memory_address)
+        if host_server is None:
+            return {
+                "status": gv.INVALID_ADDRESS,
+                "message": "Memory address out of range",
+            }
+
+        if host_server == self.server_address:
+            ret_val = self.memory_manager.renew_lease(memory_address, ltag, lease_timeout)
+            return {
+                "status": gv.SUCCESS,
+                "message": "lease renewed" if ret_val else "lock was already released",
+                "ret_val": ret_val,
+                "ltag": ltag,
+            }
+
+        # with cascade=False the address migrated, see explanation in serve_read
+        return self._get_from_remote(
+            client_address,
+            memory_address,
+            host_server,
+            "serve_renew_lease",
+            [memory_address, ltag, lease_timeout, False],
+            "RENEW LEASE",
+        )
+
+    # serve_acquire_locks and serve_release_locks acquire and release the locks of
+    # several memory addresses at once, for critical sections over several addresses
+
+    def serve_acquire_locks(
+        self,
+        client_address: tuple[str, int],
+        memory_addresses: list[int],
+        lease_timeout: float,
+        cascade: bool,
+        wait_timeout: None | float = None,
+    ):
+        """
+        Description:
+        - Acquire the locks of several memory addresses, all of them or none
+        - The calling thread waits for the locks. Requests of clients wait without
+        a thread, see acquire_locks_deferred
+        """
+        response = self.acquire_locks_deferred(
+            client_address, memory_addresses, lease_timeout, cascade, wait_timeout
+        )
+        if isinstance(response, dfr.Deferred):
+            response = response.wait()
+        return response
+
+    def acquire_locks_deferred(
+        self,
+        client_address: tuple[str, int],
+        memory_addresses: list[int],
+        lease_timeout: float,
+        cascade: bool,
+        wait_timeout: None | float = None,
+    ) -> dict | dfr.Deferred:
+        """
+        Description:
+        - Acquire the locks of several memory addresses, all of them or none
+        - The locks are acquired in ascending address order, the same order on
+        all the servers, so two requests for overlapping addresses never
+        deadlock. Consecutive addresses of the same owner are acquired with one
+        request to the owner, i.e. one round trip per owner (per range of the
+        owner, if the addresses span several ranges of it)
+        - wait_timeout: seconds to wait for all the locks, None waits as long as
+        needed. If the locks are not acquired in time, the locks acquired so far
+        are released and the response has ret_val False
+
+        Return:
+        - the response lists the addresses in ascending order, with the ltag and
+        the wtag of each (see serve_release_locks)
+        """
+        self.log.info(
+            "ACQUIRE_LOCKS_REQUEST",
+            category="request",
+            client=client_address,
+            addresses=memory_addresses,
+        )
+        steps = []  # [owner, addresses] of consecutive addresses with the same owner
+        for memory_address in sorted(set(memory_addresses)):
+            host_server = self._get_server_address(memory_address)
+            if host_server is None:
+                return {
+                    "status": gv.INVALID_ADDRESS,
+                    "message": "Memory address out of range",
+                }
+            if host_server == self.server_address:
+                steps.append([host_server, [memory_address]])  # acquired one by one
+            elif steps and steps[-1][0] == host_server:
+                steps[-1][1].append(memory_address)
+            else:
+                steps.append([host_server, [memory_address]])
+
+        deadline = None if wait_timeout is None else time.monotonic() + wait_timeout
+        acquired = {"addresses": [], "ltags": [], "wtags": []}
+        response = dfr.Deferred()
+
+        def acquire(index):
+            if index == len(steps):
+                self.log.info(
+                    "ACQUIRE_LOCKS_RESPONSE",
+                    category="request",
+                    client=client_address,
+                    addresses=memory_addresses,
+                )
+                response.resolve(
+                    {
+                        "status": gv.SUCCESS,
+                        "message": "locks acquired",
+                        "ret_val": True,
+                        **acquired,
+                    }
+                )
+                return
+            host_server, addresses = steps[index]
+            remaining = None
+            if deadline is not None:
+                remaining = max(0.0, deadline - time.monotonic())
+            if host_server == self.server_address:
+                step_response = self.acquire_lock_deferred(
+                    client_address, addresses[0], lease_timeout, cascade, remaining
+                )
+            else:
+                # with cascade=False the addresses migrated, see explanation in serve_read
+                step_response = self._get_from_remote_deferred(
+                    host_server,
+                    "serve_acquire_locks",
+                    [addresses, lease_timeout, False, remaining],
+                )
+            dfr.when(step_response, lambda step_response: step_done(index, step_response))
+
+        def step_done(index, step_response):
+            # called by the thread that released the lock, or when the wait ends
+            if step_response["status"] == gv.SUCCESS and step_response["ret_val"]:
+                if "ltags" in step_response:
+                    for key in acquired:
+                        acquired[key].extend(step_response[key])
+                else:
+                    acquired["addresses"].append(steps[index][1][0])
+                    acquired["ltags"].append(step_response["ltag"])
+                    acquired["wtags"].append(step_response["wtag"])
+                acquire(index + 1)
+                return
+
+            # roll back, nobody waits for the releases
+            self.serve_release_locks(
+                client_address, acquired["addresses"], acquired["ltags"], cascade
+            )
+            if step_response["status"] == gv.SUCCESS:
+                step_response = {
+                    "status": gv.SUCCESS,
+                    "message": "locks are held by other clients",
+                    "ret_val": False,
+                    "addresses": [],
+                    "ltags": [],
+                    "wtags": [],
+                }
+            response.resolve(step_response)
+
+        acquire(0)
+        return response.settled()
+
+    def serve_release_locks(
+        self,
+        client_address: tuple[str, int],
+        memory_addresses: list[int],
+        ltags: list[int],
+        cascade: bool,
+    ) -> dict | dfr.Deferred:
+        """
+        Description:
+        - Release the locks of several memory addresses (ltags[i] is the ltag of
+        memory_addresses[i]), with one request to each owner, sent at once
+
+        Return:
+        - ret_vals[i] is the ret_val of the release of memory_addresses[i],
+        ret_val is True if all the locks were released
+        """
+        self.log.info(
+            "RELEASE_LOCKS_REQUEST",
+            category="request",
+            client=client_address,
+            addresses=memory_addresses,
+        )
+        owners = {}  # server address -> indexes of its addresses
+        for index, memory_address in enumerate(memory_addresses):
+            host_server = self._get_server_address(memory_address)
+            if host_server is None:
+                return {
+                    "status": gv.INVALID_ADDRESS,
+                    "message": "Memory address out of range",
+                }
+            owners.setdefault(host_server, []).append(index)
+
+        ret_vals = [False] * len(memory_addresses)
+        responses = []
+        for host_server, indexes in owners.items():
+            if host_server == self.server_address:
+                for index in indexes:
+                    ret_vals[index] = self.memory_manager.release_lock(
+                        memory_addresses[index], ltags[index]
+                    )[0]
+                continue
+            # with cascade=False the addresses migrated, see explanation in serve_read
+            remote_response = self._get_from_remote_deferred(
+                host_server,
+                "serve_release_locks",
+                [
+                    [memory_addresses[index] for index in indexes],
+                    [ltags[index] for index in indexes],
+                    False,
+                ],
+            )
+            responses.append((indexes, remote_response))
+
+        def released(remote_responses):
+            response = {"status": gv.SUCCESS, "message": "locks released"}
+            for (indexes, _), remote_response in zip(responses, remote_responses):
+                if remote_response["status"] != gv.SUCCESS:
+                    response = remote_response
+                    continue
+                for index, ret_val in zip(indexes, remote_response["ret_vals"]):
+                    ret_vals[index] = ret_val
+            self.log.info(
+                "RELEASE_LOCKS_RESPONSE",
+                category="request",
+                client=client_address,
+                addresses=memory_addresses,
+            )
+            return {
+                "status": response["status"],
+                "message": response["message"],
+                "ret_val": all(ret_vals),
+                "ret_vals": ret_vals,
+            }
+
+        gathered = dfr.gather([remote_response for _, remote_response in responses])
+        result = dfr.Deferred()
+        gathered.then(lambda remote_responses: result.resolve(released(remote_responses)))
+        return result.settled()
+
+    # serve_commit_transaction commits an optimistic transaction of a client,
+    # the owners of its addresses validate and apply it with a two-phase commit
+
+    def serve_commit_transaction(
+        self,
+        client_address: tuple[str, int],
+        reads: list[list],
+        writes: list[list],
+        cascade: bool,
+    ):
+        """
+        Description:
+        - Commit a transaction of a client. reads are [memory address, wtag of
+        the value the client read] and writes are [memory address, data]
+        - The writes are applied only if none of the addresses read was written
+        since (same wtag) and no other request holds the lock of an address of
+        the transaction. Otherwise the transaction is aborted: the response has
+        ret_val False, conflicts lists the addresses, and the client may run
+        the transaction again
+        - Phase one sends one prepare request to each owner, all at once. The
+        owner locks its addresses without waiting, validates the wtags and keeps
+        the locks. Phase two asks the owners to apply the writes (with
+        write-update of the copies) and release the locks, or only to release
+        the locks if an owner refused. With a single owner, the transaction is
+        prepared and applied with one request.
+        - The decision is kept until all the owners received it. An owner whose
+        decision is lost asks for it (see serve_transaction_decision) instead of
+        aborting on its own, and an owner that asks before the decision aborts
+        the transaction. A commit is saved in the write-ahead log before phase
+        two, so that it is still known after a restart.
+        """
+        self.log.info("COMMIT_REQUEST", category="request", client=client_address)
+        owners = {}  # server address -> [reads, writes] of its addresses
+        for position, items in ((0, reads), (1, writes)):
+            for item in items:
+                host_server = self._get_server_address(item[0])
+                if host_server is None:
+                    return {
+                        "status": gv.INVALID_ADDRESS,
+                        "message": "Memory address out of range",
+                    }
+                owners.setdefault(host_server, [[], []])[position].append(item)
+
+        transaction_id = f"{self.transaction_prefix}:{next(self.transaction_ids)}"
+        apply_now = len(owners) == 1
+        if not apply_now:
+            with self.transactions_lock:
+                self.transaction_decisions[transaction_id] = [None, None, set(owners), None]
+        # the owners ask for the decision PREPARED_TIMEOUT seconds after they voted,
+        # it is not commit anymore once the votes took longer than this
+        deadline = time.monotonic() + TRANSACTION_TIMEOUT
+        votes = dfr.gather(
+            [
+                self._transaction_request(
+                    host_server,
+                    "serve_prepare_transaction",
+                    [transaction_id, owner_reads, owner_writes, apply_now, self.server_address],
+                )
+                for host_server, (owner_reads, owner_writes) in owners.items()
+            ]
+        ).wait(TRANSACTION_TIMEOUT)
+
+        commit = (
+            votes is not None
+            and time.monotonic() < deadline
+            and all(vote["status"] == gv.SUCCESS and vote["ret_val"] for vote in votes)
+        )
+        if not apply_now:
+            commit_time = None
+            if commit:
+                commit_time = max(vote["prepare_time"] for vote in votes)
+            commit, commit_time = self._decide_transaction(
+                transaction_id, commit, commit_time
+            ).wait()
+            decisions = dfr.gather(
+                [
+                    self._transaction_request(
+                        host_server,
+                        "serve_decide_transaction",
+                        [transaction_id, commit, commit_time],
+                    )
+                    for host_server in owners
+                ]
+            ).wait(TRANSACTION_TIMEOUT)
+            for host_server, decision in zip(owners, decisions or []):
+                if decision["status"] == gv.SUCCESS:
+                    self._transaction_informed(transaction_id, host_server)
+
+        if commit:
+            # owners that did not receive the decision apply it when they ask for it
+            response = {
+                "status": gv.SUCCESS,
+                "message": "transaction committed",
+                "ret_val": True,
+                "conflicts": [],
+            }
+        elif votes is None or any(vote["status"] != gv.SUCCESS for vote in votes):
+            response = {"status": gv.ERROR, "message": "transaction aborted, an owner failed"}
+        else:
+            response = {
+                "status": gv.SUCCESS,
+                "message": "transaction aborted",
+                "ret_val": False,
+                "conflicts": sorted(
+                    address for vote in votes for address in vote["conflicts"]
+                ),
+            }
+        self.log.info(
+            "COMMIT_RESPONSE", category="request", client=client_address, committed=commit
+        )
+        return response
+
+    def serve_prepare_transaction(
+        self,
+        client_address: tuple[str, int],
+        transaction_id: str,
+        reads: list[list],
+        writes: list[list],
+        apply_now: bool,
+        coordinator: tuple[str, int],
+    ):
+        """
+        Description:
+        - Phase one of serve_commit_transaction, on the owner of the addresses:
+        lock them in ascending order without waiting, so prepared transactions
+        never wait for each other, and validate the wtags of the reads
+        - The locks are kept until serve_decide_transaction. If the decision does
+        not arrive within PREPARED_TIMEOUT seconds, the owner asks the coordinator
+        (the server running serve_commit_transaction) for it
+        - apply_now: the server owns all the addresses of the transaction, apply
+        the writes at once
+        """
+        locks = []  # [memory address, ltag]
+        conflicts = []
+        for memory_address in sorted({item[0] for item in reads + writes}):
+            ret_val = False
+            if (
+                self._get_server_address(memory_address) == self.server_address
+                and not self._fenced(memory_address)
+            ):
+                ret_val, ltag, _ = self.memory_manager.acquire_lock(
+                    memory_address, None, 0
+                )
+            if not ret_val:
+                # locked, moved to another server, or the owner is fenced
+                conflicts.append(memory_address)
+                break
+            locks.append([memory_address, ltag])
+        if not conflicts:
+            conflicts = [
+                memory_address
+                for memory_address, wtag in reads
+                if self.memory_manager.read_memory(memory_address).wtag != wtag
+            ]
+        if conflicts:
+            self._release_transaction_locks(locks)
+            return {
+                "status": gv.SUCCESS,
+                "message": "transaction conflicts",
+                "ret_val": False,
+                "conflicts": conflicts,
+            }
+
+        # the writes get the same version time on all the owners, see serve_read_snapshot
+        prepare_time = self.memory_manager.prepare_versions(
+            [memory_address for memory_address, _ in writes]
+        )
+        with self.transactions_lock:
+            self.prepared_transactions[transaction_id] = (locks, writes)
+        if apply_now:
+            return {
+                **self.serve_decide_transaction(
+                    client_address, transaction_id, True, prepare_time
+                ),
+                "conflicts": [],
+            }
+        sc.scheduler.call_later(
+            PREPARED_TIMEOUT,
+            self._ask_transaction_decision,
+            (coordinator[0], coordinator[1]),
+            transaction_id,
+        )
+        return {
+            "status": gv.SUCCESS,
+            "message": "transaction prepared",
+            "ret_val": True,
+            "conflicts": [],
+            "prepare_time": prepare_time,
+        }
+
+    def serve_decide_transaction(
+        self,
+        client_address: tuple[str, int],
+        transaction_id: str,
+        commit: bool,
+        commit_time: None | int = None,
+    ):
+        """
+        Description:
+        - Phase two of serve_commit_transaction: apply the writes of a prepared
+        transaction if commit, then release its locks
+        - commit_time: version time of the writes, the latest prepare time of the owners
+        - ret_val is False if the transaction is not prepared (anymore), e.g.
+        this server asked the coordinator for the decision and applied it already
+        """
+        with self.transactions_lock:
+            prepared = self.prepared_transactions.pop(transaction_id, None)
+        if prepared is None:
+            return {
+                "status": gv.SUCCESS,
+                "message": "transaction not prepared",
+                "ret_val": False,
+            }
+
+        locks, writes = prepared
+        try:
+            if commit:
+                # all the writes are logged before any is applied
+                self.memory_manager.write_many(writes, commit_time)
+                for memory_address, _ in writes:
+                    # update shared copies and replicas, see serve_write
+                    if (
+                        self.memory_manager.read_memory(memory_address).status == "S"
+                        or self._get_replicas(memory_address)
+                    ):
+                        self._update_shared_copies(client_address, memory_address)
+        except OSError as e:
+            # the write-ahead log failed, none of the writes is applied
+            self.log.error("TRANSACTION_WRITE_FAILED", transaction=transaction_id, error=e)
+            return {"status": gv.ERROR, "message": f"transaction writes failed: {e}"}
+        finally:
+            self.memory_manager.finish_versions(
+                [memory_address for memory_address, _ in writes]
+            )
+            self._release_transaction_locks(locks)
+        return {
+            "status": gv.SUCCESS,
+            "message": "transaction committed" if commit else "transaction aborted",
+            "ret_val": commit,
+        }
+
+    def serve_transaction_decision(
+        self,
+        client_address: tuple[str, int],
+        transaction_id: str,
+        owner: tuple[str, int],
+    ):
+        """
+        Description:
+        - Decision of a transaction coordinated by this server, asked by an owner
+        that prepared it and did not receive the decision
+        - A transaction that is not decided yet is aborted, so that the owner can
+        release its locks. A transaction that is not known anymore was decided and
+        all its owners received the decision already, or was aborted: commits are
+        kept in the write-ahead log until all the owners know them
+        - Without a write-ahead log, the decisions of the transactions coordinated
+        before a restart are lost. They are answered with an error, the owner keeps
+        its locks and asks again
+
+        Return:
+        - ret_val: the decision, True for commit
+        - commit_time: version time of the writes if commit
+        """
+        with self.transactions_lock:
+            known = transaction_id in self.transaction_decisions
+        if (
+            not known
+            and self.memory_manager.wal is None
+            and not transaction_id.startswith(self.transaction_prefix + ":")
+        ):
+            self.log.warning("TRANSACTION_DECISION_UNKNOWN", transaction=transaction_id)
+            return {
+                "status": gv.ERROR,
+                "message": "transaction decision lost by a restart",
+            }
+
+        response = dfr.Deferred()
+
+        def answer(decision: tuple[bool, None | int]):
+            commit, commit_time = decision
+            self._transaction_informed(transaction_id, (owner[0], owner[1]))
+            response.resolve(
+                {
+                    "status": gv.SUCCESS,
+                    "message": "transaction committed" if commit else "transaction aborted",
+                    "ret_val": commit,
+                    "commit_time": commit_time,
+                }
+            )
+
+        self._decide_transaction(transaction_id, False, None).then(answer)
+        return response.settled()
+
+    def _decide_transaction(
+        self, transaction_id: str, commit: bool, commit_time: None | int
+    ) -> dfr.Deferred:
+        """
+        Description: decide a transaction coordinated by this server, unless it is
+        decided already. A commit is saved in the write-ahead log before any owner
+        learns it, it is an abort if it cannot be saved.
+
+        Return:
+        - a Deferred resolved with the decision and the version time of its writes,
+        once they can be sent to the owners
+        """
+        with self.transactions_lock:
+            decision = self.transaction_decisions.get(transaction_id)
+            if decision is None:
+                decided = dfr.Deferred()
+                decided.resolve((False, None))
+                return decided
+            if decision[0] is not None:
+                return decision[3]
+            decision[0], decision[1] = commit, commit_time
+            decision[3] = decided = dfr.Deferred()
+            owners = sorted(decision[2])
+
+        wal = self.memory_manager.wal
+        if commit and wal is not None:
+            try:
+                wal.log_decision(transaction_id, commit_time, owners)
+            except OSError as e:
+                self.log.error("TRANSACTION_DECISION_FAILED", transaction=transaction_id, error=e)
+                with self.transactions_lock:
+                    decision[0], decision[1] = False, None
+        decided.resolve((decision[0], decision[1]))
+        return decided
+
+    def _transaction_informed(self, transaction_id: str, owner: tuple[str, int]):
+        """
+        Description: the owner knows the decision of the transaction, which is
+        forgotten once all its owners know it
+        """
+        with self.transactions_lock:
+            decision = self.transaction_decisions.get(transaction_id)
+            if decision is None or decision[0] is None:
+                return
+            decision[2].discard(owner)
+            if decision[2]:
+                return
+            del self.transaction_decisions[transaction_id]
+        if decision[0] and self.memory_manager.wal is not None:
+            self.memory_manager.wal.forget_decision(transaction_id)
+
+    def _finish_transactions(self):
+        """
+        Description: send the commits restored from the write-ahead log to the
+        owners that may not know them, the owners that do not answer ask for
+        them later (see serve_transaction_decision)
+        """
+        with self.transactions_lock:
+            decisions = [
+                (transaction_id, decision[1], list(decision[2]))
+                for transaction_id, decision in self.transaction_decisions.items()
+            ]
+
+        def informed(response: dict, transaction_id: str, host_server: tuple[str, int]):
+            if response["status"] == gv.SUCCESS:
+                self._transaction_informed(transaction_id, host_server)
+
+        for transaction_id, commit_time, owners in decisions:
+            for host_server in owners:
+                dfr.when(
+                    self._transaction_request(
+                        host_server,
+                        "serve_decide_transaction",
+                        [transaction_id, True, commit_time],
+                    ),
+                    lambda response, transaction_id=transaction_id, host_server=host_server: informed(
+                        response, transaction_id, host_server
+                    ),
+                )
+
+    def _ask_transaction_decision(self, coordinator: tuple[str, int], transaction_id: str):
+        """
+        Description: the decision of a prepared transaction did not arrive, ask the
+        coordinator for it, and again later if the coordinator does not answer
+        """
+        with self.transactions_lock:
+            if transaction_id not in self.prepared_transactions:
+                return  # decided meanwhile
+
+        def decide(response: dict):
+            if response["status"] != gv.SUCCESS:
+                sc.scheduler.call_later(
+                    TRANSACTION_TIMEOUT,
+                    self._ask_transaction_decision,
+                    coordinator,
+                    transaction_id,
+                )
+                return
+            self.log.warning(
+                "TRANSACTION_DECISION_ASKED",
+                category="request",
+                transaction=transaction_id,
+                committed=response["ret_val"],
+            )
+            self.serve_decide_transaction(
+                coordinator, transaction_id, response["ret_val"], response["commit_time"]
+            )
+
+        dfr.when(
+            self._transaction_request(
+                coordinator,
+                "serve_transaction_decision",
+                [transaction_id, self.server_address],
+            ),
+            decide,
+        )
+
+    def _release_transaction_locks(self, locks: list[list]):
+        for memory_address, ltag in locks:
+            self.memory_manager.release_lock(memory_address, ltag)
+
+    def _transaction_request(
+        self, host_server: tuple[str, int], type: str, args: list
+    ) -> dict | dfr.Deferred:
+        """
+        Description: a phase of serve_commit_transaction on an owner, the requests
+        to the other owners are sent at once through the multiplexed connections
+        """
+        if host_server == self.server_address:
+            return getattr(self, type)(self.server_address, *args)
+        return self._get_from_remote_deferred(host_server, type, args)
+
+    def serve_update_cache(
+        self,
+        client_address: tuple[str, int],
+        address_chain: list[tuple[str, int]],
+        memory_address: int,
+        data,
+        status: str,
+        wtag: int,
+    ):
+        """
+        Description:
+        - Update the local cache copy of a memory address and notify the next server in the address chain
+        - If the local copy has not been read for COPY_EXPIRY_UPDATES updates, it is dropped and
+        this server is reported back to the owner in "dropped_holders", so that the owner stops
+        sending updates to it (competitive update policy)
+        """
+        aux_address_chain = []
+        for address in address_chain:
+            aux_address_chain.append((address[0], address[1]))
+        address_chain = aux_address_chain  # turn them back into tuples (from lists)
+
+        self.log.info(
+            "UPDATE_CACHE_REQUEST",
+            category="update",
+            client=client_address,
+            address=memory_address,
+        )
+        host_server = self._get_server_address(memory_address)
+        if host_server is None:
+            return {
+                "status": gv.INVALID_ADDRESS,
+                "message": "Memory address out of range",
+            }
+
+        dropped = False
+        if self._is_replica(memory_address):
+            self._update_replica_copy(memory_address, data, status, wtag)
+        elif (
+            host_server != self.server_address
+        ):  # a host server doesn't need to update its cache
+            self._update_local_copy(memory_address, data, status, wtag)
+            dropped = self._expire_idle_copy(memory_address)
+
+        response = None
+        if len(address_chain) > 0:
+            next_address = address_chain.pop(0)
+            response = self._update_next_copy(
+                address_chain, next_address, memory_address, data, status, wtag
+            )
+            self.log.info(
+                "UPDATE_CACHE_RESPONSE",
+                category="update",
+                client=client_address,
+                address=memory_address,
+                status=response["status"],
+            )
+        else:
+            response = {
+                "status": gv.SUCCESS,
+                "message": "cache updated",
+            }
+
+        # piggyback the deregistration on the response that travels back to the owner
+        if dropped:
+            response.setdefault("dropped_holders", []).append(self.server_address)
+        return response
+
+    def serve_lww_update(
+        self,
+        client_address: tuple[str, int],
+        sender_ip: str,
+        sender_port: int,
+        updates: list[list],
+    ):
+        """
+        Description:
+        - Merge the writes of eventually consistent addresses sent by another server
+        (see _send_eventual_updates), as [address, data, wtag]. The last writer wins,
+        so the writes can arrive late, twice or in any order
+        - The owner of an address passes the writes that win on to the replicas and
+        copy holders of the address. A write that reaches another server than the
+        owner is passed on to the owner, unless it comes from the owner
+        - Addresses that this server stopped caching are reported back to the owner
+        in "dropped", so that the owner stops sending updates for them (as in
+        serve_update_cache)
+        """
+        sender = (sender_ip, sender_port)
+        self.log.info(
+            "LWW_UPDATE_REQUEST",
+            category="update",
+            client=client_address,
+            updates=len(updates),
+        )
+        dropped = []
+        fenced = None
+        for memory_address, data, wtag in updates:
+            host_server = self._get_server_address(memory_address)
+            if host_server is None:
+                continue
+            if host_server == self.server_address:
+                if self._fenced(memory_address):
+                    fenced = memory_address  # sent again, see _send_eventual_updates
+                elif self.memory_manager.merge_write(memory_address, data, wtag):
+                    self._propagate_eventual(memory_address, data, wtag, sender)
+                continue
+
+            if self._is_replica(memory_address):
+                if self._merge_local_copy(memory_address, data, wtag) is None:
+                    self._update_replica_copy(memory_address, data, "S", wtag)
+            elif (
+                self._merge_local_copy(memory_address, data, wtag) is None
+                or self._expire_idle_copy(memory_address)
+            ):
+                if host_server == sender:
+                    dropped.append(memory_address)
+            elif host_server == sender:
+                self.shared_memory.refresh(memory_address)
+            if host_server != sender:
+                # a write accepted by a copy holder, or the address migrated
+                self.propagator.push(host_server, memory_address, data, wtag)
+
+        if fenced is not None:
+            return self._fenced_response(fenced)
+        return {
+            "status": gv.SUCCESS,
+            "message": "updates merged",
+            "dropped": dropped,
+        }
+
+    def serve_drop_copy(
+        self,
+        client_address: tuple[str, int],
+        copy_holder_ip: str,
+        copy_holder_port: int,
+        memory_address: int,
+        cascade: bool,
+    ):
+        """
+        Description:
+        - Remove a copy holder of a memory address, used by copy holders which
+        stop caching the address (e.g. client near caches when they disconnect)
+        """
+        copy_holder = (copy_holder_ip, copy_holder_port)
+        self.log.info(
+            "DROP_COPY_REQUEST",
+            category="request",
+            client=client_address,
+            address=memory_address,
+        )
+        host_server = self._get_server_address(memory_address)
+        if host_server is None:
+            return {
+                "status": gv.INVALID_ADDRESS,
+                "message": "Memory address out of range",
+            }
+
+        if host_server == self.server_address:
+            # take the lock, so that we do not change the copy holders while
+            # an update is being propagated
+            ltag = -1
+            try:
+                ret_val, ltag, _ = self.memory_manager.acquire_lock(memory_address)
+                if not ret_val:
+                    if self._get_server_address(memory_address) != self.server_address:
+                        # the address migrated while we were waiting for its lock
+                        return self.serve_drop_copy(
+                            client_address,
+                            copy_holder_ip,
+                            copy_holder_port,
+                            memory_address,
+                            cascade,
+                        )
+                    return {"status": gv.ERROR, "message": "Failed to acquire lock"}
+                self.memory_manager.remove_copy_holder(memory_address, copy_holder)
+            finally:
+                self.memory_manager.release_lock(memory_address, ltag)
+            return {
+                "status": gv.SUCCESS,
+                "message": "copy dropped",
+            }
+
+        # with cascade=False the address migrated, see explanation in serve_read
+        return self._get_from_remote(
+            client_address,
+            memory_address,
+            host_server,
+            "serve_drop_copy",
+            [copy_holder_ip, copy_holder_port, memory_address, False],
+            "DROP COPY",
+        )
+
+    def _update_shared_copies(
+        self,
+        client_address: tuple[str, int],
+        memory_address: int,
+    ):
+        """
+        Description: a server starts updating shared copies of a memory address.
+        The server keeps track of a copyholder address chain and instead of sending
+        requests to all copyholders at once, it sends a request to the first copyholder
+        in the chain and then each copyholder sends a request to the next copyholder in the chain.
+
+        The server keeps track of the copyholder address chain and if a copyholder fails to update
+        the shared copy, the server removes all copyholders after the failed copyholder in the chain (
+        including the failed copyholder itself). This is done to ensure that the shared copies are
+        consistent across all servers.
+
+        The replicas of the memory address are placed at the start of the chain. They are never
+        removed from it: a replica that misses an update is marked as lagging and copies the
+        memory range again (see serve_ping).
+        """
+        replicas = self._get_replicas(memory_address)
+        address_chain = replicas + self.memory_manager.get_copy_holders(memory_address)
+
+        start_time = time.perf_counter()
+        with tracing.span(
+            "update_chain", address=memory_address, holders=len(address_chain)
+        ):
+            update_value = self.serve_update_cache(
+                client_address,
+                address_chain,
+                memory_address,
+                self.memory_manager.read_memory(memory_address).data,
+                self.memory_manager.read_memory(memory_address).status,
+                self.memory_manager.read_memory(memory_address).wtag,
+            )
+        metrics.registry.observe(
+            "update_chain_latency_seconds",
+            time.perf_counter() - start_time,
+        )
+
+        self.log.debug(
+            "UPDATE_SHARED_COPIES", category="update", status=update_value["status"]
+        )
+
+        if update_value["status"] != gv.SUCCESS:
+            failed_address = update_value.get("server_address", None)
+            if failed_address is None:
+                failed_address = address_chain[
+                    0
+                ]  # the address chain has at least one item if this function is called
+            failed_address = (
+                failed_address[0],
+                failed_address[1],
+            )  # turn it into a tuple again
+
+            for i, address in enumerate(address_chain):
+                if i >= address_chain.index(failed_address):
+                    if address in replicas:
+                        self._tell_lagging(address)
+                    else:
+                        self.memory_manager.remove_copy_holder(memory_address, address)
+
+        # copy holders which have not read the address for a while dropped their copy
+        for holder in update_value.get("dropped_holders", []):
+            self.memory_manager.remove_copy_holder(
+                memory_address, (holder[0], holder[1])
+            )
+
+        self.log.debug(
+            "UPDATE_SHARED_COPIES",
+            category="update",
+            copy_holders=self.memory_manager.get_copy_holders(memory_address),
+        )
+
+    def serve_dump_cache(
+        self,
+        client_address: tuple[str, int],
+    ):
+        """
+        Description:
+        - Dump the server's cache, used for debugging purposes
+        """
+        self.log.info("DUMP_CACHE_REQUEST", client=client_address)
+        cache_items = [
+            {
+                "address": self.shared_memory.key_map[i],
+                **self.shared_memory.read_no_sync(self.shared_memory.key_map[i]).json(),
+            }
+            for i in range(self.shared_memory.cache_size)
+            if self.shared_memory.key_map[i] is not None
+        ]
+
+        return {
+            "status": gv.SUCCESS,
+            "message": "cache dumped",
+            "cache": cache_items,
+        }
+
+    def serve_routing_table(
+        self,
+        client_address: tuple[str, int],
+    ):
+        """
+        Description:
+        - Send the routing table of the server, used by routing-aware clients
+        """
+        self.log.info("ROUTING_TABLE_REQUEST", client=client_address)
+        return {
+            "status": gv.SUCCESS,
+            "message": "routing table",
+            "routing_table": self.routing_table.json(),
+        }
+
+    def serve_migrate_range(
+        self,
+        client_address: tuple[str, int],
+        start: int,
+        end: int,
+        target_ip: str,
+        target_port: int,
+    ):
+        """
+        Description:
+        - Move the memory addresses [start, end) of this server to the target server,
+        while the server keeps serving requests
+        - The server acquires the locks of all the addresses (in ascending order), so that
+        no request modifies them during the move, and sends their values, write tags,
+        lock tags and copy holders to the target
+        - Once the target has taken over the addresses, the server updates its routing
+        table and drops the addresses. Requests that were waiting for the locks fail to
+        acquire them and are forwarded to the target, as are requests that reach this
+        server with an outdated routing table (see serve_read)
+        - If the response of the target is lost, the target may have taken over the
+        addresses anyway. The server asks it (see serve_import_status), with the locks
+        still held, and keeps the addresses only if the target did not import them
+        - Finally, the other servers are told about the new owner of the addresses
+        """
+        target = (target_ip, target_port)
+        self.log.info(
+            "MIGRATE_RANGE_REQUEST",
+            client=client_address,
+            start=start,
+            end=end,
+            target=target,
+        )
+        if target == self.server_address or target not in self.server_addresses:
+            return {
+                "status": gv.ERROR,
+                "message": f"Invalid migration target {target}",
+            }
+
+        addresses = range(start, end)
+        if len(addresses) == 0 or any(
+            self._get_server_address(address) != self.server_address
+            for address in addresses
+        ):
+            return {
+                "status": gv.INVALID_ADDRESS,
+                "message": "Memory range is not owned by the server",
+            }
+
+        with self.migration_lock:
+            acquired = []
+            try:
+                for address in addresses:
+                    lock_item = self.memory_manager.get_lock_item(address)
+                    ret_val, ltag, _ = self.memory_manager.acquire_lock(address)
+                    if not ret_val:
+                        return {
+                            "status": gv.ERROR,
+                            "message": f"Failed to acquire lock of address {address}",
+                        }
+                    acquired.append((lock_item, ltag))
+
+                items = self.memory_manager.export_items(addresses)
+                # the clock makes the id unique across restarts of this server
+                migration_id = f"{self.server_address[0]}:{self.server_address[1]}:{tu.get_time()}"
+                response = self._get_from_remote(
+                    client_address,
+                    start,
+                    target,
+                    "serve_import_range",
+                    [start, end, items, migration_id],
+                    "IMPORT RANGE",
+                )
+                if response["status"] != gv.SUCCESS and not self._target_imported(
+                    client_address, start, end, target, migration_id
+                ):
+                    return response
+
+                # new requests go to the target from now on
+                self._apply_routing_update(
+                    start, end, self.server_addresses.index(target), keep_owned=False
+                )
+                self.memory_manager.remove_items(addresses)
+            finally:
+                # the lock items of migrated addresses are not in the memory manager anymore
+                for lock_item, ltag in acquired:
+                    lock_item.release_lock(ltag)
+
+        # the target is told too: if it runs as several workers (see front_end),
+        # only the ones that imported the range know it
+        for server_address in self.server_addresses:
+            if server_address == self.server_address:
+                continue
+            self._get_from_remote(
+                client_address,
+                start,
+                server_address,
+                "serve_update_routing",
+                [start, end, target[0], target[1]],
+                "UPDATE ROUTING",
+            )
+
+        self.log.info(
+            "MIGRATE_RANGE_RESPONSE",
+            client=client_address,
+            start=start,
+            end=end,
+            target=target,
+        )
+        return {
+            "status": gv.SUCCESS,
+            "message": "range migrated",
+            "routing_table": self.routing_table.json(),
+        }
+
+    def serve_import_range(
+        self,
+        client_address: tuple[str, int],
+        start: int,
+        end: int,
+        items: list[list],
+        migration_id: str,
+    ):
+        """
+        Description:
+        - Take over the memory addresses [start, end) from the server that migrates them
+        - The migration is refused if the source asked about it before (see
+        serve_import_status) and kept the addresses
+        """
+        self.log.info(
+            "IMPORT_RANGE_REQUEST", client=client_address, start=start, end=end
+        )
+        with self.imports_lock:
+            if self.imported_migrations.setdefault(migration_id, True) is False:
+                return {
+                    "status": gv.ERROR,
+                    "message": "migration cancelled by the source",
+                }
+            try:
+                self._import_range(start, end, items)
+            except OSError as e:
+                # the source keeps the addresses
+                self.imported_migrations[migration_id] = False
+                self.log.error("IMPORT_RANGE_FAILED", start=start, end=end, error=str(e))
+                return {
+                    "status": gv.ERROR,
+                    "message": f"range not imported: {e}",
+                }
+        return {
+            "status": gv.SUCCESS,
+            "message": "range imported",
+        }
+
+    def serve_import_status(
+        self,
+        client_address: tuple[str, int],
+        migration_id: str,
+        start: int,
+        end: int,
+    ):
+        """
+        Description:
+        - Asked by the source of a migration whose serve_import_range response was
+        lost. A migration that was not imported yet is refused from now on, so
+        that the source can keep the addresses
+        - The migrations are forgotten when this server restarts. The source holds
+        the locks of [start, end) until it knows, so if we hold the addresses
+        we imported them before the restart
+
+        Return:
+        - ret_val: True if the addresses were imported, this server owns them
+        """
+        with self.imports_lock:
+            if migration_id not in self.imported_migrations:
+                self.imported_migrations[migration_id] = all(
+                    self.memory_manager.read_memory(address) is not None
+                    for address in range(start, end)
+                )
+            imported = self.imported_migrations[migration_id]
+        return {
+            "status": gv.SUCCESS,
+            "message": "range imported" if imported else "range not imported",
+            "ret_val": imported,
+        }
+
+    def _target_imported(
+        self,
+        client_address: tuple[str, int],
+        start: int,
+        end: int,
+        target: tuple[str, int],
+        migration_id: str,
+    ) -> bool:
+        """
+        Description: the import of a migration failed or its response was lost, ask
+        the target whether it imported the addresses. Until it answers, neither
+        server can own them safely, so the source keeps the locks and asks again.
+        """
+        while True:
+            response = self._get_from_remote(
+                client_address,
+                start,
+                target,
+                "serve_import_status",
+                [migration_id, start, end],
+                "IMPORT STATUS",
+            )
+            if response["status"] == gv.SUCCESS:
+                return response["ret_val"]
+            self.log.warning("IMPORT_STATUS_UNKNOWN", target=target, migration=migration_id)
+            time.sleep(CONNECTION_TIMEOUT)
+
+    def _import_range(self, start: int, end: int, items: list[list]):
+        for item in items:
+            # we are the owner now, we don't need a cached copy or to hold a copy ourselves
+            address, copy_holders = item[0], item[5]
+            self.shared_memory.remove(address)
+            item[5] = [
+                holder
+                for holder in copy_holders
+                if (holder[0], holder[1]) != self.server_address
+            ]
+            if len(item[5]) == 0:
+                item[2] = "E"
+        self.memory_manager.import_items(items)
+        try:
+            # the imported items are only held after a restart once the routing table is saved
+            self._apply_routing_update(
+                start, end, self.server_addresses.index(self.server_address)
+            )
+        except OSError:
+            self.memory_manager.remove_items(range(start, end))
+            raise
+        # if we replicated the addresses, the replica copy is not needed anymore
+        self.replica_manager.remove_items(range(start, end))
+
+    def serve_update_routing(
+        self,
+        client_address: tuple[str, int],
+        start: int,
+        end: int,
+        owner_ip: str,
+        owner_port: int,
+    ):
+        """
+        Description:
+        - A memory range moved to another server, update the routing table
+        - The owner is sent by address, the servers do not all know the same
+        servers: the workers of a server (see start_worker_process) know their
+        sibling workers, the other servers only know the server. A move to a
+        worker that we do not know does not change the routing table, the
+        range is still reached through its server.
+        """
+        owner = (owner_ip, owner_port)
+        self.log.info(
+            "UPDATE_ROUTING_REQUEST",
+            client=client_address,
+            start=start,
+            end=end,
+            owner=owner,
+        )
+        if owner not in self.server_addresses:
+            return {
+                "status": gv.SUCCESS,
+                "message": "owner is not known, routing table unchanged",
+            }
+        self._apply_routing_update(start, end, self.server_addresses.index(owner))
+        return {
+            "status": gv.SUCCESS,
+            "message": "routing table updated",
+        }
+
+    def serve_load_stats(
+        self,
+        client_address: tuple[str, int],
+        bucket_size: int,
+        reset: bool,
+    ):
+        """
+        Description:
+        - Number of requests served for the memory addresses of the server since the
+        last reset, in buckets of bucket_size addresses. Used by the rebalancer.
+        """
+        self.log.info("LOAD_STATS_REQUEST", client=client_address)
+        return {
+            "status": gv.SUCCESS,
+            "message": "load statistics",
+            "loads": self.memory_manager.get_load(bucket_size, reset),
+        }
+
+    def serve_snapshot(
+        self,
+        client_address: tuple[str, int],
+        snapshot_path: str,
+    ):
+        """
+        Description:
+        - Write a consistent snapshot of the memory addresses of the server (values,
+        wtags and copy holders) to a local file, without stopping writes. The file
+        can be given to `server.py -restore` to seed a server.
+        - snapshot_path is relative to SNAPSHOT_DIR, files outside of it are refused
+        """
+        self.log.info("SNAPSHOT_REQUEST", client=client_address, path=snapshot_path)
+        if gv.SNAPSHOT_DIR is None:
+            return {"status": gv.ERROR, "message": "snapshots are disabled, SNAPSHOT_DIR is not set"}
+        try:
+            path = sn.snapshot_file(gv.SNAPSHOT_DIR, snapshot_path)
+        except ValueError as e:
+            return {"status": gv.ERROR, "message": str(e)}
+        try:
+            count = sn.write_snapshot(path, self.memory_manager.snapshot_items())
+        except OSError as e:
+            return {
+                "status": gv.ERROR,
+                "message": f"Failed to write the snapshot with error: {e}",
+            }
+        self.log.info("SNAPSHOT_RESPONSE", client=client_address, count=count)
+        return {
+            "status": gv.SUCCESS,
+            "message": f"snapshot of {count} items written to {snapshot_path}",
+            "count": count,
+        }
+
+    def serve_metrics(
+        self,
+        client_address: tuple[str, int],
+    ):
+        """
+        Description:
+        - Latency histograms (as quantiles) and counters recorded by the server
+        """
+        self.log.info("METRICS_REQUEST", client=client_address)
+        return {
+            "status": gv.SUCCESS,
+            "message": "metrics",
+            "metrics": metrics.registry.json(),
+        }
+
+    def serve_shm_connect(
+        self,
+        client_address: tuple[str, int],
+        segment_name: str,
+        directory: str,
+        ring_size: int,
+        pid: int,
+    ):
+        """
+        Description:
+        - Attach to a shared-memory channel created by a server of the same host
+        (see shm_transport), the server sends its requests through it from then on.
+        Servers on other hosts cannot attach, they keep using TCP.
+        """
+        try:
+            channel = st.Channel.attach(segment_name, directory, ring_size)
+        except Exception as e:
+            return {
+                "status": gv.ERROR,
+                "message": f"Failed to attach to the shared-memory channel with error: {e}",
+            }
+        th.Thread(
+            target=self.handle_shm_client,
+            args=(channel, client_address, pid),
+            daemon=True,
+        ).start()
+        return {"status": gv.SUCCESS, "message": "shared-memory channel attached"}
+
+    def serve_export_range(
+        self,
+        client_address: tuple[str, int],
+        start: int,
+        end: int,
+    ):
+        """
+        Description:
+        - Send a consistent copy of the memory addresses [start, end) owned by the server,
+        used by replicas to copy the memory ranges they replicate
+        """
+        self.log.info(
+            "EXPORT_RANGE_REQUEST", client=client_address, start=start, end=end
+        )
+        addresses = [
+            address
+            for address in range(start, end)
+            if self._get_server_address(address) == self.server_address
+        ]
+        acquired = []
+        try:
+            # hold all the locks, so that the copy is consistent
+            for address in addresses:
+                ret_val, ltag, _ = self.memory_manager.acquire_lock(address)
+                if not ret_val:
+                    return {
+                        "status": gv.ERROR,
+                        "message": f"Failed to acquire lock of address {address}",
+                    }
+                acquired.append((address, ltag))
+            items = self.memory_manager.export_items(addresses)
+        finally:
+            for address, ltag in acquired:
+                self.memory_manager.release_lock(address, ltag)
+        return {
+            "status": gv.SUCCESS,
+            "message": "range exported",
+            "items": items,
+        }
+
+    def serve_ping(
+        self,
+        client_address: tuple[str, int],
+        replica_ip: str,
+        replica_port: int,
+    ):
+        """
+        Description:
+        - Heartbeat of a replica. The response tells the replica whether it missed
+        updates and has to copy our memory ranges again.
+        """
+        replica = (replica_ip, replica_port)
+        resync = replica in self.lagging_replicas
+        self.lagging_replicas.discard(replica)
+        return {
+            "status": gv.SUCCESS,
+            "message": "pong",
+            "resync": resync,
+        }
+
+    def serve_replica_lagging(
+        self,
+        client_address: tuple[str, int],
+        owner_ip: str,
+        owner_port: int,
+    ):
+        """
+        Description:
+        - The owner failed to update our copy of its memory ranges (see _tell_lagging):
+        stop serving their reads (see _read_replica) until a later heartbeat finds the
+        copy in sync
+        """
+        owner = (owner_ip, owner_port)
+        self.log.warning("REPLICA_LAGGING", client=client_address, owner=owner)
+        with self.lease_lock:
+            self.lagging_since[owner] = time.monotonic()
+            self.replica_reads.pop(owner, None)
+        return {
+            "status": gv.SUCCESS,
+            "message": "replica reads stopped",
+        }
+
+    def _tell_lagging(self, replica: tuple[str, int]):
+        """
+        Description: mark a replica that missed an update as lagging, it copies our
+        memory ranges again after its next heartbeat (see serve_ping). The replica is
+        told before the write is answered, so that it stops serving reads of the
+        missed value at once if it can be reached, and after REPLICA_LEASE seconds
+        without a heartbeat otherwise.
+        """
+        self.lagging_replicas.add(replica)
+        ip, port = self.server_address
+        self._get_from_remote(
+            self.server_address,
+            -1,
+            replica,
+            "serve_replica_lagging",
+            [ip, port],
+            "REPLICA LAGGING",
+        )
+
+    def serve_grant_lease(
         self,
         client_address: tuple[str, int],
-        address_chain: list[tuple[str, int]],
-        memory_address: int,
-        data,
-        status: str,
-        wtag: int,
+        owner_ip: str,
+        owner_port: int,
     ):
         """
         Description:
-        - Update the local cache copy of a memory address and notify the next server in the address chain
+        - Lease of an owner on the memory ranges this server replicates (see
+        _renew_leases): this server does not take them over for REPLICA_LEASE
+        seconds, plus one heartbeat (see _watch_primaries)
+        - An owner whose ranges this server does not replicate (anymore), or is
+        taking over, gets no lease
         """
-        aux_address_chain = []
-        for address in address_chain:
-            aux_address_chain.append((address[0], address[1]))
-        address_chain = aux_address_chain  # turn them back into tuples (from lists)
+        owner = (owner_ip, owner_port)
+        own_index = self.server_addresses.index(self.server_address)
+        owners = {
+            self.server_addresses[owner_index]
+            for _, _, owner_index in self.routing_table.get_replica_segments(own_index)
+        }
+        with self.lease_lock:
+            if owner not in owners or owner in self.revoked_leases:
+                return {
+                    "status": gv.ERROR,
+                    "message": "this server does not replicate the ranges of the owner",
+                }
+            self.granted_leases[owner] = time.monotonic()
+        return {
+            "status": gv.SUCCESS,
+            "message": "lease granted",
+        }
 
-        print(
-            f"[UPDATE CACHE REQUEST] server {self.server_address}, client {client_address}, address {memory_address}"
-        )
-        host_server = self._get_server_address(memory_address)
-        if host_server is None:
-            return {
-                "status": gv.INVALID_ADDRESS,
-                "message": "Memory address out of range",
+    def _renew_leases(self):
+        """
+        Description: background loop of an owner of replicated memory ranges, which
+        asks every REPLICA_HEARTBEAT seconds each replica of its ranges for a lease
+        (see serve_grant_lease). The lease counts from the request, before the replica
+        grants it, so that it always ends before the replica may take over.
+        """
+        own_index = self.server_addresses.index(self.server_address)
+        ip, port = self.server_address
+        while True:
+            time.sleep(REPLICA_HEARTBEAT)
+            replicas = {
+                replica
+                for start, _ in self.routing_table.get_ranges(own_index)
+                for replica in self._get_replicas(start)
             }
+            for replica in replicas:
+                asked = time.monotonic()
+                response = self._get_from_remote(
+                    self.server_address,
+                    -1,
+                    replica,
+                    "serve_grant_lease",
+                    [ip, port],
+                    "GRANT LEASE",
+                )
+                if response["status"] == gv.SUCCESS:
+                    self.replica_leases[replica] = asked
 
-        if (
-            host_server != self.server_address
-        ):  # a host server doesn't need to update its cache
-            self._update_local_copy(memory_address, data, status, wtag)
+    def _fenced(self, memory_address: int) -> bool:
+        """
+        Description: a replica takes over the addresses of an owner that misses its
+        heartbeats (see _watch_primaries), also when only the replica lost the owner.
+        The owner stops writing its replicated addresses unless every replica granted
+        it a lease in the last REPLICA_LEASE seconds, and the replicas do not take over
+        an owner whose lease may not have expired, so that the owner and the promoted
+        replica never both accept writes.
 
-        if len(address_chain) > 0:
-            next_address = address_chain.pop(0)
-            response = self._update_next_copy(
-                address_chain, next_address, memory_address, data, status, wtag
-            )
-            print(
-                f"[UPDATE CACHE RESPONSE] server {self.server_address}, client {client_address}, address {memory_address}, response {response}"
-            )
-            return response
+        Return:
+        - True if this server owns the memory address but must refuse its writes
+        """
+        if REPLICA_COUNT <= 0:
+            return False
+        now = time.monotonic()
+        return any(
+            replica not in self.replica_leases
+            or now - self.replica_leases[replica] > REPLICA_LEASE
+            for replica in self._get_replicas(memory_address)
+        )
 
+    def _fenced_response(self, memory_address: int) -> dict:
+        self.log.warning("OWNER_FENCED", address=memory_address)
         return {
-            "status": gv.SUCCESS,
-            "message": "cache updated",
+            "status": gv.ERROR,
+            "message": "the lease of the owner on the memory address expired, a replica may take it over",
         }
 
-    def _update_shared_copies(
+    def _is_replica(self, memory_address: int) -> bool:
+        return self.server_address in self.routing_table.get_replicas(memory_address)
+
+    def _get_replicas(self, memory_address: int) -> list[tuple[str, int]]:
+        """
+        Return:
+        - the replicas of a memory address, other than this server
+        """
+        return [
+            replica
+            for replica in self.routing_table.get_replicas(memory_address)
+            if replica != self.server_address
+        ]
+
+    def _read_response(self, encoded_item: tuple[dict, bytes], ltag: int) -> dict:
+        """
+        Return:
+        - the response to a read of a memory item, whose fields are sent as they
+        were encoded by MemoryItem.encoded_json, so that an item that is read many
+        times is not encoded again for every read
+        """
+        fields, encoded = encoded_item
+        return cu.PreEncoded(
+            {
+                "status": gv.SUCCESS,
+                "message": "read successful",
+                **fields,
+                "ltag": ltag,
+            },
+            fields.keys(),
+            encoded,
+        )
+
+    def _read_replica(
         self,
         client_address: tuple[str, int],
         memory_address: int,
-    ):
+    ) -> None | dict:
         """
-        Description: a server starts updating shared copies of a memory address.
-        The server keeps track of a copyholder address chain and instead of sending
-        requests to all copyholders at once, it sends a request to the first copyholder
-        in the chain and then each copyholder sends a request to the next copyholder in the chain.
+        Description: read a memory address from the replica copy, if the owner found
+        the copy in sync at a heartbeat sent in the last REPLICA_LEASE seconds and did
+        not tell us that we missed an update since (see serve_replica_lagging)
 
-        The server keeps track of the copyholder address chain and if a copyholder fails to update
-        the shared copy, the server removes all copyholders after the failed copyholder in the chain (
-        including the failed copyholder itself). This is done to ensure that the shared copies are
-        consistent across all servers.
+        Return:
+        - the read response, None if the replica copy may not be up-to-date
         """
-        address_chain = self.memory_manager.get_copy_holders(memory_address)
+        in_sync = self.replica_reads.get(self._get_server_address(memory_address), None)
+        if in_sync is None or time.monotonic() - in_sync > REPLICA_LEASE:
+            return None
+        data = None
+        ltag = -1
+        try:
+            ret_val, ltag, _ = self.replica_manager.acquire_lock(memory_address)
+            if not ret_val:
+                return None
+            data = self.replica_manager.read_memory(memory_address).encoded_json()
+        finally:
+            self.replica_manager.release_lock(memory_address, ltag)
+        self.log.info(
+            "READ_RESPONSE",
+            category="request",
+            client=client_address,
+            address=memory_address,
+            replica=True,
+        )
+        return self._read_response(data, ltag)
 
-        update_value = self.serve_update_cache(
-            client_address,
-            address_chain,
-            memory_address,
-            self.memory_manager.read_memory(memory_address).data,
-            self.memory_manager.read_memory(memory_address).status,
-            self.memory_manager.read_memory(memory_address).wtag,
+    def _update_replica_copy(
+        self,
+        memory_address: int,
+        data,
+        status: str,
+        wtag: int,
+    ):
+        item = self.replica_manager.read_memory(memory_address)
+        if item is None:
+            # an update always carries the latest value of the address
+            self.replica_manager.import_items([[memory_address, data, status, wtag, -1, []]])
+        elif item.wtag <= wtag:
+            item.write(data, wtag)
+            item.status = status
+        return True
+
+    def _sync_replica(self, start: int, end: int, owner: tuple[str, int]) -> bool:
+        """
+        Description: copy the memory range [start, end) from its owner into the replica copy.
+        Updates pushed by the owner while the copy is in flight may be newer than the copy,
+        so they are kept.
+        """
+        response = self._get_from_remote(
+            self.server_address,
+            start,
+            owner,
+            "serve_export_range",
+            [start, end],
+            "EXPORT RANGE",
         )
+        if response["status"] != gv.SUCCESS:
+            return False
+        for address, data, status, wtag, _, _ in response["items"]:
+            self._update_replica_copy(address, data, status, wtag)
+        self.log.info("REPLICA_SYNCED", start=start, end=end, owner=owner)
+        return True
 
-        print("-" * 50)
-        log_msg(f"[UPDATE SHARED COPIES] {update_value}")
+    def _watch_primaries(self):
+        """
+        Description: background loop of a replica. It keeps the replicated memory ranges
+        in sync and checks that their owners are alive. When an owner misses
+        REPLICA_FAILURES heartbeats in a row, the first replica that is still alive
+        promotes itself to owner of the memory ranges, once the last lease it granted
+        to the owner (see serve_grant_lease) is older than REPLICA_LEASE, plus one
+        heartbeat for the drift between the clocks.
+        """
+        failures = {}
+        # leases granted before this server (re)started are older than its start
+        started = time.monotonic()
+        own_index = self.server_addresses.index(self.server_address)
+        while True:
+            time.sleep(REPLICA_HEARTBEAT)
+            segments = self.routing_table.get_replica_segments(own_index)
+            for owner_index in {segment[2] for segment in segments}:
+                owner = self.server_addresses[owner_index]
+                owner_segments = [segment for segment in segments if segment[2] == owner_index]
+                ip, port = self.server_address
+                sent = time.monotonic()
+                response = self._get_from_remote(
+                    self.server_address, -1, owner, "serve_ping", [ip, port], "PING"
+                )
 
-        if update_value["status"] != gv.SUCCESS:
-            failed_address = update_value.get("server_address", None)
-            if failed_address is None:
-                failed_address = address_chain[
-                    0
-                ]  # the address chain has at least one item if this function is called
-            failed_address = (
-                failed_address[0],
-                failed_address[1],
-            )  # turn it into a tuple again
+                if response["status"] == gv.SUCCESS:
+                    failures[owner] = 0
+                    for start, end, _ in owner_segments:
+                        if response["resync"]:
+                            self.replica_manager.remove_items(range(start, end))
+                        if any(
+                            self.replica_manager.read_memory(address) is None
+                            for address in range(start, end)
+                        ):
+                            self._sync_replica(start, end, owner)
+                    with self.lease_lock:
+                        # a heartbeat answered before the owner told us that we are
+                        # lagging does not make the copy in sync again
+                        if not response["resync"] and sent > self.lagging_since.get(owner, 0.0):
+                            self.replica_reads[owner] = sent
+                    continue
+
+                failures[owner] = failures.get(owner, 0) + 1
+                if failures[owner] < REPLICA_FAILURES:
+                    continue
+                with self.lease_lock:
+                    granted = self.granted_leases.get(owner, started)
+                    if time.monotonic() - granted <= REPLICA_LEASE + REPLICA_HEARTBEAT:
+                        continue  # the owner may still write its ranges, see _fenced
+                    self.revoked_leases.add(owner)
+                try:
+                    for start, end, _ in owner_segments:
+                        self._promote_replica(start, end, owner)
+                finally:
+                    # once promoted, the owner does not own the ranges we replicate
+                    with self.lease_lock:
+                        self.revoked_leases.discard(owner)
+                failures[owner] = 0
+
+    def _promote_replica(self, start: int, end: int, owner: tuple[str, int]):
+        """
+        Description: take over the memory range [start, end) of an owner that stopped responding,
+        and whose lease on the range expired (see _watch_primaries)
+        """
+        replicas = self.routing_table.get_replicas(start)
+        for replica in replicas[: replicas.index(self.server_address)]:
+            ip, port = self.server_address
+            response = self._get_from_remote(
+                self.server_address, start, replica, "serve_ping", [ip, port], "PING"
+            )
+            if response["status"] == gv.SUCCESS:
+                # an earlier replica is alive, it takes over the memory range
+                return
+
+        addresses = range(start, end)
+        if any(self.replica_manager.read_memory(address) is None for address in addresses):
+            self.log.warning(
+                "PROMOTION_FAILED", start=start, end=end, reason="not in sync"
+            )
+            return
+
+        # the replica copy has no copy holders: the caches of other servers validate their
+        # copies with the owner and the clients' near caches expire
+        items = [
+            [address, item.data, "E", item.wtag, self.replica_manager.get_lock_item(address).ltag, []]
+            for address in addresses
+            for item in [self.replica_manager.read_memory(address)]
+        ]
+        self.memory_manager.import_items(items)
+        self.replica_manager.remove_items(addresses)
 
-            for i, address in enumerate(address_chain):
-                if i >= address_chain.index(failed_address):
-                    self.memory_manager.remove_copy_holder(memory_address, address)
+        own_index = self.server_addresses.index(self.server_address)
+        self._apply_routing_update(start, end, own_index)
+        for server_address in self.server_addresses:
+            if server_address in (self.server_address, owner):
+                continue
+            self._get_from_remote(
+                self.server_address,
+                start,
+                server_address,
+                "serve_update_routing",
+                [start, end, self.server_address[0], self.server_address[1]],
+                "UPDATE ROUTING",
+            )
+        self.log.info("REPLICA_PROMOTED", start=start, end=end, owner=owner)
 
-        log_msg(
-            f"[UPDATE SHARED COPIES] COPY HOLDERS: {self.memory_manager.get_copy_holders(memory_address)}"
+    def _join_cluster(self):
+        """
+        Description: a (re)starting server adopts the newest routing table of the other
+        servers, since memory ranges may have moved while it was down (migrations or
+        promotion of replicas). Memory addresses that are not ours anymore are dropped,
+        so that two servers never own the same address.
+        """
+        newest = self.routing_table
+        for server_address in self.server_addresses:
+            if server_address == self.server_address:
+                continue
+            host_server_socket = None
+            try:
+                host_server_socket = self._connect_to_server(server_address, 1)
+                cu.send_msg(
+                    host_server_socket, {"type": "serve_routing_table", "internal": True}
+                )
+                response = cu.rec_msg(host_server_socket)
+                table = rt.RoutingTable.from_json(response["routing_table"])
+                if table.epoch > newest.epoch:
+                    newest = table
+            except Exception:
+                pass  # the server is down, or it doesn't share its routing table
+            finally:
+                if host_server_socket is not None:
+                    try:
+                        self._disconnect_from_server(host_server_socket)
+                    except Exception:
+                        pass
+
+        if newest is self.routing_table:
+            return
+
+        self._save_routing(newest)
+        self.routing_table = newest
+        own_index = self.server_addresses.index(self.server_address)
+        self.memory_manager.remove_items(
+            [
+                address
+                for start, end in self.memory_manager.owned_ranges()
+                for address in range(start, end)
+                if newest.get_index(address) != own_index
+            ]
         )
-        print("-" * 50)
+        self.memory_manager.import_items(
+            [
+                [address, None, "E", tu.get_time(), -1, []]
+                for start, end in newest.get_ranges(own_index)
+                for address in range(start, end)
+                if self.memory_manager.read_memory(address) is None
+            ]
+        )
+        self.log.info("JOINED_CLUSTER", epoch=newest.epoch)
 
-    def serve_dump_cache(
+    def _apply_routing_update(
+        self, start: int, end: int, server_index: int, keep_owned: bool = True
+    ):
+        """
+        Description: give the memory addresses [start, end) to another server in the routing table.
+        Updates may arrive out of order, so unless keep_owned is False (we are migrating the
+        addresses away ourselves) the addresses held by our memory manager stay ours: the
+        routing table must never send our own addresses away.
+        """
+        own_index = self.server_addresses.index(self.server_address)
+        with self.routing_lock:
+            routing_table = self.routing_table.reassign(start, end, server_index)
+            if keep_owned and server_index != own_index:
+                for own_start, own_end in self.memory_manager.owned_ranges():
+                    if own_start < end and start < own_end:
+                        routing_table = routing_table.reassign(
+                            max(own_start, start), min(own_end, end), own_index
+                        )
+            # the routing table in use is not changed if it cannot be saved
+            self._save_routing(routing_table)
+            self.routing_table = routing_table
+
+    def _save_routing(self, routing_table: rt.RoutingTable):
+        """
+        Description: save the routing table with the write-ahead log, so that the
+        memory ranges imported by this server are held again after a restart, and
+        the ones it migrated away are not
+        """
+        if self.memory_manager.wal is not None:
+            self.memory_manager.wal.save_routing(routing_table.json())
+
+    def _read_eventual(
         self,
         client_address: tuple[str, int],
-    ):
+        copy_holder: tuple[str, int],
+        memory_address: int,
+        host_server: tuple[str, int],
+        cascade: bool,
+    ) -> None | dict:
         """
-        Description:
-        - Dump the server's cache, used for debugging purposes
+        Description: read an eventually consistent address without taking its lock.
+        The owner reads its own value, other servers serve outside clients from their
+        replica or cached copy, which the owner keeps updating in the background.
+
+        Return:
+        - the read response, None if the address must be read as any other address
         """
-        log_msg(
-            f"[DUMP CACHE REQUEST] server {self.server_address}, client {client_address}"
+        data = None
+        if host_server == self.server_address:
+            # register the copy holder before the read, so that it gets every later write
+            if not cascade and copy_holder != self.server_address:
+                self.memory_manager.add_copy_holder(memory_address, copy_holder)
+            data = self.memory_manager.read_item(memory_address)
+        elif cascade and self._is_replica(memory_address):
+            data = self.replica_manager.read_item(memory_address)
+        elif cascade and self.shared_memory.expired(memory_address, EVENTUAL_COPY_TTL):
+            # the owner may have stopped sending the writes (see _send_eventual_updates),
+            # read the address again from the owner, which registers this server again
+            self.shared_memory.remove(memory_address)
+            self.log.info("COPY_EXPIRED", address=memory_address)
+        elif cascade:
+            data = self.shared_memory.read_item(memory_address)
+            if data is not None:
+                self.shared_memory.record_read(memory_address)
+                self._record_access(client_address, memory_address, False)
+        if data is None:
+            return None
+        self.log.info(
+            "READ_RESPONSE",
+            category="request",
+            client=client_address,
+            address=memory_address,
+            eventual=True,
         )
-        cache_items = [
-            {
-                "address": self.shared_memory.key_map[i],
-                **self.shared_memory.read_no_sync(self.shared_memory.key_map[i]).json(),
-            }
-            for i in range(self.shared_memory.cache_size)
-            if self.shared_memory.key_map[i] is not None
-        ]
+        return self._read_response(data, -1)
 
+    def _write_eventual(
+        self,
+        client_address: tuple[str, int],
+        memory_address: int,
+        data,
+        host_server: tuple[str, int],
+    ) -> None | dict:
+        """
+        Description: write an eventually consistent address without taking its lock.
+        The write is stamped with a timestamp of the hybrid logical clock as wtag and
+        applied at once by the owner, or by a server holding a copy of the address
+        (replica or cache). It then reaches the other copies in the background (see
+        propagator.Propagator), where the last writer wins.
+
+        Return:
+        - the write response, None if this server has no copy of the address
+        """
+        if host_server == self.server_address:
+            if self._fenced(memory_address):
+                return self._fenced_response(memory_address)
+            item = self.memory_manager.read_memory(memory_address)
+            if item is None:
+                return None  # the address migrated
+            wtag = tu.get_time(item.wtag)
+            if self.memory_manager.merge_write(memory_address, data, wtag):
+                self._propagate_eventual(memory_address, data, wtag)
+        else:
+            wtag = tu.get_time()
+            if self._merge_local_copy(memory_address, data, wtag) is None:
+                return None
+            self.propagator.push(host_server, memory_address, data, wtag)
+        self.log.info(
+            "WRITE_RESPONSE",
+            category="request",
+            client=client_address,
+            address=memory_address,
+            eventual=True,
+        )
         return {
             "status": gv.SUCCESS,
-            "message": "cache dumped",
-            "cache": cache_items,
+            "message": "write successful",
         }
 
+    def _merge_local_copy(self, memory_address: int, data, wtag: int) -> None | bool:
+        """
+        Return:
+        - True if the write replaced the replica or cached copy of the address,
+        None if this server has no copy of it
+        """
+        if self._is_replica(memory_address):
+            if self.replica_manager.read_memory(memory_address) is None:
+                return None
+            return self.replica_manager.merge_write(memory_address, data, wtag)
+        return self.shared_memory.merge(memory_address, data, wtag)
+
+    def _propagate_eventual(
+        self,
+        memory_address: int,
+        data,
+        wtag: int,
+        sender: None | tuple[str, int] = None,
+    ):
+        """
+        Description: the owner sends a write of an eventually consistent address to
+        the replicas and copy holders of the address, except the one it came from
+        """
+        for server_address in self._get_replicas(
+            memory_address
+        ) + self.memory_manager.get_copy_holders(memory_address):
+            if server_address != sender:
+                self.propagator.push(server_address, memory_address, data, wtag)
+
+    def _push_to_owner(self, memory_address: int, data, wtag: int):
+        host_server = self._get_server_address(memory_address)
+        if host_server == self.server_address:
+            if self.memory_manager.merge_write(memory_address, data, wtag):
+                self._propagate_eventual(memory_address, data, wtag)
+        elif host_server is not None:
+            self.propagator.push(host_server, memory_address, data, wtag)
+
+    def _send_eventual_updates(
+        self, server_address: tuple[str, int], updates: list[list]
+    ):
+        """
+        Description: send a batch of writes of eventually consistent addresses to a
+        server (see serve_lww_update), from the propagator thread. As in the update
+        chain (see _update_shared_copies), the owner stops sending updates to copy
+        holders that fail or dropped their copy, and marks failed replicas as lagging.
+        A copy holder that is no longer sent the writes reads the address again once
+        its copy expires after EVENTUAL_COPY_TTL seconds (see _read_eventual).
+        Writes accepted by this server as a copy holder are sent to the owner again
+        after EVENTUAL_RETRY_INTERVAL seconds.
+        """
+        ip, port = self.server_address
+        response = self._get_from_remote(
+            self.server_address,
+            updates[0][0],
+            server_address,
+            "serve_lww_update",
+            [ip, port, updates],
+            "LWW UPDATE",
+        )
+        failed = response["status"] != gv.SUCCESS
+        dropped = set(response.get("dropped", []))
+        for memory_address, data, wtag in updates:
+            if self._get_server_address(memory_address) != self.server_address:
+                if failed:
+                    sc.scheduler.call_later(
+                        EVENTUAL_RETRY_INTERVAL,
+                        self._push_to_owner,
+                        memory_address,
+                        data,
+                        wtag,
+                    )
+            elif server_address in self._get_replicas(memory_address):
+                if failed:
+                    self._tell_lagging(server_address)
+            elif failed or memory_address in dropped:
+                self.memory_manager.remove_copy_holder(memory_address, server_address)
+
     def _update_local_copy(
         self,
         memory_address: int,
@@ -634,6 +3314,22 @@ class Server:
         self.shared_memory.write(memory_address, data, status, wtag)
         return True
 
+    def _expire_idle_copy(self, memory_address: int) -> bool:
+        """
+        Description: count an update received for a local copy and drop the copy
+        if it was not read locally for COPY_EXPIRY_UPDATES updates.
+
+        Return:
+        - True if the copy was dropped and the owner should deregister this server
+        """
+        if COPY_EXPIRY_UPDATES <= 0:
+            return False
+        if self.shared_memory.record_update(memory_address) < COPY_EXPIRY_UPDATES:
+            return False
+        self.shared_memory.remove(memory_address)
+        self.log.info("COPY_EXPIRED", address=memory_address)
+        return True
+
     def _update_next_copy(
         self,
         address_chain: list[tuple[str, int]],
@@ -676,33 +3372,132 @@ class Server:
         """
         host_server_socket = None
         response = None
-        try:
-            host_server_socket = self._connect_to_server(
-                host_server, CONNECTION_TIMEOUT
-            )
-            cu.send_msg(host_server_socket, {"type": type, "args": args})
-            response = cu.rec_msg(host_server_socket)
-            log_msg(
-                f"[{log_type} RESPONSE] server {self.server_address}, client {client_address}, memory address {memory_address}"
-            )
-        except Exception as e:
-            log_msg(
-                f"[{log_type} ERROR] server {self.server_address}, client {client_address}, memory address {memory_address}: {e}"
-            )
-            response = {
-                "status": gv.ERROR,
-                "message": f"Failed to connect to the host with error: {e}",
-            }
-        finally:
+        if type == getattr(self.request_context, "op", None):
+            self.request_context.forwarded = True
+        start_time = time.perf_counter()
+        with tracing.span(
+            "remote",
+            op=type,
+            peer=f"{host_server[0]}:{host_server[1]}",
+            address=memory_address,
+        ) as remote_span:
             try:
-                if host_server_socket is not None:
-                    self._disconnect_from_server(host_server_socket)
+                message = {"type": type, "args": args, "internal": True}
+                if self.shm_transport is not None:
+                    # None if the host server is not on this host
+                    response = self.shm_transport.request(
+                        host_server, message, CONNECTION_TIMEOUT
+                    )
+                remote_span.set(transport="tcp" if response is None else "shm")
+                if response is None:
+                    host_server_socket = self._connect_to_server(
+                        host_server, CONNECTION_TIMEOUT
+                    )
+                    cu.send_msg(host_server_socket, message)
+                    response = cu.rec_msg(host_server_socket)
+                self.log.info(
+                    "REMOTE_RESPONSE",
+                    category="request",
+                    op=log_type,
+                    client=client_address,
+                    address=memory_address,
+                )
             except Exception as e:
-                log_msg(
-                    f"[{log_type} ERROR DISCONNECTING INTERNAL] server {self.server_address}, client {client_address}, memory address {memory_address}: {e}"
+                self.log.error(
+                    "REMOTE_ERROR",
+                    op=log_type,
+                    client=client_address,
+                    address=memory_address,
+                    error=e,
+                )
+                response = {
+                    "status": gv.ERROR,
+                    "message": f"Failed to connect to the host with error: {e}",
+                }
+            finally:
+                metrics.registry.observe(
+                    "remote_latency_seconds",
+                    time.perf_counter() - start_time,
+                    op=type,
+                    peer=f"{host_server[0]}:{host_server[1]}",
+                )
+                try:
+                    if host_server_socket is not None:
+                        self._disconnect_from_server(host_server_socket)
+                except Exception as e:
+                    self.log.error(
+                        "REMOTE_ERROR_DISCONNECTING_INTERNAL",
+                        op=log_type,
+                        client=client_address,
+                        address=memory_address,
+                        error=e,
+                    )
+            remote_span.set(status=response["status"])
+        return response
+
+    def _get_from_remote_deferred(
+        self,
+        host_server: tuple[str, int],
+        type: str,
+        args: list[any],
+    ) -> dfr.Deferred:
+        """
+        Description:
+        Same as _get_from_remote, for requests that may wait on the remote server.
+        The request goes through the multiplexed connection to the server and the
+        calling thread does not wait for the response, which is a Deferred.
+        """
+        if type == getattr(self.request_context, "op", None):
+            self.request_context.forwarded = True
+        with self.multiplexed_lock:
+            if host_server not in self.multiplexed_connections:
+                self.multiplexed_connections[host_server] = dfr.MultiplexedConnection(
+                    host_server
                 )
+            connection = self.multiplexed_connections[host_server]
+
+        start_time = time.perf_counter()
+        peer = f"{host_server[0]}:{host_server[1]}"
+        response = connection.request({"type": type, "args": args, "internal": True})
+        response.then(
+            lambda _response: metrics.registry.observe(
+                "remote_latency_seconds",
+                time.perf_counter() - start_time,
+                op=type,
+                peer=peer,
+            )
+        )
         return response
 
+    def _connect_shm(self, server_address: tuple[str, int], args: list) -> bool:
+        """
+        Description: handshake of a shared-memory channel to another server (see shm_transport)
+
+        Return:
+        - True if the server attached to the channel
+        """
+        server_socket = self._connect_to_server(server_address, CONNECTION_TIMEOUT)
+        try:
+            cu.send_msg(server_socket, {"type": "serve_shm_connect", "args": args})
+            response = cu.rec_msg(server_socket)
+        finally:
+            self._disconnect_from_server(server_socket)
+        return response["status"] == gv.SUCCESS
+
+    def _owns_request(self, message: dict) -> bool:
+        """
+        Return:
+        - False if the message refers to a memory address owned by another server, True otherwise
+        """
+        position = ADDRESS_ARGUMENT.get(message["type"], None)
+        if position is None:
+            return True
+        memory_address = message["args"][position]
+        if message["type"] == "serve_read" and self._is_replica(memory_address):
+            return True
+        host_server = self._get_server_address(memory_address)
+        return host_server is None or host_server == self.server_address
+
     def _get_server_index(self, memory_address: int) -> int:
         """
         Input:
@@ -711,10 +3506,7 @@ class Server:
         Return:
         - server_index: the index of the server that contains the memory address, -1 if the memory address is out of range
         """
-        for i, memory_range in enumerate(self.memory_ranges):
-            if memory_address in range(memory_range[0], memory_range[1]):
-                return i
-        return -1
+        return self.routing_table.get_index(memory_address)
 
     def _get_server_address(self, memory_address: int) -> None | tuple[str, int]:
         """
@@ -724,10 +3516,7 @@ class Server:
         Return:
         - server_address: the address of the server that contains the memory address
         """
-        server_index = self._get_server_index(memory_address)
-        if server_index == -1:
-            return None
-        return self.server_addresses[server_index]
+        return self.routing_table.get_address(memory_address)
 
     def _connect_to_server(
         self, server_address: tuple[str, int], timeout=None
@@ -763,23 +3552,131 @@ class Server:
             server_socket.close()
 
 
-def start_server_process(server_index: int):
+def _run_server(
+    name: str,
+    net_address: tuple[str, int],
+    memory_range: tuple[int, int],
+    net_addresses: list[tuple[str, int]],
+    memory_ranges: list[tuple[int, int]],
+    replicas: None | list[list[int]],
+    snapshot_path: None | str,
+):
+    """
+    Description: start a server process, its files (persistent store, write-ahead
+    log, metrics and spans) are named after name in the configured directories
+    """
+    store_path = None
+    if gv.PERSISTENT_STORE_DIR is not None:
+        os.makedirs(gv.PERSISTENT_STORE_DIR, exist_ok=True)
+        store_path = os.path.join(gv.PERSISTENT_STORE_DIR, f"{name}.mem")
+    wal_path = None
+    if gv.WAL_DIR is not None:
+        os.makedirs(gv.WAL_DIR, exist_ok=True)
+        wal_path = os.path.join(gv.WAL_DIR, name)
+    if gv.METRICS_DIR is not None:
+        os.makedirs(gv.METRICS_DIR, exist_ok=True)
+        metrics.registry.write_prometheus_file(
+            os.path.join(gv.METRICS_DIR, f"{name}.prom"),
+            gv.METRICS_INTERVAL,
+            server=f"{net_address[0]}:{net_address[1]}",
+        )
+    if gv.TRACE_DIR is not None:
+        os.makedirs(gv.TRACE_DIR, exist_ok=True)
+        tracing.configure(os.path.join(gv.TRACE_DIR, f"{name}.jsonl"), net_address)
+    server = Server(
+        net_address,
+        memory_range,
+        net_addresses,
+        memory_ranges,
+        replicas,
+        store_path,
+        wal_path,
+        snapshot_path,
+    )
+    server.start()
+
+
+def start_worker_process(
+    server_index: int, worker_index: int, workers: int, snapshot_path: None | str
+):
+    """
+    Description: start one of the worker processes of a server. The worker owns a
+    part of the memory range of the server, and sees the other workers of the
+    server as the owners of the other parts.
+    """
+    memory_ranges = rt.memory_ranges_from_sizes(rt.server_memory_sizes())
+    memory_range = memory_ranges[server_index]
+    worker_addresses, worker_ranges = rt.worker_layout(
+        gv.SERVERS[server_index], memory_range, workers
+    )
+    # the server itself owns nothing, its workers own its memory range
+    memory_ranges = [
+        (start, start) if index == server_index else (start, end)
+        for index, (start, end) in enumerate(memory_ranges)
+    ]
+    _run_server(
+        f"server_{server_index}_worker_{worker_index}",
+        worker_addresses[worker_index],
+        worker_ranges[worker_index],
+        gv.SERVERS + worker_addresses,
+        memory_ranges + worker_ranges,
+        None,
+        snapshot_path,
+    )
+
+
+def start_server_process(
+    server_index: int, snapshot_path: None | str = None, workers: int = 1
+):
     """
     Description: given a server index, start the server process
     This function finds the memory range and network address that this server
     should use and starts the server process with these parameters
+
+    With more than one worker, the memory range is split between worker processes
+    (so that the server uses as many cores) and this process becomes their front-end.
     """
-    memory_size = gv.MEMORY_SIZE
-    server_count = len(gv.SERVERS)
-    server_memory_size = memory_size // server_count
-    memory_ranges = []
-    for i in range(server_count):
-        memory_ranges.append((i * server_memory_size, (i + 1) * server_memory_size))
+    memory_ranges = rt.memory_ranges_from_sizes(rt.server_memory_sizes())
     net_addresses = gv.SERVERS
     net_address = net_addresses[server_index]
     memory_range = memory_ranges[server_index]
-    server = Server(net_address, memory_range, net_addresses, memory_ranges)
-    server.start()
+    if workers <= 1:
+        _run_server(
+            f"server_{server_index}",
+            net_address,
+            memory_range,
+            net_addresses,
+            memory_ranges,
+            rt.server_replicas(),
+            snapshot_path,
+        )
+        return
+
+    if gv.REPLICA_COUNT > 0:
+        # workers do not replicate their parts of the memory range
+        raise ValueError("-workers cannot be used with REPLICA_COUNT, start the server without workers")
+    worker_processes = [
+        multiprocessing.Process(
+            target=start_worker_process,
+            args=(server_index, worker_index, workers, snapshot_path),
+            daemon=True,
+        )
+        for worker_index in range(workers)
+    ]
+
+    def stop(*_):
+        # stop the workers with us, without waiting for the threads of open
+        # connections (multiplexed connections of other servers never close)
+        for worker_process in worker_processes:
+            worker_process.terminate()
+        os._exit(0)
+
+    for worker_process in worker_processes:
+        worker_process.start()
+    # after the workers are started, so that they keep the default handler
+    signal.signal(signal.SIGTERM, stop)
+    worker_addresses, worker_ranges = rt.worker_layout(net_address, memory_range, workers)
+    fe.FrontEnd(net_address, worker_addresses, worker_ranges, ADDRESS_ARGUMENT).start()
 
 
 import argparse
@@ -793,8 +3690,19 @@ def main():
         help="The index of the server in the list of servers",
         required=True,
     )
+    parser.add_argument(
+        "-restore",
+        type=str,
+        help="Snapshot file to restore the memory of the server from",
+    )
+    parser.add_argument(
+        "-workers",
+        type=int,
+        default=1,
+        help="The number of worker processes that share the memory range of the server",
+    )
     args = parser.parse_args()
-    start_server_process(int(args.server))
+    start_server_process(int(args.server), args.restore, args.workers)
 
 
 if __name__ == "__main__":
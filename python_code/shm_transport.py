@@ -0,0 +1,295 @@
+import os
+import select
+import socket
+import struct
+import tempfile
+import threading as th
+import uuid
+from multiprocessing import resource_tracker, shared_memory
+
+import comm_utils as cu
+
+SEGMENT_HEADER = struct.Struct("<Q")  # closed flag, set by the end that created the channel
+RING_HEADER = struct.Struct("<QQ")  # head (read position), tail (write position)
+LENGTH = struct.Struct("<I")
+OVERFLOW = 1 << 31  # length flag: the message is in a segment of its own, the record names it
+
+
+class Ring:
+    """
+    Description: single-producer single-consumer ring of messages in shared memory.
+    The head is only written by the consumer and the tail only by the producer,
+    so neither needs a lock. Each message is a length followed by its bytes.
+    """
+
+    def __init__(self, buffer: memoryview, capacity: int):
+        self.buffer = buffer
+        self.capacity = capacity
+        self.data = buffer[RING_HEADER.size : RING_HEADER.size + capacity]
+
+    def put(self, message: bytes, flags: int = 0) -> bool:
+        """
+        Return:
+        - False if there is not enough free space in the ring
+        """
+        head, tail = RING_HEADER.unpack_from(self.buffer, 0)
+        size = LENGTH.size + len(message)
+        if size > self.capacity - (tail - head):
+            return False
+        self._write(tail, LENGTH.pack(len(message) | flags))
+        self._write(tail + LENGTH.size, message)
+        # publishing the new tail makes the message visible to the consumer
+        struct.pack_into("<Q", self.buffer, 8, tail + size)
+        return True
+
+    def get(self) -> None | tuple[int, bytes]:
+        """
+        Return:
+        - the flags and the bytes of the next message, None if the ring is empty
+        """
+        head, tail = RING_HEADER.unpack_from(self.buffer, 0)
+        if head == tail:
+            return None
+        (length,) = LENGTH.unpack(self._read(head, LENGTH.size))
+        message = self._read(head + LENGTH.size, length & ~OVERFLOW)
+        struct.pack_into("<Q", self.buffer, 0, head + LENGTH.size + len(message))
+        return length & OVERFLOW, message
+
+    def _write(self, position: int, data: bytes):
+        start = position % self.capacity
+        first = min(len(data), self.capacity - start)
+        self.data[start : start + first] = data[:first]
+        self.data[: len(data) - first] = data[first:]
+
+    def _read(self, position: int, length: int) -> bytes:
+        start = position % self.capacity
+        first = min(length, self.capacity - start)
+        return bytes(self.data[start : start + first]) + bytes(self.data[: length - first])
+
+
+class Channel:
+    """
+    Description: connection between two processes of the same host. A shared
+    memory segment holds a request ring and a response ring, and each direction
+    has a named pipe as doorbell: the sender writes one byte per message, which
+    wakes up the receiver blocked on the pipe.
+
+    The end that creates the channel (see create) sends requests, the end that
+    attaches to it (see attach) sends responses, so both rings have a single
+    producer and a single consumer as long as each end is used by one thread
+    at a time, like a socket.
+    """
+
+    def __init__(
+        self,
+        segment: shared_memory.SharedMemory,
+        directory: str,
+        ring_size: int,
+        owner: bool,
+    ):
+        self.segment = segment
+        self.directory = directory
+        self.owner = owner
+        size = RING_HEADER.size + ring_size
+        start = SEGMENT_HEADER.size
+        requests = Ring(segment.buf[start : start + size], ring_size)
+        responses = Ring(segment.buf[start + size : start + 2 * size], ring_size)
+        request_pipe = os.path.join(directory, "request")
+        response_pipe = os.path.join(directory, "response")
+        if owner:
+            self.send_ring, self.receive_ring = requests, responses
+            send_pipe, receive_pipe = request_pipe, response_pipe
+        else:
+            self.send_ring, self.receive_ring = responses, requests
+            send_pipe, receive_pipe = response_pipe, request_pipe
+        # opened for reading and writing, so that opening never blocks on the other end
+        self.send_fd = os.open(send_pipe, os.O_RDWR)
+        self.receive_fd = os.open(receive_pipe, os.O_RDWR)
+
+    @classmethod
+    def create(cls, ring_size: int) -> "Channel":
+        directory = tempfile.mkdtemp(prefix="edcs_shm_")
+        os.mkfifo(os.path.join(directory, "request"))
+        os.mkfifo(os.path.join(directory, "response"))
+        segment = shared_memory.SharedMemory(
+            name=f"edcs_{uuid.uuid4().hex[:16]}",
+            create=True,
+            size=SEGMENT_HEADER.size + 2 * (RING_HEADER.size + ring_size),
+        )
+        return cls(segment, directory, ring_size, True)
+
+    @classmethod
+    def attach(cls, name: str, directory: str, ring_size: int) -> "Channel":
+        segment = shared_memory.SharedMemory(name=name)
+        # the segment belongs to the process that created it, which unlinks it
+        resource_tracker.unregister(segment._name, "shared_memory")
+        return cls(segment, directory, ring_size, False)
+
+    def handshake_args(self) -> list:
+        """
+        Return:
+        - the arguments the other end needs to attach to the channel
+        """
+        return [self.segment.name, self.directory, len(self.send_ring.data)]
+
+    @property
+    def closed(self) -> bool:
+        return SEGMENT_HEADER.unpack_from(self.segment.buf, 0)[0] != 0
+
+    def send(self, message: bytes):
+        if not self.send_ring.put(message):
+            # the message does not fit in the ring, pass it in a segment of its own
+            overflow = shared_memory.SharedMemory(
+                name=f"edcs_{uuid.uuid4().hex[:16]}", create=True, size=len(message)
+            )
+            published = False
+            try:
+                overflow.buf[: len(message)] = message
+                record = LENGTH.pack(len(message)) + overflow.name.encode()
+                published = self.send_ring.put(record, OVERFLOW)
+            finally:
+                overflow.close()
+                if not published:
+                    overflow.unlink()
+            if not published:
+                raise BufferError("shared-memory ring is full")
+            # the receiver unlinks it from now on
+            resource_tracker.unregister(overflow._name, "shared_memory")
+        os.write(self.send_fd, b"\0")
+
+    def receive(self, timeout: None | float = None) -> None | bytes:
+        """
+        Return:
+        - the next message, None if none arrived in timeout seconds
+
+        Raises EOFError if the other end closed the channel.
+        """
+        while True:
+            ready, _, _ = select.select([self.receive_fd], [], [], timeout)
+            if not ready:
+                return None
+            os.read(self.receive_fd, 1)
+            record = self.receive_ring.get()
+            if record is not None:
+                break
+            if self.closed:
+                raise EOFError("shared-memory channel closed")
+
+        flags, message = record
+        if flags & OVERFLOW:
+            (length,) = LENGTH.unpack_from(message, 0)
+            overflow = shared_memory.SharedMemory(name=message[LENGTH.size :].decode())
+            message = bytes(overflow.buf[:length])
+            overflow.close()
+            overflow.unlink()
+        return message
+
+    def request(self, message: bytes, timeout: float) -> bytes:
+        self.send(message)
+        response = self.receive(timeout)
+        if response is None:
+            raise TimeoutError("timed out waiting for a shared-memory response")
+        return response
+
+    def close(self):
+        if self.owner:
+            SEGMENT_HEADER.pack_into(self.segment.buf, 0, 1)
+            os.write(self.send_fd, b"\0")  # wake up the other end, it sees the flag
+        os.close(self.send_fd)
+        os.close(self.receive_fd)
+        self.send_ring = self.receive_ring = None
+        self.segment.close()
+        if self.owner:
+            self.segment.unlink()
+            self.remove_pipes()
+
+    def remove_pipes(self):
+        """
+        Description: remove the named pipes once both ends opened them
+        """
+        if os.path.isdir(self.directory):
+            for pipe in ("request", "response"):
+                os.remove(os.path.join(self.directory, pipe))
+            os.rmdir(self.directory)
+
+
+_local_ips = None
+
+
+def is_local_host(ip: str) -> bool:
+    """
+    Return:
+    - True if ip is an address of this host
+    """
+    global _local_ips
+    if _local_ips is None:
+        try:
+            _local_ips = set(socket.gethostbyname_ex(socket.gethostname())[2])
+        except OSError:
+            _local_ips = set()
+    return ip.startswith("127.") or ip == "localhost" or ip in _local_ips
+
+
+class ShmTransport:
+    """
+    Description: channels from a server to the servers that run on the same host.
+
+    Requests to a co-located server go through an idle channel to it, or a new
+    one, opened with a serve_shm_connect handshake over TCP (see Server). Servers
+    on other hosts, or that refuse the handshake, are reached over TCP.
+    """
+
+    def __init__(self, ring_size: int, connect):
+        """
+        connect: function (server address, handshake arguments) -> True if the server attached
+        to the channel, raises if the server could not be reached
+        """
+        self.ring_size = ring_size
+        self.connect = connect
+        self.idle_channels = {}  # server address -> channels not in use
+        self.remote_servers = set()  # servers reached over TCP
+        self.lock = th.Lock()
+
+    def request(self, server_address: tuple[str, int], message: dict, timeout: float):
+        """
+        Return:
+        - the response of the server, None if the server is not reachable through shared memory
+        """
+        channel = self._take_channel(server_address)
+        if channel is None:
+            return None
+        try:
+            response = channel.request(cu.encode_msg(message), timeout)
+        except Exception:
+            channel.close()
+            raise
+        with self.lock:
+            self.idle_channels.setdefault(server_address, []).append(channel)
+        return cu.decode_msg(response)
+
+    def _take_channel(self, server_address: tuple[str, int]) -> None | Channel:
+        with self.lock:
+            if server_address in self.remote_servers:
+                return None
+            channels = self.idle_channels.get(server_address, [])
+            if channels:
+                return channels.pop()
+            if not is_local_host(server_address[0]):
+                self.remote_servers.add(server_address)
+                return None
+
+        channel = Channel.create(self.ring_size)
+        try:
+            connected = self.connect(
+                server_address, channel.handshake_args() + [os.getpid()]
+            )
+        except Exception:
+            channel.close()
+            return None  # try again with the next request
+        if not connected:
+            channel.close()
+            with self.lock:
+                self.remote_servers.add(server_address)
+            return None
+        channel.remove_pipes()
+        return channel
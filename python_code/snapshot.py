@@ -0,0 +1,116 @@
+import json
+import os
+import socket
+import struct
+import zlib
+
+# file: magic, then one record per memory item
+# record: crc32 of the rest of the record, address, wtag, status, number of copy
+# holders, length of the data, copy holders (port, length of the host and the utf-8
+# encoded host, which may be a name or an ipv6 address), json encoded data
+MAGIC = b"EDCSSNP2"
+CRC = struct.Struct("<I")
+ITEM = struct.Struct("<qqcBI")
+HOLDER = struct.Struct("<HB")
+# files of the first version keep the copy holders as ipv4 address and port
+MAGIC_V1 = b"EDCSSNP1"
+HOLDER_V1 = struct.Struct("<4sH")
+
+
+def encode_item(
+    address: int, wtag: int, status: str, data, copy_holders: list[tuple[str, int]]
+) -> bytes:
+    value = json.dumps(data).encode()
+    body = b"".join(
+        [ITEM.pack(address, wtag, status.encode(), len(copy_holders), len(value))]
+        + [encode_holder(host, port) for host, port in copy_holders]
+        + [value]
+    )
+    return CRC.pack(zlib.crc32(body)) + body
+
+
+def encode_holder(host: str, port: int) -> bytes:
+    host = host.encode()
+    return HOLDER.pack(port, len(host)) + host
+
+
+def snapshot_file(directory: str, path: str) -> str:
+    """
+    Description: file of a snapshot requested by a client, path is relative to the
+    snapshot directory
+
+    Return:
+    - the absolute path of the file, ValueError if it is not in the directory
+    """
+    directory = os.path.realpath(directory)
+    snapshot_path = os.path.realpath(os.path.join(directory, path))
+    if snapshot_path == directory or os.path.commonpath([directory, snapshot_path]) != directory:
+        raise ValueError(f"snapshot path {path} is not in the snapshot directory")
+    return snapshot_path
+
+
+def write_snapshot(path: str, items) -> int:
+    """
+    Description: stream memory items to a snapshot file. The file is written next
+    to its final path and only replaces it once it is complete and on disk.
+
+    items: iterable of (address, wtag, status, data, copy holders)
+
+    Return:
+    - the number of items written
+    """
+    count = 0
+    temporary_path = path + ".tmp"
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(temporary_path, "wb") as f:
+        f.write(MAGIC)
+        for item in items:
+            f.write(encode_item(*item))
+            count += 1
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temporary_path, path)
+    return count
+
+
+def read_snapshot(path: str):
+    """
+    Description: read the memory items of a snapshot file in one pass
+
+    Return:
+    - generator of (address, wtag, status, data, copy holders)
+    """
+    with open(path, "rb") as f:
+        content = f.read()
+    if content[: len(MAGIC)] not in (MAGIC, MAGIC_V1):
+        raise ValueError(f"{path} is not a snapshot file")
+    version_1 = content[: len(MAGIC)] == MAGIC_V1
+
+    position = len(MAGIC)
+    header_size = CRC.size + ITEM.size
+    while position < len(content):
+        (crc,) = CRC.unpack_from(content, position)
+        address, wtag, status, holder_count, length = ITEM.unpack_from(
+            content, position + CRC.size
+        )
+        copy_holders = []
+        value_start = position + header_size
+        try:
+            for _ in range(holder_count):
+                if version_1:
+                    ip, port = HOLDER_V1.unpack_from(content, value_start)
+                    copy_holders.append((socket.inet_ntoa(ip), port))
+                    value_start += HOLDER_V1.size
+                    continue
+                port, host_length = HOLDER.unpack_from(content, value_start)
+                value_start += HOLDER.size + host_length
+                copy_holders.append(
+                    (content[value_start - host_length : value_start].decode(), port)
+                )
+        except (struct.error, UnicodeDecodeError):
+            raise ValueError(f"{path} is corrupted at byte {position}")
+        end = value_start + length
+        if end > len(content) or zlib.crc32(content[position + CRC.size : end]) != crc:
+            raise ValueError(f"{path} is corrupted at byte {position}")
+        yield address, wtag, status.decode(), json.loads(content[value_start:end]), copy_holders
+        position = end
@@ -1,5 +1,6 @@
 import client_wrapper as cw
 import global_variables as gv
+import routing_table as rt
 
 import argparse
 import jpype
@@ -8,6 +9,7 @@ import jpype
 CLIENT_LOGIC_TYPE = 'python'
 
 SERVERS = gv.SERVERS
+ROUTING_TABLE = rt.RoutingTable.from_config()
 
 def test_connect():
     clients = []
@@ -32,10 +34,9 @@ def test_disconnect(clients : list[cw.ClientWrapper]):
             print(f"Failed to disconnect from server {client.server_address}: {e}")
 
 def test_write(clients : list[cw.ClientWrapper], local):
-    server_memory_size = gv.MEMORY_SIZE // len(SERVERS)
     for idx, client in enumerate(clients):
         index = idx if local else (idx + 1) % len(SERVERS)
-        mem_address = index * server_memory_size
+        mem_address = ROUTING_TABLE.get_ranges(index)[0][0]
         data = "test"
         try:
             resp = client.write(mem_address, data)
@@ -58,10 +59,9 @@ def test_dump_cache(clients : list[cw.ClientWrapper]):
             print(f"Failed to dump cache from server {client.server_address}: {e}")
 
 def test_read(clients : list[cw.ClientWrapper], local):
-    server_memory_size = gv.MEMORY_SIZE // len(SERVERS)
     for idx, client in enumerate(clients):
         index = idx if local else (idx + 1) % len(SERVERS)
-        mem_address = index * server_memory_size
+        mem_address = ROUTING_TABLE.get_ranges(index)[0][0]
         try:
             resp = client.read(mem_address)
             if resp["status"] != gv.SUCCESS or (not local and resp["istatus"] != "S"):
@@ -72,10 +72,9 @@ def test_read(clients : list[cw.ClientWrapper], local):
             print(f"Failed to read data from server {client.server_address}: {e}")
 
 def test_acquire_and_release_lock(clients : list[cw.ClientWrapper], local):
-    server_memory_size = gv.MEMORY_SIZE // len(SERVERS)
     for idx, client in enumerate(clients):
         index = idx if local else (idx + 1) % len(SERVERS)
-        mem_address = index * server_memory_size
+        mem_address = ROUTING_TABLE.get_ranges(index)[0][0]
         try:
             resp = client.acquire_lock(mem_address)
             if resp["status"] != gv.SUCCESS:
@@ -6,8 +6,10 @@ import argparse
 import threading as th
 
 import global_variables as gv
+import routing_table as rt
 
 SERVERS = gv.SERVERS
+ROUTING_TABLE = rt.RoutingTable.from_config()
 
 # all reads after a write return the same data
 def test_reads_after_write(server_index, offset, thread_cnt, local):
@@ -16,7 +18,7 @@ def test_reads_after_write(server_index, offset, thread_cnt, local):
     """
     client = cw.ClientWrapper(CLIENT_LOGIC_TYPE, SERVERS[server_index])
 
-    memory_address = server_index * (gv.MEMORY_SIZE // len(SERVERS)) + offset
+    memory_address = ROUTING_TABLE.get_ranges(server_index)[0][0] + offset
 
     client.connect()
     client.write(memory_address, 0)
@@ -1,5 +1,6 @@
 import client_wrapper as cw
 import global_variables as gv
+import routing_table as rt
 import time
 import threading as th
 import jpype
@@ -14,7 +15,7 @@ def test_forgotten_locks(server_index):
     """
     Description: test that forgotten locks are released after the lease timeout
     """
-    memory_address = (gv.MEMORY_SIZE // len(gv.SERVERS)) * server_index
+    memory_address = rt.RoutingTable.from_config().get_ranges(server_index)[0][0]
     def acquire_lock_thread():
         client = cw.ClientWrapper(CLIENT_LOGIC_TYPE, gv.SERVERS[server_index])
         client.connect()
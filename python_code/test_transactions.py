@@ -0,0 +1,131 @@
+import client_logic as cl
+import global_variables as gv
+import routing_table as rt
+
+import argparse
+
+SERVERS = gv.SERVERS
+ROUTING_TABLE = rt.RoutingTable.from_config()
+
+# memory addresses used by the tests, offset within the range of each server
+OFFSET = 10
+
+def test_address(server_index, offset=0):
+    return ROUTING_TABLE.get_ranges(server_index)[0][0] + OFFSET + offset
+
+def check(name, condition, resp):
+    if condition:
+        print(f"{name}: ok")
+    else:
+        print(f"{name}: FAILED with response: {resp}")
+
+def test_multi_owner_commit(server_index):
+    """
+    Description: a transaction over the addresses of two servers applies all its writes
+    """
+    addresses = [test_address(server_index), test_address((server_index + 1) % len(SERVERS))]
+    client = cl.Client(SERVERS[server_index])
+    client.connect()
+
+    transaction = client.transaction()
+    for address in addresses:
+        transaction.read(address)
+        transaction.write(address, f"commit {address}")
+    resp = transaction.commit()
+    check("multi-owner commit", resp["status"] == gv.SUCCESS and resp["ret_val"], resp)
+    for address in addresses:
+        resp = client.read(address)
+        check(f"multi-owner commit read {address}", resp.get("data") == f"commit {address}", resp)
+
+    client.disconnect()
+
+def test_conflict(server_index):
+    """
+    Description: a transaction whose read address is written by another client
+    meanwhile is aborted and applies none of its writes
+    """
+    read_address = test_address(server_index, 1)
+    other_address = test_address((server_index + 1) % len(SERVERS), 1)
+    client = cl.Client(SERVERS[server_index])
+    other_client = cl.Client(SERVERS[(server_index + 1) % len(SERVERS)])
+    client.connect()
+    other_client.connect()
+    client.write(other_address, "before")
+
+    transaction = client.transaction()
+    transaction.read(read_address)
+    transaction.write(read_address, "transaction")
+    transaction.write(other_address, "transaction")
+    other_client.write(read_address, "other client")
+    resp = transaction.commit()
+    check(
+        "conflict",
+        resp["status"] == gv.SUCCESS and not resp["ret_val"] and resp["conflicts"] == [read_address],
+        resp,
+    )
+    resp = client.read(read_address)
+    check("conflict read", resp.get("data") == "other client", resp)
+    resp = client.read(other_address)
+    check("conflict other owner read", resp.get("data") == "before", resp)
+
+    client.disconnect()
+    other_client.disconnect()
+
+def test_abort(server_index):
+    """
+    Description: a transaction over an address locked by another client is aborted,
+    the other owner releases its locks, and the transaction commits once run again
+    """
+    locked_address = test_address(server_index, 2)
+    other_address = test_address((server_index + 1) % len(SERVERS), 2)
+    client = cl.Client(SERVERS[server_index])
+    lock_client = cl.Client(SERVERS[server_index])
+    client.connect()
+    lock_client.connect()
+    client.write(other_address, "before")
+
+    lock = lock_client.acquire_lock(locked_address)
+    transaction = client.transaction()
+    transaction.write(locked_address, "transaction")
+    transaction.write(other_address, "transaction")
+    resp = transaction.commit()
+    check(
+        "abort",
+        resp["status"] == gv.SUCCESS and not resp["ret_val"] and resp["conflicts"] == [locked_address],
+        resp,
+    )
+    resp = client.read(other_address)
+    check("abort other owner read", resp.get("data") == "before", resp)
+    lock_client.release_lock(locked_address, lock["ltag"])
+
+    transaction.write(locked_address, "transaction")
+    transaction.write(other_address, "transaction")
+    resp = transaction.commit()
+    check("commit after abort", resp["status"] == gv.SUCCESS and resp["ret_val"], resp)
+    for address in (locked_address, other_address):
+        resp = client.read(address)
+        check(f"commit after abort read {address}", resp.get("data") == "transaction", resp)
+
+    client.disconnect()
+    lock_client.disconnect()
+
+SERVER_INDEX = 0
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-server", type=int, default=0)
+    args = parser.parse_args()
+
+    SERVER_INDEX = args.server
+
+    # transactions are only provided by the Python client logic
+    input("Put all the server up and running and press enter to continue")
+    print("Testing multi-owner commit")
+    test_multi_owner_commit(SERVER_INDEX)
+    print("-" * 50)
+    print("Testing conflict")
+    test_conflict(SERVER_INDEX)
+    print("-" * 50)
+    print("Testing abort")
+    test_abort(SERVER_INDEX)
+    print("-" * 50)
@@ -1,14 +1,77 @@
 import time
 import datetime as dt
+import threading as th
 
+import global_variables as gv
 
-def get_time():
+# low bits of a timestamp that count the events of the same clock tick
+LOGICAL_BITS = 16
+LOGICAL_MASK = (1 << LOGICAL_BITS) - 1
+
+
+class HybridLogicalClock:
     """
-    Description: Get the current time in nanoseconds
+    Description: hybrid logical clock of a node. A timestamp is the wall-clock
+    time in nanoseconds whose low LOGICAL_BITS bits are a counter, so timestamps
+    stay close to physical time but keep growing when the wall clock does not
+    (same tick, clock set back). Timestamps received from other nodes are merged
+    into the clock (see update), so an event that knows of another one, on any
+    node, always has a larger timestamp. Nodes piggyback their clock on every
+    message (see comm_utils.encode_msg).
+
+    Timestamps more than max_offset seconds ahead of the physical clock are not
+    merged, so that one wrong clock cannot move all the later timestamps forward.
+    """
+
+    def __init__(self, max_offset: float):
+        self.last = 0  # last timestamp returned or received
+        self.max_offset = int(max_offset * 1e9)  # nanoseconds
+        self.lock = th.Lock()
+
+    def now(self, after: int = 0) -> int:
+        """
+        Return:
+        - a timestamp larger than after, and than all the timestamps returned or received before
+        """
+        physical = get_physical_time() & ~LOGICAL_MASK
+        with self.lock:
+            self.last = max(self.last + 1, after + 1, physical)
+            return self.last
+
+    def update(self, timestamp: int) -> bool:
+        """
+        Description: merge a timestamp received from another node
+
+        Return:
+        - False if the timestamp is too far ahead of the physical clock and was not merged
+        """
+        if not isinstance(timestamp, int) or timestamp > get_physical_time() + self.max_offset:
+            return False
+        with self.lock:
+            if timestamp > self.last:
+                self.last = timestamp
+        return True
+
+
+# clock shared by the process
+clock = HybridLogicalClock(gv.CLOCK_MAX_OFFSET)
+
+
+def get_time(after: int = 0):
+    """
+    Description: Get a timestamp of the hybrid logical clock of the process
+    (nanoseconds), larger than after. Used for write tags and lock tags, so
+    that the tags of all nodes are comparable and keep growing across restarts.
     """
-    res = time.time_ns()
     # java long is 64 bits, so we truncate the result to 64 bits
-    return res & 0xFFFFFFFFFFFFFFFF
+    return clock.now(after) & 0xFFFFFFFFFFFFFFFF
+
+
+def get_physical_time():
+    """
+    Description: Get the current time in nanoseconds
+    """
+    return time.time_ns()
 
 
 def get_datetime():
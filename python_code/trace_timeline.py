@@ -0,0 +1,115 @@
+import argparse
+import glob
+import json
+import os
+
+
+def load_spans(paths: list[str]) -> dict[str, list[dict]]:
+    """
+    Description: read the spans exported by the servers (see tracing)
+
+    Return:
+    - trace id -> spans of the trace
+    """
+    traces = {}
+    for path in paths:
+        with open(path) as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                span = json.loads(line)
+                traces.setdefault(span["trace_id"], []).append(span)
+    return traces
+
+
+def timeline(spans: list[dict], width: int = 40) -> list[str]:
+    """
+    Description: lay out the spans of a trace as a tree, children below their
+    parent, with their start offset and duration relative to the trace start.
+    Spans of different nodes are placed with the nodes' wall clocks, so small
+    offsets between nodes are clock skew.
+    """
+    start = min(span["start"] for span in spans)
+    end = max(span["start"] + span["duration"] for span in spans)
+    total = max(end - start, 1e-9)
+
+    ids = {span["span_id"] for span in spans}
+    children = {}
+    for span in spans:
+        parent = span["parent_id"] if span["parent_id"] in ids else None
+        children.setdefault(parent, []).append(span)
+    for siblings in children.values():
+        siblings.sort(key=lambda span: span["start"])
+
+    lines = []
+
+    def add(span: dict, depth: int):
+        offset = span["start"] - start
+        first = int(offset / total * width)
+        length = max(1, int(span["duration"] / total * width))
+        bar = " " * first + "#" * min(length, width - first)
+        attributes = " ".join(
+            f"{key}={value}" for key, value in span["attributes"].items()
+        )
+        lines.append(
+            f"{offset * 1000:9.3f}ms {span['duration'] * 1000:9.3f}ms |{bar:<{width}}| "
+            f"{'  ' * depth}{span['name']} @{span['node']} {attributes}"
+        )
+        for child in children.get(span["span_id"], []):
+            add(child, depth + 1)
+
+    for root in children.get(None, []):
+        add(root, 0)
+    return lines
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Assemble the spans recorded by the servers into cross-node timelines"
+    )
+    parser.add_argument(
+        "paths",
+        nargs="+",
+        help="Span files (JSON lines) or directories of span files (TRACE_DIR)",
+    )
+    parser.add_argument("-trace", type=str, help="Only show the trace with this id")
+    parser.add_argument(
+        "-slowest",
+        type=int,
+        default=5,
+        help="Show the traces with the longest duration, this many of them",
+    )
+    args = parser.parse_args()
+
+    paths = []
+    for path in args.paths:
+        if os.path.isdir(path):
+            paths.extend(sorted(glob.glob(os.path.join(path, "*.jsonl"))))
+        else:
+            paths.append(path)
+    traces = load_spans(paths)
+
+    if args.trace is not None:
+        selected = [args.trace] if args.trace in traces else []
+    else:
+
+        def duration(trace_id: str) -> float:
+            spans = traces[trace_id]
+            return max(s["start"] + s["duration"] for s in spans) - min(
+                s["start"] for s in spans
+            )
+
+        selected = sorted(traces, key=duration, reverse=True)[: args.slowest]
+
+    if not selected:
+        print("No matching traces.")
+    for trace_id in selected:
+        print(f"Trace {trace_id}, {len(traces[trace_id])} spans")
+        for line in timeline(traces[trace_id]):
+            print(line)
+        print()
+
+
+if __name__ == "__main__":
+    main()
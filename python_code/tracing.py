@@ -0,0 +1,126 @@
+import json
+import random
+import threading as th
+import time
+
+import global_variables as gv
+import logger as lg
+
+TRACE_SAMPLING = gv.TRACE_SAMPLING
+
+_local = th.local()  # context (trace id, span id) of the span running in the thread
+_exporter = None
+_node = None
+
+
+def configure(trace_path: str, node: tuple[str, int]):
+    """
+    Description: start recording spans to a JSON-lines file, one span per line
+    """
+    global _exporter, _node
+    _exporter = lg.AsyncWriter(open(trace_path, "a"), json.dumps)
+    _node = f"{node[0]}:{node[1]}"
+
+
+def current() -> None | list[str]:
+    """
+    Return:
+    - [trace id, span id] of the running span, to be carried by outgoing messages,
+    [] inside a trace that is not sampled and None outside of traces
+    """
+    return getattr(_local, "context", None)
+
+
+def _attribute(value):
+    if isinstance(value, (int, float, str, bool)) or value is None:
+        return value
+    if isinstance(value, (tuple, list)) and len(value) == 2:
+        return f"{value[0]}:{value[1]}"  # network address
+    return str(value)
+
+
+def _new_id() -> str:
+    return f"{random.getrandbits(64):016x}"
+
+
+class Span:
+    """
+    Description: timed operation of a trace. Entering the span makes it the
+    parent of the spans started by the thread, and of the spans started by the
+    servers it sends messages to (see comm_utils.send_msg).
+    """
+
+    def __init__(self, name: str, parent: list[str], attributes: dict):
+        self.name = name
+        self.trace_id = parent[0] if parent else _new_id()
+        self.parent_id = parent[1] if parent else None
+        self.span_id = _new_id()
+        self.attributes = attributes
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def __enter__(self):
+        self.previous = current()
+        _local.context = [self.trace_id, self.span_id]
+        self.start = time.time()
+        self.start_counter = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        duration = time.perf_counter() - self.start_counter
+        _local.context = self.previous
+        if exc is not None:
+            self.attributes["error"] = str(exc)
+        _exporter.write(
+            {
+                "trace_id": self.trace_id,
+                "span_id": self.span_id,
+                "parent_id": self.parent_id,
+                "name": self.name,
+                "node": _node,
+                "start": self.start,
+                "duration": duration,
+                "attributes": {
+                    key: _attribute(value) for key, value in self.attributes.items()
+                },
+            }
+        )
+        return False
+
+
+class _NoSpan:
+    """
+    Description: span that is not recorded. Inside an unsampled trace the context
+    is an empty list, so that the servers we send messages to do not record it either.
+    """
+
+    def __init__(self, context: None | list):
+        self.context = context
+
+    def set(self, **attributes):
+        pass
+
+    def __enter__(self):
+        self.previous = current()
+        _local.context = self.context
+        return self
+
+    def __exit__(self, *exc):
+        _local.context = self.previous
+        return False
+
+
+def span(name: str, parent: None | list[str] = None, **attributes):
+    """
+    Description: start a span, as a child of parent (the "trace" field of a received
+    message) or of the running span. A trace is only recorded if its first span is
+    sampled (TRACE_SAMPLING), the other spans follow that decision.
+    """
+    if _exporter is None:
+        return _NoSpan(None)
+    if parent is None:
+        parent = current()
+    if parent == [] or (parent is None and random.random() >= TRACE_SAMPLING):
+        return _NoSpan([])
+    return Span(name, parent, attributes)
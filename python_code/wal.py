@@ -0,0 +1,324 @@
+import json
+import os
+import struct
+import threading as th
+import time
+import zlib
+
+import global_variables as gv
+
+WAL_MAX_DELAY = gv.WAL_MAX_DELAY
+WAL_CHECKPOINT_SIZE = gv.WAL_CHECKPOINT_SIZE
+
+# record: crc32 of the rest of the record, address, wtag, length of the data, json encoded data
+CRC = struct.Struct("<I")
+RECORD = struct.Struct("<qqI")
+# address of the records holding several records, as a list of [address, wtag, data]
+BATCH = -1
+# address of the records of transaction decisions, see WriteAheadLog.log_decision
+DECISION = -2
+
+
+def encode_record(address: int, wtag: int, data) -> bytes:
+    value = json.dumps(data).encode()
+    body = RECORD.pack(address, wtag, len(value)) + value
+    return CRC.pack(zlib.crc32(body)) + body
+
+
+def read_records(path: str):
+    """
+    Description: iterate over the records of a file written with encode_record.
+    Stops at the first incomplete or corrupted record, i.e. a write that was
+    interrupted by a crash.
+
+    Return:
+    - generator of (address, wtag, data)
+    """
+    if not os.path.exists(path):
+        return
+    with open(path, "rb") as f:
+        content = f.read()
+
+    position = 0
+    header_size = CRC.size + RECORD.size
+    while position + header_size <= len(content):
+        (crc,) = CRC.unpack_from(content, position)
+        address, wtag, length = RECORD.unpack_from(content, position + CRC.size)
+        end = position + header_size + length
+        if end > len(content) or zlib.crc32(content[position + CRC.size : end]) != crc:
+            return
+        yield address, wtag, json.loads(content[position + header_size : end])
+        position = end
+
+
+def write_file(path: str, content: bytes):
+    """
+    Description: atomically replace a file and make the replacement durable
+    """
+    temporary_path = path + ".tmp"
+    with open(temporary_path, "wb") as f:
+        f.write(content)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temporary_path, path)
+    directory = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+    try:
+        os.fsync(directory)
+    finally:
+        os.close(directory)
+
+
+class WriteAheadLog:
+    """
+    Description: write-ahead log of the writes of a memory manager.
+
+    A write is logged before it is applied and the writer waits until its record
+    is on disk. Records are not flushed one by one: a flusher thread collects the
+    records of concurrent writers for at most WAL_MAX_DELAY seconds and writes
+    them with a single fsync (group commit).
+
+    If the log cannot be written (e.g. the disk is full), the flusher stops and
+    log() raises for the waiting and later writers: their writes are not durable.
+
+    When the log grows past WAL_CHECKPOINT_SIZE bytes, a new log is started and
+    the memory is written to a checkpoint file, after which the old log is
+    deleted. The state of the memory is the checkpoint plus the logs.
+
+    The routing table of the server is kept next to the log (see save_routing), the
+    memory ranges held after a restart are the ones it gives to the server.
+
+    Files: <path>.log, <path>.log.old (log before the last rotation), <path>.checkpoint
+    and <path>.routing
+    """
+
+    def __init__(
+        self,
+        path: str,
+        max_delay: float = WAL_MAX_DELAY,
+        checkpoint_size: int = WAL_CHECKPOINT_SIZE,
+    ):
+        self.log_path = path + ".log"
+        self.old_log_path = path + ".log.old"
+        self.checkpoint_path = path + ".checkpoint"
+        self.routing_path = path + ".routing"
+        self.max_delay = max_delay
+        self.checkpoint_size = checkpoint_size
+
+        self.condition = th.Condition()
+        self.pending = []  # records waiting for the next flush
+        self.appended = 0  # sequence number of the last logged record
+        self.durable = 0  # sequence number of the last record on disk
+        # records are counted per log file (generation) until they are applied to
+        # the memory, a checkpoint must not miss a record whose log it deletes
+        self.generation = 0
+        self.unapplied = {0: 0}
+        self.checkpointing = False
+        self.error = None  # error that stopped the flusher
+        # commits of the transactions coordinated by the server, until all their
+        # owners know them: transaction id -> (commit time, owners)
+        self.decisions = {}
+
+        self.file = None
+        self.snapshot = None
+
+    def records(self):
+        """
+        Description: the records of the last checkpoint followed by the logged writes.
+        The transaction decisions found in them are kept in decisions.
+
+        Return:
+        - generator of (address, wtag, data, logged), logged is False for the records
+        of the checkpoint
+        """
+        for path in (self.checkpoint_path, self.old_log_path, self.log_path):
+            for address, wtag, data in read_records(path):
+                logged = path != self.checkpoint_path
+                if address == DECISION:
+                    transaction_id, owners = data
+                    if owners is None:
+                        self.decisions.pop(transaction_id, None)
+                    else:
+                        self.decisions[transaction_id] = (wtag, owners)
+                elif address == BATCH:
+                    for address, wtag, data in data:
+                        yield address, wtag, data, logged
+                else:
+                    yield address, wtag, data, logged
+
+    def save_routing(self, routing_table: dict):
+        """
+        Description: durably replace the saved routing table (RoutingTable.json())
+        """
+        write_file(self.routing_path, json.dumps(routing_table).encode())
+
+    def load_routing(self) -> None | dict:
+        """
+        Return:
+        - the routing table saved by save_routing, None if it was never saved
+        """
+        if not os.path.exists(self.routing_path):
+            return None
+        with open(self.routing_path, "rb") as f:
+            return json.loads(f.read())
+
+    def start(self, snapshot, checkpoint: bool = True):
+        """
+        Description: checkpoint the recovered memory, start an empty log and the flusher.
+        The records of the previous logs are in the checkpoint from now on.
+
+        snapshot: function returning the (address, wtag, data) of every memory item
+        checkpoint: False if the memory is the one of the last checkpoint, whose
+        records are kept then (the previous logs hold no other write)
+        """
+        self.snapshot = snapshot
+        if checkpoint:
+            self._checkpoint()
+        self.file = open(self.log_path, "wb")
+        th.Thread(target=self._flush_records, daemon=True).start()
+
+    def log(self, address: int, wtag: int, data) -> int:
+        """
+        Description: append a record and wait until it is on disk.
+        applied() must be called once the write is applied to the memory.
+        Raises OSError if the log cannot be written, the write must not be applied then.
+
+        Return:
+        - the generation of the record
+        """
+        return self.log_many([(address, wtag, data)])
+
+    def log_many(self, records) -> int:
+        """
+        Description: append the records of several writes that are applied together
+        (e.g. the writes of a transaction) and wait until they are all on disk.
+        Several records are logged as a single one, so that a crash keeps either
+        all of them or none. applied() must be called once, when all the writes
+        are applied to the memory.
+
+        records: list of (address, wtag, data)
+
+        Return:
+        - the generation of the records
+        """
+        if len(records) == 1:
+            record = encode_record(*records[0])
+        else:
+            record = encode_record(BATCH, 0, [list(record) for record in records])
+        with self.condition:
+            if self.error is None:
+                self.pending.append(record)
+                self.appended += 1
+                sequence = self.appended
+                generation = self.generation
+                self.unapplied[generation] += 1
+                self.condition.notify_all()
+                while self.durable < sequence and self.error is None:
+                    self.condition.wait()
+                if self.durable >= sequence:
+                    return generation
+                self.unapplied[generation] -= 1
+            raise OSError(f"write-ahead log failed: {self.error}")
+
+    def log_decision(self, transaction_id: str, commit_time: int, owners: list):
+        """
+        Description: log the commit of a transaction coordinated by the server and
+        wait until it is on disk, so that it is known after a restart until
+        forget_decision is called. Raises OSError if the log cannot be written.
+
+        owners: the servers that must know the decision, as [ip, port]
+        """
+        generation = self.log(DECISION, commit_time, [transaction_id, owners])
+        with self.condition:
+            self.decisions[transaction_id] = (commit_time, owners)
+        self.applied(generation)
+
+    def forget_decision(self, transaction_id: str):
+        """
+        Description: all the owners of the transaction know its decision. The
+        record is not waited for, a decision that comes back after a crash is
+        only sent to the owners again.
+        """
+        record = encode_record(DECISION, 0, [transaction_id, None])
+        with self.condition:
+            if self.decisions.pop(transaction_id, None) is None or self.error is not None:
+                return
+            self.pending.append(record)
+            self.appended += 1
+            self.condition.notify_all()
+
+    def applied(self, generation: int):
+        with self.condition:
+            self.unapplied[generation] -= 1
+            self.condition.notify_all()
+
+    def _flush_records(self):
+        try:
+            self._flush_loop()
+        except Exception as e:
+            with self.condition:
+                self.error = e
+                self.condition.notify_all()
+
+    def _flush_loop(self):
+        size = 0
+        while True:
+            with self.condition:
+                while not self.pending:
+                    self.condition.wait()
+            # let the concurrent writers join the batch
+            time.sleep(self.max_delay)
+
+            with self.condition:
+                batch, self.pending = self.pending, []
+                sequence = self.appended
+                size += sum(len(record) for record in batch)
+                rotate = size >= self.checkpoint_size and not self.checkpointing
+                if rotate:
+                    # records logged from now on go to the new log
+                    old_generation = self.generation
+                    self.generation += 1
+                    self.unapplied[self.generation] = 0
+                    self.checkpointing = True
+
+            self.file.write(b"".join(batch))
+            self.file.flush()
+            os.fsync(self.file.fileno())
+
+            with self.condition:
+                self.durable = sequence
+                self.condition.notify_all()
+
+            if rotate:
+                self.file.close()
+                os.replace(self.log_path, self.old_log_path)
+                self.file = open(self.log_path, "wb")
+                size = 0
+                th.Thread(
+                    target=self._rotate_checkpoint, args=(old_generation,), daemon=True
+                ).start()
+
+    def _rotate_checkpoint(self, old_generation: int):
+        with self.condition:
+            while self.unapplied[old_generation] > 0:
+                self.condition.wait()
+            del self.unapplied[old_generation]
+        self._checkpoint()
+        with self.condition:
+            self.checkpointing = False
+
+    def _checkpoint(self):
+        with self.condition:
+            decisions = list(self.decisions.items())
+        write_file(
+            self.checkpoint_path,
+            b"".join(
+                encode_record(address, wtag, data)
+                for address, wtag, data in self.snapshot()
+            )
+            + b"".join(
+                encode_record(DECISION, commit_time, [transaction_id, owners])
+                for transaction_id, (commit_time, owners) in decisions
+            ),
+        )
+        if os.path.exists(self.old_log_path):
+            os.remove(self.old_log_path)